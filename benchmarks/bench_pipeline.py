@@ -0,0 +1,337 @@
+"""
+离线端到端基准测试: 用本地假 DashScope / OSS 服务与桩下载器驱动 Pipeline.run 或 /process + /status API，
+统计各阶段 p50 / p95 耗时与吞吐量 (jobs/min)，不产生任何真实 API 费用。
+
+用法 (在项目根目录):
+    python -m benchmarks.bench_pipeline --mode pipeline --jobs 16 --concurrency 4 --durations 60,300
+    python -m benchmarks.bench_pipeline --mode api --jobs 16 --concurrency 8 --failure-rate 0.05
+    python -m benchmarks.bench_pipeline --jobs 16 --concurrency 16 --quota-rps 2   # 模拟 DashScope 限流
+    python -m benchmarks.bench_pipeline --jobs 32 --concurrency 32 --workers 4 --worker-concurrency 2   # 多 worker 进程
+    python -m benchmarks.bench_pipeline --jobs 16 --concurrency 16 --workers 2 --kill-worker-after 3  # worker 崩溃后重新投递
+"""
+import os
+import sys
+import json
+import math
+import time
+import signal
+import socket
+import argparse
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fakes import FakeDashScope, FakeOSS
+from benchmarks.fixtures import make_audio, StubDownloader, FIXTURE_BITRATE
+
+
+def percentile(values: list, pct: float) -> float:
+    """最近秩百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = math.ceil(pct / 100.0 * len(ordered))
+    return ordered[max(0, min(len(ordered), rank) - 1)]
+
+
+def configure_environment(args, dashscope: FakeDashScope, oss: FakeOSS, workdir: str):
+    """在导入 utils.config 之前把所有外部端点指向本地假服务 (环境变量优先于 .env)"""
+    os.environ.update({
+        "DASHSCOPE_API_KEY": "bench",
+        "DASHSCOPE_BASE_URL": dashscope.base_url,
+        "OSS_ACCESS_KEY_ID": "bench",
+        "OSS_ACCESS_KEY_SECRET": "bench",
+        "OSS_ENDPOINT": oss.base_url,
+        "OSS_BUCKET_NAME": "bench",
+        "CACHE_ENABLED": "1" if args.cache else "0",
+        "CACHE_DIR": os.path.join(workdir, "cache"),
+        "DOWNLOAD_DIR": os.path.join(workdir, "downloads"),
+        "OUTPUT_DIR": os.path.join(workdir, "output"),
+        "TASK_STORE_BACKEND": "memory",
+        "TASK_DB_PATH": os.path.join(workdir, "tasks.db"),
+        "LLM_COMPACT_ENABLED": "0" if args.no_compact else "1",
+        "DASHSCOPE_GOVERNOR_ENABLED": "0" if args.no_governor else "1",
+    })
+    if args.poll_interval is not None:
+        os.environ["ASR_POLL_MIN_INTERVAL"] = str(args.poll_interval)
+    if args.workers:
+        # API 进程只入队，任务由 worker 子进程通过共享的 SQLite 队列租用执行
+        os.environ.update({
+            "JOB_QUEUE_BACKEND": "sqlite",
+            "JOB_QUEUE_DB_PATH": os.path.join(workdir, "queue.db"),
+            "JOB_QUEUE_POLL_INTERVAL": "0.1",
+            "JOB_LEASE_SECONDS": str(args.lease_seconds),
+        })
+
+
+def run_pipeline_mode(args, sources: dict, durations: dict) -> list:
+    """直接并发调用 Pipeline.run (不经过调度器)"""
+    from core.pipeline import Pipeline
+
+    pipeline = Pipeline()
+    pipeline.downloader = StubDownloader(sources, args.download_bandwidth, durations)
+
+    def run_one(source):
+        started = time.time()
+        try:
+            result = pipeline.run(source, preset_name=args.preset)
+            return {"ok": True, "seconds": time.time() - started, "timings": result.get("timings")}
+        except Exception as e:
+            return {"ok": False, "seconds": time.time() - started, "error": str(e)}
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        return list(executor.map(run_one, sources))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_api_mode(args, sources: dict, durations: dict) -> list:
+    """启动 Web 服务，通过 /process 提交、轮询 /status 等待，经过完整的调度器与任务存储"""
+    import httpx
+    import uvicorn
+    import main
+
+    main.pipeline.downloader = StubDownloader(sources, args.download_bandwidth, durations)
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    client = httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=30)
+
+    def run_one(source):
+        started = time.time()
+        resp = client.post("/process", json={"source": source, "preset_name": args.preset, "priority": args.priority})
+        resp.raise_for_status()
+        task_id = resp.json()["task_id"]
+        while True:
+            task = client.get(f"/status/{task_id}").json()
+            if task["status"] in ("succeeded", "failed"):
+                break
+            time.sleep(args.status_interval)
+        record = {"ok": task["status"] == "succeeded", "seconds": time.time() - started}
+        if record["ok"]:
+            record["timings"] = (task.get("result") or {}).get("timings")
+        else:
+            record["error"] = task.get("error")
+        return record
+
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            return list(executor.map(run_one, sources))
+    finally:
+        client.close()
+        server.should_exit = True
+
+
+def start_workers(args, sources: dict, durations: dict, workdir: str) -> list:
+    """启动 args.workers 个 worker 子进程 (等同 python main.py --worker，下载器换成桩下载器)，输出写入 workers.log"""
+    spec_path = os.path.join(workdir, "workers.json")
+    with open(spec_path, "w", encoding="utf-8") as f:
+        json.dump({"sources": sources, "durations": durations, "bandwidth": args.download_bandwidth}, f)
+    log = open(os.path.join(workdir, "workers.log"), "ab")
+    command = [
+        sys.executable, "-m", "benchmarks.bench_pipeline",
+        "--worker-process", spec_path, "--worker-concurrency", str(args.worker_concurrency),
+    ]
+    return [subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT) for _ in range(args.workers)]
+
+
+def stop_workers(workers: list):
+    for process in workers:
+        if process.poll() is None:
+            process.send_signal(signal.SIGTERM)
+    for process in workers:
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def run_worker_process(spec_path: str, concurrency: int):
+    """worker 子进程入口"""
+    import main
+
+    with open(spec_path, "r", encoding="utf-8") as f:
+        spec = json.load(f)
+    main.pipeline.downloader = StubDownloader(spec["sources"], spec["bandwidth"], spec["durations"])
+    main.run_worker(concurrency)
+    return 0
+
+
+def build_report(records: list, elapsed: float) -> dict:
+    stage_seconds = {}
+    prompt_tokens = {"tokens_before": 0, "tokens_after": 0}
+    for record in records:
+        for span in (record.get("timings") or {}).get("spans", []):
+            stage_seconds.setdefault(span["stage"], []).append(span["seconds"])
+            if span["stage"] == "compact":
+                for key in prompt_tokens:
+                    prompt_tokens[key] += span.get(key, 0)
+    succeeded = [r["seconds"] for r in records if r["ok"]]
+    return {
+        "jobs": len(records),
+        "succeeded": len(succeeded),
+        "failed": len(records) - len(succeeded),
+        "elapsed_seconds": round(elapsed, 3),
+        "jobs_per_minute": round(len(succeeded) / elapsed * 60, 2) if elapsed else 0.0,
+        "latency": {"p50": round(percentile(succeeded, 50), 3), "p95": round(percentile(succeeded, 95), 3)},
+        "stages": {
+            stage: {
+                "count": len(values),
+                "p50": round(percentile(values, 50), 3),
+                "p95": round(percentile(values, 95), 3),
+                "total": round(sum(values), 3),
+            }
+            for stage, values in stage_seconds.items()
+        },
+        "compaction": prompt_tokens,
+        "errors": sorted({str(r.get("error")) for r in records if not r["ok"]}),
+    }
+
+
+def print_report(report: dict, args, dashscope: FakeDashScope, oss: FakeOSS):
+    print("\n===== 基准测试报告 =====")
+    print(f"模式: {args.mode} | 任务: {report['jobs']} | 并发: {args.concurrency} | 音频时长: {args.durations}s")
+    if args.workers:
+        print(f"worker 进程: {args.workers} x 并发 {args.worker_concurrency} | 中途杀掉: {report.get('killed_worker') or '无'}")
+    print(
+        f"成功 {report['succeeded']} / 失败 {report['failed']} | 总耗时 {report['elapsed_seconds']:.1f}s | "
+        f"吞吐量 {report['jobs_per_minute']:.2f} jobs/min"
+    )
+    print(f"端到端耗时: p50 {report['latency']['p50']:.2f}s | p95 {report['latency']['p95']:.2f}s")
+    print(f"{'stage':<18}{'count':>7}{'p50 (s)':>10}{'p95 (s)':>10}{'total (s)':>11}")
+    for stage, stat in report["stages"].items():
+        print(f"{stage:<18}{stat['count']:>7}{stat['p50']:>10.3f}{stat['p95']:>10.3f}{stat['total']:>11.1f}")
+    compaction = report["compaction"]
+    if compaction["tokens_before"]:
+        print(
+            f"摘要输入 token (估算): {compaction['tokens_before']} -> {compaction['tokens_after']} "
+            f"({compaction['tokens_after'] / compaction['tokens_before']:.0%})"
+        )
+    print(f"DashScope 请求: {json.dumps(dashscope.counters, sort_keys=True)}")
+    governor = report.get("governor")
+    if governor and governor["enabled"]:
+        for endpoint, stats in governor["endpoints"].items():
+            print(
+                f"流控 {endpoint:<11} 请求 {stats['requests']:>5} | 被限流 {stats['throttled']:>4} | "
+                f"并发上限 {stats['limit']:.1f}/{stats['max_concurrency']} | 排队等待 {stats['waited_seconds']:.1f}s"
+            )
+    print(f"OSS 请求: {json.dumps(oss.counters, sort_keys=True)}")
+    for error in report["errors"]:
+        print(f"错误: {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BiliAssistant 离线端到端基准测试")
+    parser.add_argument("--mode", choices=("pipeline", "api"), default="pipeline", help="直接调用 Pipeline.run 或经过 HTTP API")
+    parser.add_argument("--jobs", type=int, default=8, help="任务总数")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时在途的任务数")
+    parser.add_argument("--durations", default="60,300", help="合成音频时长 (秒)，逗号分隔，按任务轮流使用")
+    parser.add_argument("--preset", default="bilibili_summary")
+    parser.add_argument("--priority", choices=("interactive", "bulk"), default="bulk", help="API 模式下的任务优先级")
+    parser.add_argument("--latency", type=float, default=0.02, help="假服务每个请求的网络延迟 (秒)")
+    parser.add_argument("--jitter", type=float, default=0.01, help="网络延迟抖动 (秒)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="DashScope 请求返回 503 的概率 (POST 请求不重试，直接计入失败)")
+    parser.add_argument("--oss-failure-rate", type=float, default=0.0, help="OSS 请求返回 503 的概率")
+    parser.add_argument("--asr-base", type=float, default=2.0, help="ASR 任务固定耗时 (秒)")
+    parser.add_argument("--asr-rtf", type=float, default=0.02, help="ASR 耗时与音频时长之比")
+    parser.add_argument("--chat-tps", type=float, default=400.0, help="摘要生成速度 (tokens/秒)")
+    parser.add_argument("--chat-prefill-tps", type=float, default=5000.0, help="摘要提示词处理速度 (tokens/秒)")
+    parser.add_argument("--upload-bandwidth", type=float, default=None, help="OSS 上行带宽 (字节/秒)，默认不限")
+    parser.add_argument("--download-bandwidth", type=float, default=None, help="桩下载器带宽 (字节/秒)，默认不限")
+    parser.add_argument("--poll-interval", type=float, default=None, help="覆盖 ASR_POLL_MIN_INTERVAL")
+    parser.add_argument("--status-interval", type=float, default=0.2, help="API 模式下轮询 /status 的间隔 (秒)")
+    parser.add_argument("--cache", action="store_true", help="启用结果缓存 (默认关闭以测量完整流程)")
+    parser.add_argument("--no-compact", action="store_true", help="关闭摘要前的转录压缩 (对比压缩前后的提示词大小与耗时)")
+    parser.add_argument("--quota-rps", type=float, default=None,
+                        help="假 DashScope 每个接口每秒允许的请求数，超出返回 429 (默认不限流)")
+    parser.add_argument("--no-governor", action="store_true", help="关闭 DashScope 客户端流控 (对比限流下的成功率与吞吐量)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="启动的 worker 进程数 (大于 0 时为 API 模式 + SQLite 任务队列，API 进程只入队)")
+    parser.add_argument("--worker-concurrency", type=int, default=2, help="每个 worker 进程同时执行的任务数")
+    parser.add_argument("--lease-seconds", type=float, default=6.0, help="worker 模式下的任务租约时长 (秒)")
+    parser.add_argument("--kill-worker-after", type=float, default=None,
+                        help="开始后若干秒用 SIGKILL 杀掉第一个 worker，验证租约过期后任务被重新投递")
+    parser.add_argument("--worker-process", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=None, help="工作目录 (默认使用临时目录)")
+    parser.add_argument("--json", dest="json_path", default=None, help="把报告另存为 JSON 文件")
+    args = parser.parse_args(argv)
+    if args.worker_process:
+        # 由 start_workers 启动的子进程，环境变量继承自基准测试进程
+        return run_worker_process(args.worker_process, args.worker_concurrency)
+    if args.workers:
+        args.mode = "api"
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bili_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    fixture_dir = os.path.join(tempfile.gettempdir(), "bili_bench_fixtures")
+    durations = [int(d) for d in args.durations.split(",") if d.strip()]
+
+    dashscope = FakeDashScope(
+        asr_base_seconds=args.asr_base, asr_realtime_factor=args.asr_rtf, chat_tokens_per_second=args.chat_tps,
+        chat_prefill_tokens_per_second=args.chat_prefill_tps,
+        quota_rps={name: args.quota_rps for name in ("asr_submit", "asr_poll", "chat")} if args.quota_rps else None,
+        latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate, seed=args.seed,
+    ).start()
+    oss = FakeOSS(
+        bandwidth=args.upload_bandwidth,
+        latency=args.latency, jitter=args.jitter, failure_rate=args.oss_failure_rate, seed=args.seed + 1,
+    ).start()
+    configure_environment(args, dashscope, oss, workdir)
+
+    from utils.config import settings
+    # 让假 ASR 按实际上传的编码码率估算音频时长: 原生音频直接上传合成的 MP3，否则按 ASR 编码档位
+    if settings.ASR_STREAM_TRANSCODE and not settings.DOWNLOAD_NATIVE_AUDIO:
+        dashscope.audio_bitrate = int(settings.ASR_AUDIO_BITRATE.lower().rstrip("k")) * 1000
+    else:
+        dashscope.audio_bitrate = FIXTURE_BITRATE
+
+    fixtures = {seconds: make_audio(seconds, fixture_dir) for seconds in durations}
+    fixture_durations = {path: seconds for seconds, path in fixtures.items()}
+    # 每个任务使用不同的 BV 号，避免被调度器合并或命中缓存
+    sources = {f"BV1bnc{i:06d}": fixtures[durations[i % len(durations)]] for i in range(args.jobs)}
+
+    workers = start_workers(args, sources, fixture_durations, workdir) if args.workers else []
+    killed = []
+    if workers and args.kill_worker_after is not None:
+        def kill_first():
+            if workers[0].poll() is None:
+                workers[0].kill()
+                killed.append(workers[0].pid)
+        threading.Timer(args.kill_worker_after, kill_first).start()
+
+    started = time.time()
+    try:
+        if args.mode == "api":
+            records = run_api_mode(args, sources, fixture_durations)
+        else:
+            records = run_pipeline_mode(args, sources, fixture_durations)
+    finally:
+        stop_workers(workers)
+        dashscope.stop()
+        oss.stop()
+    report = build_report(records, time.time() - started)
+    if killed:
+        report["killed_worker"] = killed[0]
+    report["config"] = vars(args)
+    from core.governor import get_governor
+    # worker 模式下 DashScope 请求由各 worker 进程发出，本进程的流控统计为空
+    report["governor"] = None if args.workers else get_governor().stats()
+
+    print_report(report, args, dashscope, oss)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0 if report["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""
+启动耗时基准测试: 每项测量都在全新的 Python 子进程中进行，取多次运行的中位数。
+
+- help: `python main.py --help` 的总耗时
+- import_main: `import main` 耗时 (Web 服务 / worker 冷启动的主要部分)
+- pipeline_init: 构造 Pipeline() 的耗时
+- first_presets: 冷启动后第一次 GET /presets 的耗时 (不含 import)
+- presets_call: 热路径上单次 get_presets() 的平均耗时
+
+用法 (在项目根目录):
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --bare-env   # 不提供任何密钥，检查无 .env 时能否启动
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import tempfile
+import subprocess
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBES = {
+    "import_main": (
+        "import time; t = time.perf_counter(); import main; "
+        "print(time.perf_counter() - t)"
+    ),
+    "pipeline_init": (
+        "import time; from core.pipeline import Pipeline; t = time.perf_counter(); Pipeline(); "
+        "print(time.perf_counter() - t)"
+    ),
+    "first_presets": (
+        "import time; import main; t = time.perf_counter(); main.get_presets(); "
+        "print(time.perf_counter() - t)"
+    ),
+    "presets_call": (
+        "import time; import main; main.get_presets(); t = time.perf_counter()\n"
+        "for _ in range(1000): main.get_presets()\n"
+        "print((time.perf_counter() - t) / 1000)"
+    ),
+}
+
+PLACEHOLDER_ENV = {
+    "DASHSCOPE_API_KEY": "bench",
+    "OSS_ACCESS_KEY_ID": "bench",
+    "OSS_ACCESS_KEY_SECRET": "bench",
+    "OSS_ENDPOINT": "http://127.0.0.1:9",
+    "OSS_BUCKET_NAME": "bench",
+}
+
+
+def build_env(bare: bool, workdir: str) -> dict:
+    env = dict(os.environ)
+    for name in PLACEHOLDER_ENV:
+        env.pop(name, None)
+    if not bare:
+        env.update(PLACEHOLDER_ENV)
+    env.update({
+        "PYTHONPATH": ROOT,
+        "TASK_DB_PATH": os.path.join(workdir, "tasks.db"),
+        "DOWNLOAD_DIR": os.path.join(workdir, "downloads"),
+        "OUTPUT_DIR": os.path.join(workdir, "output"),
+        "CACHE_DIR": os.path.join(workdir, "cache"),
+    })
+    return env
+
+
+def measure(name: str, env: dict, cwd: str) -> float:
+    if name == "help":
+        started = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(ROOT, "main.py"), "--help"], env=env, cwd=cwd,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        return time.perf_counter() - started
+    proc = subprocess.run([sys.executable, "-c", PROBES[name]], env=env, cwd=cwd,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.decode("utf-8", errors="replace").strip().splitlines()[-1])
+    return float(proc.stdout.decode().strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BiliAssistant 启动耗时基准测试")
+    parser.add_argument("--runs", type=int, default=5, help="每项测量的运行次数")
+    parser.add_argument("--bare-env", action="store_true", help="不注入占位密钥 (模拟没有 .env)")
+    parser.add_argument("--json", dest="json_path", default=None, help="把报告另存为 JSON 文件")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="bili_startup_")
+    env = build_env(args.bare_env, workdir)
+
+    report = {}
+    print(f"{'probe':<16}{'median (ms)':>14}{'min (ms)':>12}")
+    for name in ["help", *PROBES]:
+        try:
+            samples = [measure(name, env, workdir) for _ in range(args.runs)]
+        except Exception as e:
+            report[name] = {"error": str(e)}
+            print(f"{name:<16}  failed: {e}")
+            continue
+        report[name] = {"median_ms": round(statistics.median(samples) * 1000, 3),
+                        "min_ms": round(min(samples) * 1000, 3)}
+        print(f"{name:<16}{report[name]['median_ms']:>14.3f}{report[name]['min_ms']:>12.3f}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if any("error" in r for r in report.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
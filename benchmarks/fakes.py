@@ -0,0 +1,378 @@
+import json
+import time
+import uuid
+import random
+import hashlib
+import threading
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def read_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            parts = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return b"".join(parts)
+                parts.append(self.rfile.read(size))
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def reply(self, code: int = 200, body: bytes = b"", headers: dict = None):
+        self.send_response(code)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def reply_json(self, obj, code: int = 200, headers: dict = None):
+        headers = dict(headers or {}, **{"Content-Type": "application/json"})
+        self.reply(code, json.dumps(obj, ensure_ascii=False).encode("utf-8"), headers)
+
+
+class FakeServer:
+    """
+    本地假服务基类: 每个请求先等待 latency (± jitter) 秒，再以 failure_rate 的概率返回 503。
+    """
+
+    handler_class = _Handler
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counters = {}
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self) -> "FakeServer":
+        fake = self
+
+        class Handler(self.handler_class):
+            server_fake = fake
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def count(self, name: str):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def delay_and_fail(self, name: str) -> bool:
+        """模拟网络延迟，返回 True 表示本次请求应当失败"""
+        with self._lock:
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+            failed = self._rng.random() < self.failure_rate
+        if delay:
+            time.sleep(delay)
+        self.count(name)
+        if failed:
+            self.count(f"{name}_failed")
+        return failed
+
+
+class _DashScopeHandler(_Handler):
+    server_fake = None
+
+    def throttled(self, name: str) -> bool:
+        """超出假服务的限流配额时返回 429 + Retry-After"""
+        retry_after = self.server_fake.over_quota(name)
+        if retry_after is None:
+            return False
+        self.reply_json(
+            {"code": "Throttling.RateQuota", "message": "Requests rate limit exceeded"}, 429,
+            {"Retry-After": f"{retry_after:.2f}"},
+        )
+        return True
+
+    def do_POST(self):
+        fake = self.server_fake
+        body = json.loads(self.read_body() or b"{}")
+        if self.path.startswith("/api/v1/services/audio/asr/transcription"):
+            if self.throttled("asr_submit"):
+                return
+            if fake.delay_and_fail("asr_submit"):
+                return self.reply_json({"code": "ServiceUnavailable"}, 503)
+            return self.reply_json({"output": fake.create_task(body["input"]["file_url"]), "request_id": "bench"})
+        if self.path.startswith("/compatible-mode/v1/chat/completions"):
+            if self.throttled("chat"):
+                return
+            if fake.delay_and_fail("chat"):
+                return self.reply_json({"error": {"code": "ServiceUnavailable"}}, 503)
+            return self._chat(body)
+        self.reply_json({"code": "NotFound"}, 404)
+
+    def do_GET(self):
+        fake = self.server_fake
+        path = urlparse(self.path).path
+        if path.startswith("/api/v1/tasks/"):
+            if self.throttled("asr_poll"):
+                return
+            if fake.delay_and_fail("asr_poll"):
+                return self.reply_json({"code": "ServiceUnavailable"}, 503)
+            output = fake.task_output(path.rsplit("/", 1)[-1], self._base_url())
+            if output is None:
+                return self.reply_json({"code": "InvalidParameter", "message": "task not found"}, 404)
+            return self.reply_json({"output": output})
+        if path.startswith("/transcripts/"):
+            fake.count("transcript_fetch")
+            sentences = fake.transcript(path.rsplit("/", 1)[-1].split(".")[0])
+            return self.reply_json({"transcripts": [{"channel_id": 0, "sentences": sentences}]})
+        self.reply_json({"code": "NotFound"}, 404)
+
+    def _base_url(self) -> str:
+        return f"http://{self.headers.get('Host')}"
+
+    def _chat(self, body: dict):
+        fake = self.server_fake
+        prompt = "".join(m.get("content", "") for m in body.get("messages", []))
+        prompt_tokens = max(1, len(prompt) // 2)
+        completion_tokens = min(fake.chat_max_tokens, max(16, prompt_tokens // 10))
+        text = ("这是基准测试生成的摘要内容。" * (completion_tokens // 12 + 1))[:completion_tokens * 2]
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        generate_seconds = completion_tokens / fake.chat_tokens_per_second
+        # 处理提示词 (prefill) 的耗时随提示词长度增长，在首个 token 之前
+        time.sleep(prompt_tokens / fake.chat_prefill_tokens_per_second)
+
+        if not body.get("stream"):
+            time.sleep(generate_seconds)
+            return self.reply_json({
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        pieces = [text[i:i + 40] for i in range(0, len(text), 40)]
+        events = [{"choices": [{"index": 0, "delta": {"content": piece}}]} for piece in pieces]
+        if (body.get("stream_options") or {}).get("include_usage"):
+            events.append({"choices": [], "usage": usage})
+        for event in events:
+            time.sleep(generate_seconds / max(1, len(pieces)))
+            self._write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+class FakeDashScope(FakeServer):
+    """
+    模拟 DashScope 的录音文件识别 (提交 / 轮询 / transcription_url) 与 OpenAI 兼容的 chat/completions。
+    ASR 任务耗时 = asr_base_seconds + asr_realtime_factor * 音频时长，音频时长由下载到的文件大小与
+    audio_bitrate 估算；摘要耗时 = 提示词 token 数 / chat_prefill_tokens_per_second + 输出 token 数 / chat_tokens_per_second。
+    合成转录中夹杂口头禅与重复句，接近真实 ASR 输出。
+    quota_rps 为各接口 (asr_submit / asr_poll / chat) 每秒允许的请求数，超出时返回 429 与 Retry-After。
+    """
+
+    handler_class = _DashScopeHandler
+
+    def __init__(self, asr_base_seconds: float = 2.0, asr_realtime_factor: float = 0.02,
+                 audio_bitrate: int = 24000, chat_tokens_per_second: float = 400.0, chat_max_tokens: int = 800,
+                 chat_prefill_tokens_per_second: float = 5000.0, sentence_seconds: float = 4.0,
+                 quota_rps: dict = None, **kwargs):
+        super().__init__(**kwargs)
+        self.asr_base_seconds = asr_base_seconds
+        self.asr_realtime_factor = asr_realtime_factor
+        self.audio_bitrate = audio_bitrate
+        self.chat_tokens_per_second = chat_tokens_per_second
+        self.chat_max_tokens = chat_max_tokens
+        self.chat_prefill_tokens_per_second = chat_prefill_tokens_per_second
+        self.sentence_seconds = sentence_seconds
+        self.quota_rps = quota_rps or {}
+        # 接口 -> [剩余令牌, 上次补充时刻]
+        self._quota = {}
+        self.tasks = {}
+
+    def over_quota(self, name: str):
+        """按令牌桶 (容量为 1 秒的配额) 判断是否限流，限流时返回建议的等待秒数，否则返回 None"""
+        rate = self.quota_rps.get(name)
+        if not rate:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._quota.get(name, (rate, now))
+            tokens = min(rate, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self._quota[name] = (tokens - 1, now)
+                return None
+            self._quota[name] = (tokens, now)
+        self.count(f"{name}_throttled")
+        return (1 - tokens) / rate
+
+    def create_task(self, file_url: str) -> dict:
+        # 与真实服务一样先下载音频文件
+        with urllib.request.urlopen(file_url) as resp:
+            size = len(resp.read())
+        audio_seconds = size * 8 / self.audio_bitrate
+        task_id = uuid.uuid4().hex
+        with self._lock:
+            self.tasks[task_id] = {
+                "ready_at": time.time() + self.asr_base_seconds + self.asr_realtime_factor * audio_seconds,
+                "audio_seconds": audio_seconds,
+            }
+        return {"task_id": task_id, "task_status": "PENDING"}
+
+    def task_output(self, task_id: str, base_url: str):
+        with self._lock:
+            task = self.tasks.get(task_id)
+        if task is None:
+            return None
+        if time.time() < task["ready_at"]:
+            return {"task_id": task_id, "task_status": "RUNNING"}
+        return {
+            "task_id": task_id,
+            "task_status": "SUCCEEDED",
+            "result": {"transcription_url": f"{base_url}/transcripts/{task_id}.json"},
+        }
+
+    def transcript(self, task_id: str) -> list:
+        with self._lock:
+            task = self.tasks.get(task_id) or {"audio_seconds": 0}
+        step_ms = int(self.sentence_seconds * 1000)
+        total_ms = int(task["audio_seconds"] * 1000)
+        sentences = []
+        for index, begin in enumerate(range(0, total_ms, step_ms)):
+            if index % 7 == 6:
+                # 每 7 句重复一次上一句
+                text = sentences[-1]["text"]
+            else:
+                filler = "嗯，" if index % 5 == 0 else ""
+                text = f"{filler}第{index + 1}句，这是一段用于基准测试的合成转录文本，模拟真实语音识别的输出。"
+            sentences.append({"begin_time": begin, "end_time": min(begin + step_ms - 200, total_ms), "text": text})
+        return sentences
+
+
+class _OSSHandler(_Handler):
+    server_fake = None
+
+    def _target(self):
+        url = urlparse(self.path)
+        return url.path, parse_qs(url.query, keep_blank_values=True)
+
+    def reply(self, code=200, body=b"", headers=None):
+        headers = dict(headers or {}, **{"x-oss-request-id": uuid.uuid4().hex})
+        super().reply(code, body, headers)
+
+    def _fail(self, name: str) -> bool:
+        if self.server_fake.delay_and_fail(name):
+            self.reply(503, b"<Error><Code>ServiceUnavailable</Code><Message>bench</Message></Error>",
+                       {"Content-Type": "application/xml"})
+            return True
+        return False
+
+    def do_PUT(self):
+        fake = self.server_fake
+        path, query = self._target()
+        data = self.read_body()
+        fake.throttle(len(data))
+        if self._fail("put"):
+            return
+        etag = '"%s"' % hashlib.md5(data).hexdigest().upper()
+        with fake._lock:
+            if "partNumber" in query:
+                fake.uploads[query["uploadId"][0]][int(query["partNumber"][0])] = data
+            else:
+                fake.objects[path] = data
+        self.reply(200, headers={"ETag": etag})
+
+    def do_POST(self):
+        fake = self.server_fake
+        path, query = self._target()
+        self.read_body()
+        if self._fail("post"):
+            return
+        if "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            with fake._lock:
+                fake.uploads[upload_id] = {}
+            return self.reply(200, (
+                "<InitiateMultipartUploadResult><Bucket>bench</Bucket>"
+                f"<Key>{path}</Key><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>"
+            ).encode("utf-8"))
+        if "uploadId" in query:
+            with fake._lock:
+                parts = fake.uploads.pop(query["uploadId"][0], {})
+                fake.objects[path] = b"".join(parts[n] for n in sorted(parts))
+            return self.reply(200, b'<CompleteMultipartUploadResult><ETag>"BENCH"</ETag></CompleteMultipartUploadResult>')
+        self.reply(400, b"<Error><Code>InvalidRequest</Code></Error>")
+
+    def do_GET(self):
+        fake = self.server_fake
+        path, query = self._target()
+        if "uploadId" in query:
+            with fake._lock:
+                parts = dict(fake.uploads.get(query["uploadId"][0], {}))
+            items = "".join(
+                f"<Part><PartNumber>{n}</PartNumber><LastModified>2020-01-01T00:00:00.000Z</LastModified>"
+                f'<ETag>"{hashlib.md5(d).hexdigest().upper()}"</ETag><Size>{len(d)}</Size></Part>'
+                for n, d in sorted(parts.items())
+            )
+            return self.reply(200, (
+                f"<ListPartsResult><Bucket>bench</Bucket><Key>{path}</Key><UploadId>{query['uploadId'][0]}</UploadId>"
+                "<NextPartNumberMarker>0</NextPartNumberMarker><MaxParts>1000</MaxParts>"
+                f"<IsTruncated>false</IsTruncated>{items}</ListPartsResult>"
+            ).encode("utf-8"))
+        with fake._lock:
+            data = fake.objects.get(path)
+        if data is None:
+            return self.reply(404, b"<Error><Code>NoSuchKey</Code></Error>")
+        fake.count("get")
+        self.reply(200, data, {"Content-Type": "application/octet-stream"})
+
+    def do_DELETE(self):
+        fake = self.server_fake
+        path, _ = self._target()
+        fake.count("delete")
+        with fake._lock:
+            fake.objects.pop(path, None)
+        self.reply(204)
+
+
+class FakeOSS(FakeServer):
+    """
+    OSS 兼容的内存对象存储 (PutObject / 分片上传 / GetObject / DeleteObject)，不校验签名。
+    bandwidth (字节/秒) 限制上传速度，模拟上行带宽。
+    """
+
+    handler_class = _OSSHandler
+
+    def __init__(self, bandwidth: float = None, **kwargs):
+        super().__init__(**kwargs)
+        self.bandwidth = bandwidth
+        self.objects = {}
+        self.uploads = {}
+
+    def throttle(self, size: int):
+        if self.bandwidth:
+            time.sleep(size / self.bandwidth)
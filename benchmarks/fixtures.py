@@ -0,0 +1,54 @@
+import os
+import time
+import subprocess
+from utils.helpers import get_ffmpeg_exe
+
+FIXTURE_BITRATE = 64000
+
+
+def make_audio(seconds: int, directory: str, silence_every: float = 13.0) -> str:
+    """
+    用 ffmpeg lavfi 生成指定时长的合成音频 (单声道 MP3)，每 silence_every 秒插入约 1.5 秒静音，
+    便于覆盖静音切分逻辑。同一时长的文件只生成一次。
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"bench_{seconds}s.mp3")
+    if os.path.exists(path):
+        return path
+    tmp_path = path + ".tmp.mp3"
+    cmd = [
+        get_ffmpeg_exe(), "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", f"sine=frequency=320:sample_rate=16000:duration={seconds}",
+        "-af", f"volume='if(lt(mod(t,{silence_every}),{silence_every - 1.5}),1,0)':eval=frame",
+        "-ac", "1", "-c:a", "libmp3lame", "-b:a", str(FIXTURE_BITRATE), tmp_path,
+    ]
+    subprocess.run(cmd, check=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+class StubDownloader:
+    """
+    替代 BilibiliDownloader: 按输入源返回预先生成的音频文件，并按 bandwidth (字节/秒) 模拟下载耗时。
+    """
+
+    def __init__(self, files: dict, bandwidth: float = None, durations: dict = None):
+        # source -> 本地文件路径; 本地文件路径 -> 时长 (秒)
+        self.files = files
+        self.bandwidth = bandwidth
+        self.durations = durations or {}
+
+    def download(self, url_or_bv: str, extract_audio: bool = True) -> str:
+        return self.download_with_info(url_or_bv, extract_audio)[0]
+
+    def download_with_info(self, url_or_bv: str, extract_audio: bool = True, native_audio: bool = False,
+                           target_dir: str = None):
+        path = self.files[url_or_bv]
+        size = os.path.getsize(path)
+        if self.bandwidth:
+            time.sleep(size / self.bandwidth)
+        media = {
+            "id": url_or_bv, "title": os.path.basename(path), "duration": self.durations.get(path), "filesize": size,
+            "format_id": "bench", "abr": None, "ext": os.path.splitext(path)[1].lstrip("."), "webpage_url": None,
+        }
+        return path, media
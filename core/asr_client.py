@@ -1,19 +1,24 @@
 import json
-import time
-import requests
+import concurrent.futures
+from .asr_poller import get_poller
+from .http_client import get_http
+from .transcript import Transcript
 from utils.logger import get_logger
-from utils.config import settings
-from utils.helpers import format_milliseconds
+from utils.config import settings, require_settings
 
 logger = get_logger("ASRClient")
 
+# 等待轮询结果时在 ASR_POLL_TIMEOUT_SECONDS 之外多等的秒数 (轮询器自身的超时应先触发)
+WAIT_GRACE_SECONDS = 60
+
 class ASRClient:
     def __init__(self):
+        require_settings("DASHSCOPE_API_KEY")
         self.api_key = settings.DASHSCOPE_API_KEY
         self.model = settings.DASHSCOPE_MODEL
 
     def submit_task(self, file_url: str):
-        url = "https://dashscope.aliyuncs.com/api/v1/services/audio/asr/transcription"
+        url = f"{settings.DASHSCOPE_BASE_URL}/api/v1/services/audio/asr/transcription"
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
@@ -26,62 +31,38 @@ class ASRClient:
             "parameters": {"enable_itn": False}
         }
         
-        resp = requests.post(url, headers=headers, json=payload)
+        resp = get_http().post(url, endpoint="asr_submit", headers=headers, json=payload)
         if resp.status_code == 200:
             return resp.json().get("output", {}).get("task_id")
         else:
             logger.error(f"ASR Submit Failed: {resp.text}")
             raise Exception(f"ASR Task Submission Failed: {resp.status_code}")
 
-    def poll_result(self, task_id: str):
-        url = f"https://dashscope.aliyuncs.com/api/v1/tasks/{task_id}"
-        headers = {
-            "Authorization": f"Bearer {self.api_key}"
-        }
-        
-        start_time = time.time()
-        while True:
-            try:
-                resp = requests.get(url, headers=headers)
-                if resp.status_code != 200:
-                    logger.warning(f"Poll check failed: {resp.status_code}")
-                    time.sleep(3)
-                    continue
+    def poll_result(self, task_id: str, duration_hint_ms: int = None) -> str:
+        """阻塞等待任务完成 (实际轮询由共享的 ASRPoller 统一完成，本线程只等待 Future)"""
+        return self.fetch_transcript(self.wait_task(task_id, duration_hint_ms)).to_text()
 
-                data = resp.json()
-                status = data.get("output", {}).get("task_status")
-                
-                if status == "SUCCEEDED":
-                    return self._process_success(data)
-                elif status == "FAILED":
-                    error = data.get("output", {})
-                    raise Exception(f"Task Failed: {error.get('code')} - {error.get('message')}")
-                else:
-                    elapsed = int(time.time() - start_time)
-                    if elapsed % 10 == 0:
-                        logger.info(f"Task Status: {status} (Elapsed: {elapsed}s)")
-                    time.sleep(3)
-            except Exception as e:
-                raise e
+    def wait_task(self, task_id: str, duration_hint_ms: int = None) -> dict:
+        """
+        阻塞等待任务完成，返回 DashScope 任务数据 (不下载转录结果)。
+        轮询由共享的 ASRPoller 完成，但调用线程会一直阻塞到结果返回，调度器的 ASR 名额也不释放，
+        因此同时在转写中的任务数仍受 SCHED_LIMIT_ASR 限制
+        """
+        future = get_poller().watch(task_id, duration_hint_ms)
+        try:
+            return future.result(timeout=settings.ASR_POLL_TIMEOUT_SECONDS + WAIT_GRACE_SECONDS)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"ASR task {task_id} did not finish within {settings.ASR_POLL_TIMEOUT_SECONDS}s")
 
-    def _process_success(self, data):
+    def fetch_transcript(self, data: dict, offset_ms: int = 0) -> Transcript:
+        """
+        下载已完成任务的转录结果，返回结构化的 Transcript。
+        所有时间整体加上 offset_ms (用于分段转写后按段起点拼接)。
+        """
         transcription_url = data.get("output", {}).get("result", {}).get("transcription_url")
         if not transcription_url:
-            return json.dumps(data, ensure_ascii=False)
-        
-        res = requests.get(transcription_url)
-        res_data = res.json()
-        
-        full_text = ""
-        if isinstance(res_data, dict) and "transcripts" in res_data:
-            for item in res_data["transcripts"]:
-                if "sentences" in item:
-                    for sent in item["sentences"]:
-                        start_ms = sent.get("begin_time", 0)
-                        text = sent.get("text", "")
-                        time_str = format_milliseconds(start_ms)
-                        full_text += f"[{time_str}] {text}\n"
-                elif "text" in item:
-                    full_text += item["text"] + "\n"
-        
-        return full_text
+            return Transcript.build([(None, None, json.dumps(data, ensure_ascii=False), None)])
+
+        res = get_http().get(transcription_url)
+        return Transcript.from_dashscope(res.json(), offset_ms)
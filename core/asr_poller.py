@@ -0,0 +1,208 @@
+import time
+import heapq
+import random
+import asyncio
+import threading
+import itertools
+import concurrent.futures
+from typing import Optional
+import httpx
+from .http_client import get_http, throttle_info
+from utils.logger import get_logger
+from utils.config import settings
+
+logger = get_logger("ASRPoller")
+
+
+class ASRTaskError(Exception):
+    pass
+
+
+class _Watch:
+    def __init__(self, task_id: str, future: concurrent.futures.Future, deadline: float,
+                 duration_hint_ms: Optional[int]):
+        self.task_id = task_id
+        self.future = future
+        self.started = time.monotonic()
+        self.deadline = deadline
+        self.duration_hint_ms = duration_hint_ms
+        self.interval = settings.ASR_POLL_MIN_INTERVAL
+        self.errors = 0
+        self.polls = 0
+
+
+class ASRPoller:
+    """
+    多路复用的 ASR 结果轮询器。
+    在一个后台线程中运行 asyncio 事件循环，按到期时间堆统一调度所有在途 task_id 的查询:
+    - 轮询间隔随音频时长 / 已等待时长自适应增长
+    - 请求失败时指数退避，连续失败 ASR_POLL_MAX_ERRORS 次后判定任务失败
+    - 查询经过 DashScope 流控 (asr_poll)，被限流时按正常间隔重新排队，不计入失败次数
+    - 每个任务有整体超时
+    每个任务对应一个 Future，任务完成时以 DashScope 返回的任务数据 resolve。
+    查询中出现的任何异常都按请求失败处理 (退避重试或以异常 resolve)，不会丢下未 resolve 的 Future。
+    """
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self._loop = asyncio.new_event_loop()
+        self._heap = []
+        # 执行中的查询协程 (保留引用，避免被回收)
+        self._tasks = set()
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._thread = threading.Thread(target=self._run_loop, name="asr-poller", daemon=True)
+        self._ready = threading.Event()
+        self._thread.start()
+        self._ready.wait()
+
+    # ---- public API ----
+
+    def watch(self, task_id: str, duration_hint_ms: Optional[int] = None,
+              timeout: Optional[float] = None) -> concurrent.futures.Future:
+        """开始跟踪 task_id，返回在任务完成时 resolve 的 Future (线程安全)"""
+        future = concurrent.futures.Future()
+        timeout = timeout or settings.ASR_POLL_TIMEOUT_SECONDS
+        watch = _Watch(task_id, future, time.monotonic() + timeout, duration_hint_ms)
+        watch.interval = self._initial_interval(duration_hint_ms)
+        self._loop.call_soon_threadsafe(self._schedule, watch, watch.interval)
+        return future
+
+    def pending(self) -> int:
+        return len(self._heap)
+
+    # ---- scheduling ----
+
+    @staticmethod
+    def _initial_interval(duration_hint_ms: Optional[int]) -> float:
+        if not duration_hint_ms:
+            return settings.ASR_POLL_MIN_INTERVAL
+        # 长音频转写更久，首次查询也可以更晚
+        expected = duration_hint_ms / 1000.0 * settings.ASR_POLL_DURATION_FACTOR
+        return min(settings.ASR_POLL_MAX_INTERVAL, max(settings.ASR_POLL_MIN_INTERVAL, expected))
+
+    def _schedule(self, watch: _Watch, delay: float):
+        due = min(time.monotonic() + delay, watch.deadline)
+        heapq.heappush(self._heap, (due, next(self._seq), watch))
+        self._wakeup.set()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._wakeup = asyncio.Event()
+        self._loop.call_soon(self._ready.set)
+        self._loop.run_until_complete(self._dispatch())
+
+    async def _dispatch(self):
+        while True:
+            now = time.monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                _, _, watch = heapq.heappop(self._heap)
+                task = asyncio.ensure_future(self._poll_safe(watch))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    @staticmethod
+    def _resolve(watch: _Watch, result=None, error: Exception = None):
+        # 等待方可能已取消 Future (如等待超时)
+        if watch.future.done():
+            return
+        try:
+            if error is not None:
+                watch.future.set_exception(error)
+            else:
+                watch.future.set_result(result)
+        except concurrent.futures.InvalidStateError:
+            pass
+
+    async def _poll_safe(self, watch: _Watch):
+        try:
+            await self._poll_once(watch)
+        except Exception as e:
+            # 如 200 响应的正文不是 JSON: 与请求失败一样退避，连续失败达到上限后以异常 resolve
+            try:
+                self._backoff(watch, f"{type(e).__name__}: {e}")
+            except Exception as inner:
+                self._resolve(watch, error=ASRTaskError(f"Poll failed for {watch.task_id}: {inner}"))
+
+    async def _poll_once(self, watch: _Watch):
+        if watch.future.done():
+            return
+        if time.monotonic() >= watch.deadline:
+            elapsed = int(time.monotonic() - watch.started)
+            self._resolve(watch, error=TimeoutError(f"ASR task {watch.task_id} timed out after {elapsed}s"))
+            return
+
+        watch.polls += 1
+        try:
+            # 轮询本身负责退避，这里不再叠加连接层重试；限流后的等待由流控统一完成
+            resp = await get_http().arequest(
+                "GET",
+                f"{settings.DASHSCOPE_BASE_URL}/api/v1/tasks/{watch.task_id}",
+                retries=0,
+                endpoint="asr_poll",
+                throttle_retries=0,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+            )
+        except httpx.HTTPError as e:
+            self._backoff(watch, f"request error: {e}")
+            return
+
+        if resp.status_code != 200:
+            if throttle_info(resp)[0]:
+                self._schedule(watch, watch.interval)
+                return
+            if 400 <= resp.status_code < 500 and resp.status_code not in (408, 429):
+                self._resolve(watch, error=ASRTaskError(f"Poll failed: {resp.status_code} - {resp.text}"))
+                return
+            self._backoff(watch, f"status {resp.status_code}")
+            return
+
+        data = resp.json()
+        watch.errors = 0
+        output = data.get("output", {})
+        status = output.get("task_status")
+        if status == "SUCCEEDED":
+            self._resolve(watch, data)
+        elif status in ("FAILED", "CANCELED", "UNKNOWN"):
+            self._resolve(watch, error=ASRTaskError(f"Task Failed: {output.get('code')} - {output.get('message')}"))
+        else:
+            elapsed = time.monotonic() - watch.started
+            # 等待越久，查询间隔越长
+            watch.interval = min(
+                settings.ASR_POLL_MAX_INTERVAL,
+                max(watch.interval * 1.5, elapsed * 0.1, settings.ASR_POLL_MIN_INTERVAL),
+            )
+            if watch.polls % 5 == 0:
+                logger.info(f"Task {watch.task_id}: {status} (Elapsed: {int(elapsed)}s)")
+            self._schedule(watch, watch.interval)
+
+    def _backoff(self, watch: _Watch, reason: str):
+        watch.errors += 1
+        if watch.errors >= settings.ASR_POLL_MAX_ERRORS:
+            self._resolve(
+                watch, error=ASRTaskError(f"Poll failed {watch.errors} times in a row for {watch.task_id} ({reason})")
+            )
+            return
+        delay = min(settings.ASR_POLL_MAX_INTERVAL, settings.ASR_POLL_MIN_INTERVAL * (2 ** watch.errors))
+        delay *= random.uniform(0.8, 1.2)
+        logger.warning(f"Poll check failed for {watch.task_id} ({reason}), retry in {delay:.1f}s")
+        self._schedule(watch, delay)
+
+
+_poller = None
+_poller_lock = threading.Lock()
+
+
+def get_poller() -> ASRPoller:
+    """进程内共享的轮询器 (首次使用时启动)"""
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            _poller = ASRPoller(settings.DASHSCOPE_API_KEY)
+        return _poller
@@ -0,0 +1,130 @@
+import threading
+from collections import deque
+from typing import Callable, Dict, List, Optional
+from utils.logger import get_logger
+
+logger = get_logger("Batch")
+
+
+class Batch:
+    def __init__(self, batch_id: str, children: List[str], limit: int):
+        self.batch_id = batch_id
+        self.children = children
+        self.limit = max(1, limit)
+        self.pending = deque()
+        self.running = set()
+        # child_id -> "succeeded" / "failed"
+        self.finished: Dict[str, str] = {}
+
+    @property
+    def done(self) -> bool:
+        return not self.pending and not self.running
+
+    def counts(self) -> dict:
+        succeeded = sum(1 for status in self.finished.values() if status == "succeeded")
+        return {
+            "total": len(self.children),
+            "queued": len(self.pending),
+            "running": len(self.running),
+            "succeeded": succeeded,
+            "failed": len(self.finished) - succeeded,
+        }
+
+
+class BatchCoordinator:
+    """
+    批量任务协调器:
+    - 每个批量任务 (父任务) 的子任务最多同时提交 limit 个给调度器，一个结束后再提交下一个，
+      避免一个大合集占满全部执行槽位
+    - 子任务结束时回调 on_progress(batch, child_id, status)，全部结束后回调 on_complete(batch)
+
+    submit_child(child_id) 负责把子任务交给调度器；子任务结束时由调度器回调方调用 child_done。
+    """
+
+    def __init__(self, submit_child: Callable[[str], None],
+                 on_progress: Optional[Callable] = None, on_complete: Optional[Callable] = None):
+        self.submit_child = submit_child
+        self.on_progress = on_progress
+        self.on_complete = on_complete
+        self._batches: Dict[str, Batch] = {}
+        self._owners: Dict[str, str] = {}   # child_id -> batch_id
+        self._lock = threading.Lock()
+
+    def start(self, batch_id: str, children: List[str], limit: int, finished: Dict[str, str] = None) -> Batch:
+        """登记批量任务并提交第一批子任务。finished 为已结束的子任务 (重启恢复时)，不再提交"""
+        batch = Batch(batch_id, list(children), limit)
+        finished = finished or {}
+        with self._lock:
+            for child_id in batch.children:
+                if child_id in finished:
+                    batch.finished[child_id] = finished[child_id]
+                else:
+                    batch.pending.append(child_id)
+                    self._owners[child_id] = batch_id
+            self._batches[batch_id] = batch
+            to_submit = self._take(batch)
+        logger.info(f"Batch {batch_id}: {len(batch.children)} items, concurrency {batch.limit}")
+        self._submit(to_submit)
+        if batch.done:
+            self._complete(batch)
+        return batch
+
+    def child_done(self, child_id: str, status: str) -> bool:
+        """子任务结束。返回 False 表示不属于任何批量任务"""
+        with self._lock:
+            batch_id = self._owners.pop(child_id, None)
+            batch = self._batches.get(batch_id)
+            if batch is None:
+                return False
+            batch.running.discard(child_id)
+            batch.finished[child_id] = status
+            to_submit = self._take(batch)
+            done = batch.done
+        if self.on_progress:
+            try:
+                self.on_progress(batch, child_id, status)
+            except Exception as e:
+                logger.error(f"Batch progress callback error for {batch.batch_id}: {e}")
+        self._submit(to_submit)
+        if done:
+            self._complete(batch)
+        return True
+
+    def owner(self, child_id: str) -> Optional[str]:
+        with self._lock:
+            return self._owners.get(child_id)
+
+    def describe(self, batch_id: str) -> Optional[dict]:
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch is None:
+                return None
+            return dict(batch.counts(), concurrency=batch.limit)
+
+    def _take(self, batch: Batch) -> List[str]:
+        """在持锁状态下取出可以提交的子任务"""
+        taken = []
+        while batch.pending and len(batch.running) < batch.limit:
+            child_id = batch.pending.popleft()
+            batch.running.add(child_id)
+            taken.append(child_id)
+        return taken
+
+    def _submit(self, child_ids: List[str]):
+        for child_id in child_ids:
+            try:
+                self.submit_child(child_id)
+            except Exception as e:
+                logger.error(f"Failed to submit batch item {child_id}: {e}")
+                self.child_done(child_id, "failed")
+
+    def _complete(self, batch: Batch):
+        with self._lock:
+            if self._batches.pop(batch.batch_id, None) is None:
+                return
+        logger.info(f"Batch {batch.batch_id} finished: {batch.counts()}")
+        if self.on_complete:
+            try:
+                self.on_complete(batch)
+            except Exception as e:
+                logger.error(f"Batch completion callback error for {batch.batch_id}: {e}")
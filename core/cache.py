@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Optional
+from utils.logger import get_logger
+
+logger = get_logger("ResultCache")
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    两级内容寻址结果缓存:
+    - transcript: 以 (规范化输入源, ASR 模型) 为键
+    - summary: 以 (转录文本哈希, 预设名或自定义提示词哈希, 摘要模型) 为键
+
+    条目以 JSON 文件形式存放在 cache_dir 下，按 TTL 过期，
+    超过 max_bytes 时按最近访问时间 (LRU) 淘汰。
+    锁只保护内存索引与统计，读写 / 删除缓存文件都在锁外进行。
+    """
+
+    LEVELS = ("transcript", "summary")
+
+    def __init__(self, cache_dir: str, max_bytes: int, ttl_seconds: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # key -> (level, size, last_access, created)
+        self._index = {}
+        self._total_bytes = 0
+        self._stats = {
+            level: {"hits": 0, "misses": 0, "saved_seconds": 0.0}
+            for level in self.LEVELS
+        }
+        for level in self.LEVELS:
+            os.makedirs(os.path.join(self.cache_dir, level), exist_ok=True)
+        self._load_index()
+
+    # ---- keys ----
+
+    @staticmethod
+    def transcript_key(source_key: str, model: str) -> str:
+        return _sha256(f"{source_key}|{model}")
+
+    @staticmethod
+    def summary_key(transcript: str, preset_name: str, custom_prompt: Optional[str], model: str) -> str:
+        if custom_prompt and custom_prompt.strip():
+            prompt_id = "custom:" + _sha256(custom_prompt)
+        else:
+            prompt_id = "preset:" + preset_name
+        return _sha256(f"{_sha256(transcript)}|{prompt_id}|{model}")
+
+    # ---- public API ----
+
+    def get(self, level: str, key: str) -> Optional[dict]:
+        entry = self.peek(level, key)
+        self.record(level, entry)
+        return entry["value"] if entry else None
+
+    def peek(self, level: str, key: str) -> Optional[dict]:
+        """
+        读取条目 ({"value", "elapsed"}) 但不计入命中统计，用于预查询 (如提交时的缓存直出)；
+        结果确实被使用时再调用 record，避免与之后的 get 重复计数。
+        """
+        path = self._path(level, key)
+        now = time.time()
+        with self._lock:
+            meta = self._index.get(key)
+            expired = meta is not None and now - meta[3] > self.ttl_seconds
+            if expired:
+                self._drop(key)
+        if expired:
+            self._unlink([path])
+        if not meta or expired:
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except Exception as e:
+            logger.warning(f"Broken cache entry {key}: {e}")
+            with self._lock:
+                # 期间已被重新写入的条目保留
+                stale = self._index.get(key) == meta
+                if stale:
+                    self._drop(key)
+            if stale:
+                self._unlink([path])
+            return None
+        with self._lock:
+            current = self._index.get(key)
+            if current:
+                self._index[key] = (level, current[1], now, current[3])
+        return entry
+
+    def record(self, level: str, entry: Optional[dict]):
+        """把一次查询结果 (peek 的返回值，None 为未命中) 计入统计"""
+        with self._lock:
+            if entry is None:
+                self._stats[level]["misses"] += 1
+            else:
+                self._stats[level]["hits"] += 1
+                self._stats[level]["saved_seconds"] += entry.get("elapsed", 0.0)
+
+    def put(self, level: str, key: str, value: dict, elapsed: float = 0.0):
+        path = self._path(level, key)
+        data = json.dumps({"value": value, "elapsed": elapsed}, ensure_ascii=False)
+        size = len(data.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        # 临时文件名带线程号，同一键的并发写入各自落盘后原子替换
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Failed to write cache entry {key}: {e}")
+            return
+        now = time.time()
+        with self._lock:
+            if key in self._index:
+                self._total_bytes -= self._index[key][1]
+            self._index[key] = (level, size, now, now)
+            self._total_bytes += size
+            evicted = self._evict(now)
+        self._unlink(evicted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            levels = {}
+            for level, s in self._stats.items():
+                lookups = s["hits"] + s["misses"]
+                levels[level] = dict(
+                    s,
+                    saved_seconds=round(s["saved_seconds"], 2),
+                    hit_rate=round(s["hits"] / lookups, 4) if lookups else 0.0,
+                )
+            return {
+                "entries": len(self._index),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "levels": levels,
+            }
+
+    # ---- internals ----
+
+    def _path(self, level: str, key: str) -> str:
+        return os.path.join(self.cache_dir, level, f"{key}.json")
+
+    def _load_index(self):
+        for level in self.LEVELS:
+            level_dir = os.path.join(self.cache_dir, level)
+            for name in os.listdir(level_dir):
+                if not name.endswith(".json"):
+                    continue
+                st = os.stat(os.path.join(level_dir, name))
+                self._index[name[:-5]] = (level, st.st_size, st.st_mtime, st.st_mtime)
+                self._total_bytes += st.st_size
+        self._unlink(self._evict(time.time()))
+
+    def _drop(self, key: str) -> Optional[str]:
+        """从索引中移除条目 (需持有锁)，返回待删除的文件路径"""
+        meta = self._index.pop(key, None)
+        if not meta:
+            return None
+        self._total_bytes -= meta[1]
+        return self._path(meta[0], key)
+
+    @staticmethod
+    def _unlink(paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _evict(self, now: float) -> list:
+        """淘汰过期条目，再按 LRU 淘汰到 max_bytes 以内 (需持有锁)，返回待删除的文件路径"""
+        paths = []
+        expired = [k for k, m in self._index.items() if now - m[3] > self.ttl_seconds]
+        for key in expired:
+            paths.append(self._drop(key))
+        if self._total_bytes <= self.max_bytes:
+            return paths
+        for key in sorted(self._index, key=lambda k: self._index[k][2]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            paths.append(self._drop(key))
+        return paths
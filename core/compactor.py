@@ -0,0 +1,137 @@
+import re
+from typing import List, Optional, Tuple
+from .transcript import Transcript
+from utils.helpers import CJK_PATTERN, estimate_tokens, format_milliseconds
+
+# 口头禅 / 语气词: 只在句首或标点之后、且后面紧跟标点或空白时去除，避免误伤正常词语
+FILLER_PATTERN = re.compile(
+    r"(?:^|(?<=[，,。.！!？?、；;：:\s]))(?:嗯+|呃+|额+|唔+|啊+|哦+|em+|um+|uh+|erm|hmm+)(?:[，,、。.…~～]+|\s+|$)",
+    re.IGNORECASE,
+)
+# 口吃式重复: 2~6 字的中文片段连续出现 3 次及以上 (我们我们我们 / 就是说，就是说，就是说)
+# 单字只在用标点或空白隔开、且重复 3 次及以上时才合并 (对，对，对)；由同一个字组成的片段不合并，
+# 叠字与拟声词保持原样，例如: 谢谢谢谢 / 一一一 / 哈哈哈哈哈哈 / 看看看 / 研究研究 / 对对对
+CJK_REPEAT_PATTERN = re.compile(r"([\u4e00-\u9fff]{2,6}?)(?:[，,、\s]*\1){2,}")
+CJK_CHAR_REPEAT_PATTERN = re.compile(r"([\u4e00-\u9fff])(?:[，,、\s]+\1){2,}")
+WORD_REPEAT_PATTERN = re.compile(r"\b([A-Za-z']+)(?:[,\s]+\1\b){2,}", re.IGNORECASE)
+NON_WORD = re.compile(r"[\W_]+")
+MULTI_SPACE = re.compile(r"\s{2,}")
+# 段首时间戳 "[HH:MM:SS] " 的估算 token 数
+HEADER_TOKENS = estimate_tokens("[00:00:00] ")
+
+
+def _collapse_cjk(match: re.Match) -> str:
+    unit = match.group(1)
+    # 由同一个字组成的片段 (哈哈 / 谢谢) 是叠字，不是口吃
+    return match.group(0) if len(set(unit)) == 1 else unit
+
+
+def clean_sentence(text: str) -> Tuple[str, int]:
+    """去除口头禅与口吃式重复，返回 (清理后的文本, 去除的口头禅数)"""
+    text, fillers = FILLER_PATTERN.subn("", text.strip())
+    text = CJK_REPEAT_PATTERN.sub(_collapse_cjk, text)
+    text = CJK_CHAR_REPEAT_PATTERN.sub(r"\1", text)
+    text = WORD_REPEAT_PATTERN.sub(r"\1", text)
+    text = MULTI_SPACE.sub(" ", text).strip(" ，,、")
+    # 只剩标点时视为空句
+    return (text if NON_WORD.sub("", text) else ""), fillers
+
+
+def _join(left: str, right: str) -> str:
+    # 中文之间直接拼接，其它语言用空格分隔
+    if CJK_PATTERN.match(left[-1:]) or CJK_PATTERN.match(right[:1]):
+        return left + right
+    return f"{left} {right}"
+
+
+class _Paragraph:
+    __slots__ = ("begin", "speaker", "sentences")
+
+    def __init__(self, begin: Optional[int], speaker: Optional[int]):
+        self.begin = begin
+        self.speaker = speaker
+        self.sentences: List[str] = []
+
+    def render(self, sentences: List[str]) -> str:
+        text = sentences[0]
+        for sentence in sentences[1:]:
+            text = _join(text, sentence)
+        return text if self.begin is None else f"[{format_milliseconds(self.begin)}] {text}"
+
+
+def compact_transcript(transcript: Transcript, paragraph_seconds: float, budget_tokens: int = None):
+    """
+    生成送入摘要的紧凑文本:
+    1. 逐句去除口头禅与口吃式重复，丢弃与上一句内容相同的句子
+    2. 把 paragraph_seconds 秒内 (且说话人相同) 的句子合并为一段，每段只保留段首时间戳
+    3. 估算 token 数超过 budget_tokens 时，按各段 token 占比分配预算，每段保留开头的若干句，
+       未用完的预算顺延给后面的段落，使裁剪后的内容均匀覆盖整个时间轴
+    返回 (文本, 统计信息)。
+    """
+    window_ms = int(paragraph_seconds * 1000)
+    paragraphs: List[_Paragraph] = []
+    current = None
+    last_key = None
+    stats = {"sentences": len(transcript), "fillers": 0, "repeats": 0}
+
+    for begin, _, text, speaker in transcript:
+        text, fillers = clean_sentence(text)
+        stats["fillers"] += fillers
+        if not text:
+            continue
+        key = NON_WORD.sub("", text).lower()
+        if key == last_key:
+            stats["repeats"] += 1
+            continue
+        last_key = key
+        if (
+            current is None or begin is None or current.begin is None
+            or speaker != current.speaker or begin - current.begin >= window_ms
+        ):
+            current = _Paragraph(begin, speaker)
+            paragraphs.append(current)
+        current.sentences.append(text)
+
+    stats["tokens_before"] = estimate_tokens(transcript.to_text())
+    kept = [p.sentences for p in paragraphs]
+    trimmed = 0
+    if budget_tokens and estimate_tokens(_render(paragraphs, kept)) > budget_tokens:
+        kept, trimmed = _trim(paragraphs, budget_tokens)
+
+    text = _render(paragraphs, kept)
+    stats.update(
+        paragraphs=sum(1 for sentences in kept if sentences),
+        trimmed_sentences=trimmed,
+        budget_tokens=budget_tokens or None,
+        tokens_after=estimate_tokens(text),
+    )
+    return text, stats
+
+
+def _render(paragraphs: List[_Paragraph], kept: List[List[str]]) -> str:
+    return "\n".join(p.render(sentences) for p, sentences in zip(paragraphs, kept) if sentences)
+
+
+def _trim(paragraphs: List[_Paragraph], budget_tokens: int):
+    """按 token 占比裁剪各段 (段首时间戳的开销预先扣除)，返回 (各段保留的句子, 被裁掉的句数)"""
+    headers = sum(HEADER_TOKENS for p in paragraphs if p.begin is not None)
+    total = sum(estimate_tokens(s) + 1 for p in paragraphs for s in p.sentences)
+    ratio = max(budget_tokens - headers, budget_tokens // 2) / total
+    credit = 0.0
+    kept, trimmed = [], 0
+    for paragraph in paragraphs:
+        sentence_tokens = [estimate_tokens(s) + 1 for s in paragraph.sentences]
+        credit += ratio * sum(sentence_tokens)
+        selected = []
+        for sentence, tokens in zip(paragraph.sentences, sentence_tokens):
+            if tokens > credit:
+                break
+            selected.append(sentence)
+            credit -= tokens
+        trimmed += len(paragraph.sentences) - len(selected)
+        kept.append(selected)
+    if paragraphs and not any(kept):
+        # 预算过小时至少保留第一句
+        kept[0] = paragraphs[0].sentences[:1]
+        trimmed -= 1
+    return kept, trimmed
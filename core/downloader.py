@@ -1,55 +1,164 @@
 import os
 import sys
-import imageio_ffmpeg
-try:
-    import yt_dlp
-except ImportError:
-    pass # handled by caller or requirements
-
+from utils.helpers import get_ffmpeg_exe
 from utils.logger import get_logger
 
 logger = get_logger("Downloader")
 
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+def _audio_bitrate(fmt: dict) -> float:
+    return fmt.get("abr") or fmt.get("tbr") or 0
+
+
+def _format_size(fmt: dict) -> float:
+    return fmt.get("filesize") or fmt.get("filesize_approx") or 0
+
+
+def select_audio_format(formats: list, min_kbps: float):
+    """
+    在纯音频流中选择码率不低于 min_kbps 的最小流 (按码率、再按文件大小)；
+    都低于下限时取码率最高的纯音频流；没有纯音频流时返回 None。
+    """
+    audio_only = [
+        f for f in formats
+        if f.get("vcodec") == "none" and f.get("acodec") not in (None, "none")
+    ]
+    if not audio_only:
+        return None
+    eligible = [f for f in audio_only if _audio_bitrate(f) >= min_kbps]
+    if eligible:
+        return min(eligible, key=lambda f: (_audio_bitrate(f), _format_size(f)))
+    return max(audio_only, key=lambda f: (_audio_bitrate(f), -_format_size(f)))
+
+
 class BilibiliDownloader:
-    def __init__(self, download_dir="downloads"):
+    def __init__(self, download_dir="downloads", min_audio_kbps: float = 48):
         self.download_dir = download_dir
+        self.min_audio_kbps = min_audio_kbps
         if not os.path.exists(self.download_dir):
             os.makedirs(self.download_dir)
-        
+
+    @property
+    def ffmpeg_exe(self):
         try:
-            self.ffmpeg_exe = imageio_ffmpeg.get_ffmpeg_exe()
-        except:
-            self.ffmpeg_exe = None
+            return get_ffmpeg_exe()
+        except Exception:
+            return None
 
-    def download(self, url_or_bv: str) -> str:
-        # Normalize input
-        if not url_or_bv.startswith("http"):
-            if url_or_bv.startswith("BV") or url_or_bv.startswith("bv"):
-                url_or_bv = f"https://www.bilibili.com/video/{url_or_bv}"
-            else:
-                url_or_bv = f"https://www.bilibili.com/video/{url_or_bv}"
+    def download(self, url_or_bv: str, extract_audio: bool = True) -> str:
+        """
+        下载音频。extract_audio=False 时保留 yt-dlp 下载的原始音频流 (不转码为 MP3)，
+        交由后续的 ASR 流式转码处理。
+        """
+        return self.download_with_info(url_or_bv, extract_audio=extract_audio)[0]
 
+    def download_with_info(self, url_or_bv: str, extract_audio: bool = True, native_audio: bool = False,
+                           target_dir: str = None):
+        """
+        下载到 target_dir (默认 download_dir) 并返回 (文件路径, 媒体信息)。
+        native_audio=True 时选择码率不低于 min_audio_kbps 的最小纯音频流，保留原始容器 (m4a 等)
+        且不做任何后处理，可直接上传给 ASR。
+        媒体信息取自 yt-dlp 的 info: id / title / duration (秒) / filesize / format_id / abr / ext / webpage_url。
+        """
+        url_or_bv = self._normalize_url(url_or_bv)
         logger.info(f"Target: {url_or_bv}")
 
+        if native_audio:
+            extract_audio = False
         ydl_opts = {
-            'format': 'bestaudio/best',
-            'outtmpl': os.path.join(self.download_dir, '%(title)s.%(ext)s'),
+            'format': self._native_audio_selector if native_audio else 'bestaudio/best',
+            'outtmpl': os.path.join(target_dir or self.download_dir, '%(title)s.%(ext)s'),
             'postprocessors': [{
                 'key': 'FFmpegExtractAudio',
                 'preferredcodec': 'mp3',
                 'preferredquality': '192',
-            }],
-            'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            }] if extract_audio else [],
+            'user_agent': USER_AGENT,
             'ffmpeg_location': self.ffmpeg_exe,
         }
 
+        # yt-dlp 导入较慢，首次下载时才加载
+        import yt_dlp
+
         try:
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
                 info = ydl.extract_info(url_or_bv, download=True)
                 filename = ydl.prepare_filename(info)
-                final_filename = os.path.splitext(filename)[0] + ".mp3"
-                logger.info(f"Download complete: {final_filename}")
-                return final_filename
+                if extract_audio:
+                    final_filename = os.path.splitext(filename)[0] + ".mp3"
+                else:
+                    final_filename = filename
+                media = self._media_info(info, final_filename)
+                logger.info(
+                    f"Download complete: {final_filename} | Format: {media['format_id']} "
+                    f"({media['abr']} kbps) | Duration: {media['duration']}s | Size: {media['filesize']}"
+                )
+                return final_filename, media
         except Exception as e:
             logger.error(f"Download failed: {e}")
             raise e
+
+    def expand_playlist(self, url_or_bv: str, max_items: int = None) -> dict:
+        """
+        只解析不下载 (yt-dlp extract_flat): 多P视频、合集、收藏夹等展开为各条目。
+        返回 {"title", "entries": [{"source", "title", "duration"}]}，单个视频返回只含自身的一项。
+        """
+        url = self._normalize_url(url_or_bv)
+        logger.info(f"Expanding playlist: {url}")
+        ydl_opts = {
+            'extract_flat': 'in_playlist',
+            'skip_download': True,
+            'quiet': True,
+            'no_warnings': True,
+            'user_agent': USER_AGENT,
+        }
+
+        import yt_dlp
+
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=False)
+
+        entries = []
+        for entry in (info.get("entries") or []) if info.get("_type") == "playlist" else [info]:
+            source = (entry or {}).get("webpage_url") or (entry or {}).get("url")
+            if not source:
+                continue
+            if max_items and len(entries) >= max_items:
+                logger.warning(f"Playlist truncated to {max_items} items: {url}")
+                break
+            entries.append({"source": source, "title": entry.get("title"), "duration": entry.get("duration")})
+        logger.info(f"Playlist expanded: {info.get('title')} | {len(entries)} items")
+        return {"title": info.get("title"), "entries": entries}
+
+    @staticmethod
+    def _normalize_url(url_or_bv: str) -> str:
+        # BV 号等非 URL 输入补全为视频页地址
+        if not url_or_bv.startswith("http"):
+            return f"https://www.bilibili.com/video/{url_or_bv}"
+        return url_or_bv
+
+    def _native_audio_selector(self, ctx):
+        """yt-dlp format 选择回调: 优先最小的合格纯音频流，否则回退到最小的音视频合流"""
+        formats = ctx["formats"]
+        chosen = select_audio_format(formats, self.min_audio_kbps)
+        if chosen is None:
+            muxed = [f for f in formats if f.get("acodec") not in (None, "none")]
+            chosen = min(muxed, key=lambda f: (_format_size(f) or float("inf"), f.get("tbr") or 0)) if muxed else None
+        if chosen is not None:
+            yield chosen
+
+    @staticmethod
+    def _media_info(info: dict, file_path: str) -> dict:
+        requested = (info.get("requested_downloads") or [{}])[0]
+        size = os.path.getsize(file_path) if os.path.exists(file_path) else None
+        return {
+            "id": info.get("id"),
+            "title": info.get("title"),
+            "duration": info.get("duration"),
+            "filesize": size or requested.get("filesize") or requested.get("filesize_approx"),
+            "format_id": requested.get("format_id") or info.get("format_id"),
+            "abr": requested.get("abr") or info.get("abr"),
+            "ext": os.path.splitext(file_path)[1].lstrip("."),
+            "webpage_url": info.get("webpage_url"),
+        }
@@ -0,0 +1,137 @@
+import time
+import asyncio
+import threading
+from typing import Dict, List, Tuple
+
+TERMINAL_EVENTS = ("succeeded", "failed")
+PRUNE_INTERVAL_SECONDS = 60
+# 订阅者两次读取之间的最大间隔 (长轮询 / WebSocket 的单次等待不超过 60 秒)
+SUBSCRIBER_IDLE_SECONDS = 65
+
+
+class _Channel:
+    def __init__(self):
+        self.events: List[Tuple[str, object]] = []
+        self.closed = False
+        self.closed_at = 0.0
+
+
+class TaskEventBus:
+    """
+    进程内任务事件总线。
+    每个任务维护一个只追加的事件列表，订阅者用游标 (已读事件数) 增量读取，
+    因此晚到的订阅者也能回放完整的阶段变化与摘要增量。
+    任务结束后的事件保留 retention_seconds 秒，由后台线程每 prune_interval 秒清理一次。
+    同步订阅者 (线程) 用 read 阻塞等待；协程订阅者 (WebSocket / 长轮询) 用 aread，不占用线程池。
+    """
+
+    def __init__(self, retention_seconds: int = 600, prune_interval: float = PRUNE_INTERVAL_SECONDS):
+        self.retention_seconds = retention_seconds
+        self._channels: Dict[str, _Channel] = {}
+        self._cond = threading.Condition()
+        # task_id -> [(event loop, future)]，有新事件时跨线程唤醒
+        self._async_waiters: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]] = {}
+        # task_id -> 正在等待的同步订阅者数 / 最近一次读取的时间
+        self._readers: Dict[str, int] = {}
+        self._last_read: Dict[str, float] = {}
+        self._pruner = threading.Thread(
+            target=self._prune_loop, args=(prune_interval,), name="event-bus-prune", daemon=True
+        )
+        self._pruner.start()
+
+    def publish(self, task_id: str, event: str, data=None):
+        with self._cond:
+            channel = self._channels.setdefault(task_id, _Channel())
+            channel.events.append((event, data))
+            if event in TERMINAL_EVENTS:
+                channel.closed = True
+                channel.closed_at = time.time()
+            self._cond.notify_all()
+            waiters = self._async_waiters.pop(task_id, [])
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    def read(self, task_id: str, cursor: int = 0, timeout: float = None):
+        """
+        读取 cursor 之后的事件，没有新事件时最多阻塞 timeout 秒。
+        返回 (events, new_cursor, closed)
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            self._readers[task_id] = self._readers.get(task_id, 0) + 1
+            try:
+                while True:
+                    channel = self._channels.get(task_id)
+                    if channel and (len(channel.events) > cursor or channel.closed):
+                        return channel.events[cursor:], len(channel.events), channel.closed
+                    remaining = None if deadline is None else deadline - time.time()
+                    if remaining is not None and remaining <= 0:
+                        return [], cursor, False
+                    self._cond.wait(remaining)
+            finally:
+                self._readers[task_id] -= 1
+                if not self._readers[task_id]:
+                    del self._readers[task_id]
+                self._last_read[task_id] = time.time()
+
+    async def aread(self, task_id: str, cursor: int = 0, timeout: float = None):
+        """read 的协程版本，返回 (events, new_cursor, closed)"""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            with self._cond:
+                self._last_read[task_id] = time.time()
+                channel = self._channels.get(task_id)
+                if channel and (len(channel.events) > cursor or channel.closed):
+                    return channel.events[cursor:], len(channel.events), channel.closed
+                future = loop.create_future()
+                self._async_waiters.setdefault(task_id, []).append((loop, future))
+            remaining = None if deadline is None else deadline - loop.time()
+            try:
+                if remaining is not None and remaining <= 0:
+                    raise asyncio.TimeoutError
+                await asyncio.wait_for(future, remaining)
+            except asyncio.TimeoutError:
+                self._discard_waiter(task_id, future)
+                return [], cursor, False
+            except BaseException:
+                self._discard_waiter(task_id, future)
+                raise
+
+    def has_subscribers(self, task_id: str) -> bool:
+        """是否有订阅者正在等待该任务的事件，或在 SUBSCRIBER_IDLE_SECONDS 内读取过 (长轮询的两次请求之间)"""
+        with self._cond:
+            if self._readers.get(task_id) or self._async_waiters.get(task_id):
+                return True
+            return time.time() - self._last_read.get(task_id, 0.0) < SUBSCRIBER_IDLE_SECONDS
+
+    def _discard_waiter(self, task_id: str, future: asyncio.Future):
+        with self._cond:
+            waiters = self._async_waiters.get(task_id)
+            if waiters:
+                waiters[:] = [w for w in waiters if w[1] is not future]
+                if not waiters:
+                    del self._async_waiters[task_id]
+
+    def _prune_loop(self, interval: float):
+        while True:
+            time.sleep(interval)
+            with self._cond:
+                self._prune()
+
+    def _prune(self):
+        """持锁调用: 删除已结束超过 retention_seconds 的任务事件与过期的读取记录"""
+        now = time.time()
+        expired = [
+            task_id for task_id, ch in self._channels.items()
+            if ch.closed and now - ch.closed_at > self.retention_seconds
+        ]
+        for task_id in expired:
+            del self._channels[task_id]
+        for task_id in [t for t, at in self._last_read.items() if now - at > SUBSCRIBER_IDLE_SECONDS]:
+            del self._last_read[task_id]
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
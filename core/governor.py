@@ -0,0 +1,215 @@
+import time
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from utils.logger import get_logger
+from utils.config import settings
+
+logger = get_logger("Governor")
+
+# 被限流时并发上限与请求速率的缩减系数 (AIMD 的乘性减)
+DECREASE_FACTOR = 0.5
+# 每次成功调用恢复的速率 (占配置速率的比例) 与速率下限
+RATE_STEP = 0.05
+MIN_RATE_FRACTION = 0.05
+# 没有 Retry-After 时暂停放行的上限 (秒)
+MAX_PAUSE_SECONDS = 60.0
+# 协程等待并发名额时的重试间隔 (秒)
+ASYNC_WAIT_SECONDS = 0.05
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 头 (秒数或 HTTP 日期)，无法解析时返回 None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+class TokenBucket:
+    """令牌桶: 每秒补充 rate 个令牌，最多积累 burst 个。rate <= 0 表示不限速。由调用方加锁"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def take(self, now: float) -> float:
+        """取一个令牌。成功返回 0，令牌不足时返回还需等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def drain(self, now: float):
+        """清空令牌 (被限流后不再放出积攒的突发量)"""
+        self.tokens = 0.0
+        self.updated = now
+
+
+class EndpointGovernor:
+    """
+    单个 DashScope 接口的客户端流控:
+    - 令牌桶限制请求速率，AIMD 并发上限限制在途请求数:
+      每次成功调用并发上限加 1/limit (约每轮加 1)、速率加 RATE_STEP 倍配置速率，直到配置值；
+      被限流时两者都乘以 DECREASE_FACTOR，同一轮发出的请求被限流只缩减一次
+    - 被限流后在 Retry-After (缺省时按连续限流次数指数退避) 之前暂停放行，并清空令牌桶
+    acquire / aacquire 返回放行时刻，请求结束后连同结果传给 release。
+    """
+
+    def __init__(self, name: str, rate: float, burst: float, max_concurrency: int, min_concurrency: int = 1):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.max_rate = rate
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.consecutive_throttles = 0
+        self._cond = threading.Condition()
+        self._stats = {"requests": 0, "throttled": 0, "errors": 0, "decreases": 0, "waited_seconds": 0.0}
+
+    def _try_acquire(self, now: float) -> Optional[float]:
+        """持锁调用: 放行返回 0；暂停或令牌不足时返回需等待的秒数；并发已满返回 None (等待 release)"""
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.in_flight >= int(self.limit):
+            return None
+        wait = self.bucket.take(now)
+        if wait:
+            return wait
+        self.in_flight += 1
+        self._stats["requests"] += 1
+        return 0.0
+
+    def acquire(self) -> float:
+        """阻塞直到可以发出请求"""
+        started = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                wait = self._try_acquire(now)
+                if wait == 0:
+                    self._stats["waited_seconds"] += now - started
+                    return now
+                self._cond.wait(wait)
+
+    async def aacquire(self) -> float:
+        """acquire 的协程版本，等待时不阻塞事件循环"""
+        started = time.monotonic()
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                wait = self._try_acquire(now)
+                if wait == 0:
+                    self._stats["waited_seconds"] += now - started
+                    return now
+            await asyncio.sleep(ASYNC_WAIT_SECONDS if wait is None else wait)
+
+    def release(self, ticket: float, throttled: bool = False, retry_after: float = None, error: bool = False):
+        """
+        请求结束。throttled 表示被限流 (429 / Throttling.*)，retry_after 为服务端要求的等待秒数；
+        error 表示 5xx 或连接错误 (不调整并发上限)。
+        """
+        with self._cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            now = time.monotonic()
+            if throttled:
+                self._stats["throttled"] += 1
+                self.consecutive_throttles += 1
+                if ticket >= self.last_decrease:
+                    self.limit = max(float(self.min_concurrency), self.limit * DECREASE_FACTOR)
+                    if self.max_rate > 0:
+                        self.bucket.rate = max(self.max_rate * MIN_RATE_FRACTION, self.bucket.rate * DECREASE_FACTOR)
+                    self.last_decrease = now
+                    self._stats["decreases"] += 1
+                if retry_after is None:
+                    retry_after = min(
+                        MAX_PAUSE_SECONDS,
+                        settings.DASHSCOPE_THROTTLE_BACKOFF * (2 ** (self.consecutive_throttles - 1)),
+                    )
+                self.paused_until = max(self.paused_until, now + retry_after)
+                self.bucket.drain(now)
+                logger.warning(
+                    f"DashScope {self.name} throttled, concurrency limit {self.limit:.1f}, "
+                    f"rate {self.bucket.rate:.2f}/s, pausing {retry_after:.1f}s"
+                )
+            elif error:
+                self._stats["errors"] += 1
+            else:
+                self.consecutive_throttles = 0
+                self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+                if self.max_rate > 0:
+                    self.bucket.rate = min(self.max_rate, self.bucket.rate + self.max_rate * RATE_STEP)
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update(
+                limit=round(self.limit, 2),
+                max_concurrency=self.max_concurrency,
+                in_flight=self.in_flight,
+                rate=round(self.bucket.rate, 3),
+                max_rate=self.max_rate,
+                paused_seconds=round(max(0.0, self.paused_until - time.monotonic()), 3),
+            )
+        stats["waited_seconds"] = round(stats["waited_seconds"], 3)
+        return stats
+
+
+class DashScopeGovernor:
+    """按接口 (asr_submit / asr_poll / chat) 划分的 DashScope 流控，进程内共享"""
+
+    ENDPOINTS = ("asr_submit", "asr_poll", "chat")
+
+    def __init__(self):
+        self.enabled = settings.DASHSCOPE_GOVERNOR_ENABLED
+        self.endpoints: Dict[str, EndpointGovernor] = {}
+        for name in self.ENDPOINTS:
+            rate = settings.DASHSCOPE_RATE_LIMITS.get(name, 0)
+            self.endpoints[name] = EndpointGovernor(
+                name,
+                rate=rate,
+                burst=max(1.0, rate * settings.DASHSCOPE_BURST_SECONDS),
+                max_concurrency=settings.DASHSCOPE_MAX_CONCURRENCY.get(name, 8),
+                min_concurrency=settings.DASHSCOPE_MIN_CONCURRENCY,
+            )
+
+    def endpoint(self, name: Optional[str]) -> Optional[EndpointGovernor]:
+        if not self.enabled or not name:
+            return None
+        return self.endpoints.get(name)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "endpoints": {name: gate.stats() for name, gate in self.endpoints.items()},
+        }
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_governor() -> DashScopeGovernor:
+    """进程内共享的 DashScope 流控"""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = DashScopeGovernor()
+        return _governor
@@ -0,0 +1,248 @@
+import time
+import random
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import Optional, Tuple
+import httpx
+from .governor import get_governor, parse_retry_after
+from utils.logger import get_logger
+from utils.config import settings
+
+logger = get_logger("HTTPClient")
+
+RETRY_STATUS_MIN = 500
+THROTTLE_STATUS = 429
+# DashScope 在部分接口上以 400 / 503 + Throttling.* 错误码表示限流
+THROTTLE_CODE_STATUS = (400, 403, 503)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+# 请求尚未发出的错误，非幂等请求也可以安全重试
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def throttle_info(resp: httpx.Response) -> Tuple[bool, Optional[float]]:
+    """判断响应是否为限流，返回 (是否限流, Retry-After 秒数)。响应体需已读取"""
+    throttled = resp.status_code == THROTTLE_STATUS
+    if not throttled and resp.status_code in THROTTLE_CODE_STATUS:
+        try:
+            data = resp.json()
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            code = data.get("code") or (data.get("error") or {}).get("code") or ""
+            throttled = str(code).startswith("Throttling")
+    return throttled, parse_retry_after(resp.headers.get("Retry-After")) if throttled else None
+
+
+class PooledHTTP:
+    """
+    DashScope 流量共享的连接池客户端 (同步 + 异步各一个 httpx 客户端)。
+    - keep-alive 连接复用，可选 HTTP/2
+    - 可配置的连接 / 读取超时
+    - 对 5xx 与连接错误做有限次数的抖动退避重试；非幂等请求 (POST 等) 默认只在请求未发出 (建连失败) 时重试，
+      避免重复提交 ASR 任务 / 重复计费的对话请求，调用方可用 idempotent=True 显式开启
+    - 指定 endpoint 时经过 DashScope 流控 (core.governor): 按接口限速限并发，被限流时等待 Retry-After 后重试
+    - 通过 httpx trace 扩展统计新建连接数，用于确认握手开销是否消除
+    """
+
+    def __init__(self):
+        http2 = settings.HTTP_HTTP2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("HTTP/2 requested but 'h2' is not installed, falling back to HTTP/1.1")
+                http2 = False
+        self.http2 = http2
+        timeout = httpx.Timeout(settings.HTTP_READ_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT)
+        limits = httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        )
+        self.client = httpx.Client(http2=http2, timeout=timeout, limits=limits)
+        self._async_client = None
+        self._async_args = dict(http2=http2, timeout=timeout, limits=limits)
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "new_connections": 0, "retries": 0, "errors": 0, "throttled": 0}
+
+    # ---- sync ----
+
+    def request(self, method: str, url: str, retries: int = None, endpoint: str = None,
+                throttle_retries: int = None, idempotent: bool = None, **kwargs) -> httpx.Response:
+        """
+        endpoint 为 DashScope 接口名 (asr_submit / asr_poll / chat) 时经过流控；
+        被限流的请求最多重试 throttle_retries 次 (不计入 retries)，等待时间由流控按 Retry-After 决定。
+        idempotent 默认按 HTTP 方法判断，为 False 时 5xx 与已发出请求的传输错误不重试。
+        """
+        retries = settings.HTTP_MAX_RETRIES if retries is None else retries
+        throttle_retries = settings.DASHSCOPE_THROTTLE_RETRIES if throttle_retries is None else throttle_retries
+        idempotent = method.upper() in IDEMPOTENT_METHODS if idempotent is None else idempotent
+        gate = get_governor().endpoint(endpoint)
+        kwargs.setdefault("extensions", {})["trace"] = self._trace
+        attempt = throttles = 0
+        while True:
+            self._incr("requests")
+            ticket = gate.acquire() if gate else None
+            settled = False
+            try:
+                resp = self.client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                self._incr("errors")
+                if gate:
+                    settled = True
+                    gate.release(ticket, error=True)
+                if attempt >= retries or not (idempotent or isinstance(e, UNSENT_ERRORS)):
+                    raise
+                reason = f"{type(e).__name__}: {e}"
+            else:
+                settled = True
+                if gate and self._settle(gate, ticket, resp) and throttles < throttle_retries:
+                    throttles += 1
+                    logger.warning(f"{method} {url} throttled, retry {throttles}/{throttle_retries}")
+                    continue
+                if resp.status_code < RETRY_STATUS_MIN or attempt >= retries or not idempotent:
+                    return resp
+                reason = f"status {resp.status_code}"
+            finally:
+                # 其它异常 (TooManyRedirects / InvalidURL / KeyboardInterrupt 等) 也要归还流控名额
+                if gate and not settled:
+                    gate.release(ticket, error=True)
+            attempt += 1
+            self._incr("retries")
+            delay = self._backoff(attempt)
+            logger.warning(f"{method} {url} failed ({reason}), retry {attempt}/{retries} in {delay:.2f}s")
+            time.sleep(delay)
+
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("POST", url, **kwargs)
+
+    @contextmanager
+    def stream(self, method: str, url: str, endpoint: str = None, **kwargs):
+        """
+        流式请求。响应体边到边读，无法重放，因此只在开始读取之前对限流做重试。
+        经过流控时整个流式读取期间都占用一个并发名额。
+        """
+        gate = get_governor().endpoint(endpoint)
+        kwargs.setdefault("extensions", {})["trace"] = self._trace
+        throttles = 0
+        while True:
+            self._incr("requests")
+            ticket = gate.acquire() if gate else None
+            settled = False
+            try:
+                with self.client.stream(method, url, **kwargs) as resp:
+                    if gate and resp.status_code != 200:
+                        resp.read()
+                        settled = True
+                        if self._settle(gate, ticket, resp) and throttles < settings.DASHSCOPE_THROTTLE_RETRIES:
+                            throttles += 1
+                            logger.warning(f"{method} {url} throttled, retry {throttles}/{settings.DASHSCOPE_THROTTLE_RETRIES}")
+                            continue
+                    yield resp
+                    return
+            except httpx.TransportError:
+                if gate and not settled:
+                    settled = True
+                    gate.release(ticket, error=True)
+                raise
+            finally:
+                if gate and not settled:
+                    gate.release(ticket)
+
+    # ---- async ----
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        # AsyncClient 绑定到首次使用它的事件循环 (ASR 轮询线程)
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(**self._async_args)
+        return self._async_client
+
+    async def arequest(self, method: str, url: str, retries: int = None, endpoint: str = None,
+                       throttle_retries: int = None, idempotent: bool = None, **kwargs) -> httpx.Response:
+        retries = settings.HTTP_MAX_RETRIES if retries is None else retries
+        throttle_retries = settings.DASHSCOPE_THROTTLE_RETRIES if throttle_retries is None else throttle_retries
+        idempotent = method.upper() in IDEMPOTENT_METHODS if idempotent is None else idempotent
+        gate = get_governor().endpoint(endpoint)
+        kwargs.setdefault("extensions", {})["trace"] = self._atrace
+        attempt = throttles = 0
+        while True:
+            self._incr("requests")
+            ticket = await gate.aacquire() if gate else None
+            settled = False
+            try:
+                resp = await self.async_client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                self._incr("errors")
+                if gate:
+                    settled = True
+                    gate.release(ticket, error=True)
+                if attempt >= retries or not (idempotent or isinstance(e, UNSENT_ERRORS)):
+                    raise
+            else:
+                settled = True
+                if gate and self._settle(gate, ticket, resp) and throttles < throttle_retries:
+                    throttles += 1
+                    continue
+                if resp.status_code < RETRY_STATUS_MIN or attempt >= retries or not idempotent:
+                    return resp
+            finally:
+                # 包括 CancelledError (轮询协程被取消)
+                if gate and not settled:
+                    gate.release(ticket, error=True)
+            attempt += 1
+            self._incr("retries")
+            await asyncio.sleep(self._backoff(attempt))
+
+    # ---- stats ----
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        requests = stats["requests"]
+        stats["reused_connections"] = max(0, requests - stats["new_connections"])
+        stats["reuse_ratio"] = round(stats["reused_connections"] / requests, 4) if requests else 0.0
+        stats["http2"] = self.http2
+        return stats
+
+    def _settle(self, gate, ticket: float, resp: httpx.Response) -> bool:
+        """把请求结果交给流控，返回是否被限流"""
+        throttled, retry_after = throttle_info(resp)
+        if throttled:
+            self._incr("throttled")
+        gate.release(ticket, throttled=throttled, retry_after=retry_after,
+                     error=not throttled and resp.status_code >= RETRY_STATUS_MIN)
+        return throttled
+
+    def _incr(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _trace(self, event_name: str, info: dict):
+        if event_name == "connection.connect_tcp.complete":
+            self._incr("new_connections")
+
+    async def _atrace(self, event_name: str, info: dict):
+        self._trace(event_name, info)
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        base = settings.HTTP_RETRY_BACKOFF * (2 ** (attempt - 1))
+        return base * random.uniform(0.5, 1.5)
+
+
+_http = None
+_http_lock = threading.Lock()
+
+
+def get_http() -> PooledHTTP:
+    """进程内共享的 HTTP 客户端"""
+    global _http
+    with _http_lock:
+        if _http is None:
+            _http = PooledHTTP()
+        return _http
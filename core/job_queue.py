@@ -0,0 +1,581 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional
+from utils.logger import get_logger
+
+logger = get_logger("JobQueue")
+
+# 租约过期后重新投递前已尝试次数达到上限时给出的错误
+LOST_ERROR = "Worker lost {attempts} times while running the job"
+# 每次取出的事件数上限
+EVENT_BATCH = 500
+
+
+def _dumps(data) -> str:
+    return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class JobQueue(ABC):
+    """
+    API 进程与 worker 进程之间的任务队列接口。
+    - API 进程 enqueue 任务；相同 dedup_key 的在途任务合并，合并的 task_id 共享同一份事件与结果
+    - worker 通过 lease 租用任务，执行期间用 heartbeat 续租，结束时 finish；
+      租约过期 (worker 崩溃 / 失联) 的任务由 requeue_expired 重新投递，尝试 max_attempts 次后判定失败
+    - worker 用 publish 回传阶段 / 进度 / 摘要增量等事件，API 进程用 pop_events 取出
+      (事件为 (job_id, task_ids, event, data)，event 为 status / succeeded / failed 或 JobScheduler 的事件类型)
+    """
+
+    @abstractmethod
+    def enqueue(self, task_id: str, dedup_key: str, payload: dict, priority: int) -> str:
+        """入队并返回执行该任务的 job_id (被合并时为在途任务的 id)"""
+        ...
+
+    @abstractmethod
+    def lease(self, worker_id: str, lease_seconds: float) -> Optional[dict]:
+        """租用优先级最高的排队任务，返回 {"job_id", "payload", "priority", "attempts"}，没有任务时返回 None"""
+        ...
+
+    @abstractmethod
+    def heartbeat(self, job_ids: List[str], worker_id: str, lease_seconds: float) -> List[str]:
+        """为本 worker 持有的任务续租，返回已失去租约的 job_id"""
+        ...
+
+    @abstractmethod
+    def finish(self, job_id: str, worker_id: str, event: str, data) -> bool:
+        """任务结束 (event 为 succeeded / failed)。租约已被收回时返回 False，结果被丢弃"""
+        ...
+
+    @abstractmethod
+    def publish(self, job_id: str, event: str, data):
+        ...
+
+    @abstractmethod
+    def pop_events(self, limit: int = EVENT_BATCH) -> list:
+        """取出并删除待处理的事件，只应有一个消费者 (API 进程)"""
+        ...
+
+    @abstractmethod
+    def requeue_expired(self) -> int:
+        """重新投递租约已过期的任务，返回处理的任务数"""
+        ...
+
+    @abstractmethod
+    def describe(self, task_id: str) -> Optional[dict]:
+        """返回任务在队列中的状态 ({"job_id", "stage", "worker", "attempts", "queue_position"})，不在队列中返回 None"""
+        ...
+
+    @abstractmethod
+    def stats(self) -> dict:
+        ...
+
+
+class SQLiteJobQueue(JobQueue):
+    """
+    SQLite 任务队列 (同一台机器上的多个进程共享一个数据库文件):
+    - jobs 表保存排队中 / 已租用的任务，结束的任务直接删除
+    - events 表按自增 id 保存 worker 回传的事件，API 进程取出后删除
+    - 租用 / 结束等读改写操作在 BEGIN IMMEDIATE 事务中完成，多个 worker 不会租到同一任务
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        job_id TEXT PRIMARY KEY,
+        dedup_key TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        priority INTEGER NOT NULL,
+        task_ids TEXT NOT NULL,
+        state TEXT NOT NULL,
+        worker TEXT,
+        lease_until REAL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs(state, priority, created_at);
+    CREATE INDEX IF NOT EXISTS idx_jobs_dedup ON jobs(dedup_key);
+    CREATE TABLE IF NOT EXISTS events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        job_id TEXT NOT NULL,
+        task_ids TEXT NOT NULL,
+        event TEXT NOT NULL,
+        data TEXT
+    );
+    """
+
+    def __init__(self, db_path: str, max_attempts: int):
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.max_attempts = max(1, max_attempts)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+
+    def _transaction(self, work: Callable):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                value = work(self._conn)
+                self._conn.execute("COMMIT")
+                return value
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def enqueue(self, task_id, dedup_key, payload, priority):
+        def work(conn):
+            row = conn.execute(
+                "SELECT job_id, task_ids, priority, state FROM jobs WHERE dedup_key = ? OR job_id = ? LIMIT 1",
+                (dedup_key, task_id),
+            ).fetchone()
+            if row:
+                job_id, task_ids, old_priority, state = row
+                task_ids = json.loads(task_ids)
+                if task_id not in task_ids:
+                    task_ids.append(task_id)
+                    logger.info(f"Collapsed task {task_id} into queued job {job_id}")
+                # 交互式请求提升排队中的批量任务
+                new_priority = min(priority, old_priority) if state == "queued" else old_priority
+                conn.execute(
+                    "UPDATE jobs SET task_ids = ?, priority = ? WHERE job_id = ?",
+                    (json.dumps(task_ids), new_priority, job_id),
+                )
+                return job_id
+            conn.execute(
+                "INSERT INTO jobs (job_id, dedup_key, payload, priority, task_ids, state, created_at) "
+                "VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+                (task_id, dedup_key, _dumps(payload), priority, json.dumps([task_id]), time.time()),
+            )
+            return task_id
+
+        return self._transaction(work)
+
+    def lease(self, worker_id, lease_seconds):
+        def work(conn):
+            row = conn.execute(
+                "SELECT job_id, payload, priority, attempts FROM jobs WHERE state = 'queued' "
+                "ORDER BY priority, created_at LIMIT 1"
+            ).fetchone()
+            if not row:
+                return None
+            conn.execute(
+                "UPDATE jobs SET state = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1 "
+                "WHERE job_id = ?",
+                (worker_id, time.time() + lease_seconds, row[0]),
+            )
+            return {"job_id": row[0], "payload": json.loads(row[1]), "priority": row[2], "attempts": row[3] + 1}
+
+        return self._transaction(work)
+
+    def heartbeat(self, job_ids, worker_id, lease_seconds):
+        lost = []
+        lease_until = time.time() + lease_seconds
+        with self._lock:
+            for job_id in job_ids:
+                cursor = self._conn.execute(
+                    "UPDATE jobs SET lease_until = ? WHERE job_id = ? AND worker = ? AND state = 'leased'",
+                    (lease_until, job_id, worker_id),
+                )
+                if cursor.rowcount == 0:
+                    lost.append(job_id)
+        return lost
+
+    def finish(self, job_id, worker_id, event, data):
+        def work(conn):
+            row = conn.execute(
+                "SELECT task_ids FROM jobs WHERE job_id = ? AND worker = ? AND state = 'leased'", (job_id, worker_id)
+            ).fetchone()
+            if not row:
+                return False
+            conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+            conn.execute(
+                "INSERT INTO events (job_id, task_ids, event, data) VALUES (?, ?, ?, ?)",
+                (job_id, row[0], event, _dumps(data)),
+            )
+            return True
+
+        return self._transaction(work)
+
+    def publish(self, job_id, event, data):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO events (job_id, task_ids, event, data) SELECT job_id, task_ids, ?, ? FROM jobs "
+                "WHERE job_id = ?",
+                (event, _dumps(data), job_id),
+            )
+
+    def pop_events(self, limit=EVENT_BATCH):
+        def work(conn):
+            rows = conn.execute(
+                "SELECT id, job_id, task_ids, event, data FROM events ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+            if rows:
+                conn.execute("DELETE FROM events WHERE id <= ?", (rows[-1][0],))
+            return rows
+
+        rows = self._transaction(work)
+        return [(r[1], json.loads(r[2]), r[3], json.loads(r[4]) if r[4] else None) for r in rows]
+
+    def requeue_expired(self):
+        def work(conn):
+            rows = conn.execute(
+                "SELECT job_id, task_ids, worker, attempts FROM jobs WHERE state = 'leased' AND lease_until < ?",
+                (time.time(),),
+            ).fetchall()
+            for job_id, task_ids, worker, attempts in rows:
+                if attempts >= self.max_attempts:
+                    logger.error(f"Job {job_id} lost by worker {worker}, giving up after {attempts} attempts")
+                    conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+                    event, data = "failed", {"error": LOST_ERROR.format(attempts=attempts)}
+                else:
+                    logger.warning(f"Lease of job {job_id} expired on worker {worker}, re-queueing")
+                    conn.execute(
+                        "UPDATE jobs SET state = 'queued', worker = NULL, lease_until = NULL WHERE job_id = ?",
+                        (job_id,),
+                    )
+                    event, data = "status", "queued"
+                conn.execute(
+                    "INSERT INTO events (job_id, task_ids, event, data) VALUES (?, ?, ?, ?)",
+                    (job_id, task_ids, event, _dumps(data)),
+                )
+            return len(rows)
+
+        return self._transaction(work)
+
+    def describe(self, task_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_id, priority, created_at, state, worker, attempts FROM jobs "
+                "WHERE job_id = ? OR task_ids LIKE ? LIMIT 1",
+                (task_id, f'%"{task_id}"%'),
+            ).fetchone()
+            if not row:
+                return None
+            job_id, priority, created_at, state, worker, attempts = row
+            position = None
+            if state == "queued":
+                position = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE state = 'queued' AND "
+                    "(priority < ? OR (priority = ? AND created_at < ?))",
+                    (priority, priority, created_at),
+                ).fetchone()[0]
+        return {"job_id": job_id, "stage": state, "worker": worker, "attempts": attempts, "queue_position": position}
+
+    def stats(self):
+        with self._lock:
+            states = dict(self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+            workers = self._conn.execute(
+                "SELECT COUNT(DISTINCT worker) FROM jobs WHERE state = 'leased'"
+            ).fetchone()[0]
+            events = self._conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "queued": states.get("queued", 0),
+            "leased": states.get("leased", 0),
+            "busy_workers": workers,
+            "pending_events": events,
+        }
+
+
+class RedisJobQueue(JobQueue):
+    """
+    Redis 任务队列 (多台机器上的 worker 共享)，需要安装 redis 包。
+    - <prefix>:job:<id> 哈希保存任务，<prefix>:queue 有序集合按 (优先级, 入队时间) 排队，
+      <prefix>:leases 有序集合按租约到期时间记录已租用的任务
+    - <prefix>:dedup / <prefix>:tasks 哈希记录 dedup_key 与 task_id 到 job_id 的映射
+    - <prefix>:events 列表保存 worker 回传的事件
+    读改写操作均为 Lua 脚本，在 Redis 中原子执行。
+    """
+
+    # 排队分数 = 优先级 * PRIORITY_SCALE + 入队时间 (毫秒)
+    PRIORITY_SCALE = 10 ** 13
+
+    ENQUEUE = """
+    local p, task_id, dedup_key = ARGV[1], ARGV[2], ARGV[3]
+    local priority, score = tonumber(ARGV[5]), tonumber(ARGV[6])
+    local job_id = redis.call('HGET', p .. ':dedup', dedup_key)
+    if not job_id or redis.call('EXISTS', p .. ':job:' .. job_id) == 0 then
+        job_id = redis.call('HGET', p .. ':tasks', task_id)
+    end
+    if job_id and redis.call('EXISTS', p .. ':job:' .. job_id) == 1 then
+        local key = p .. ':job:' .. job_id
+        local ids = cjson.decode(redis.call('HGET', key, 'task_ids'))
+        local found = false
+        for _, id in ipairs(ids) do if id == task_id then found = true end end
+        if not found then
+            table.insert(ids, task_id)
+            redis.call('HSET', key, 'task_ids', cjson.encode(ids))
+            redis.call('HSET', p .. ':tasks', task_id, job_id)
+        end
+        local old = tonumber(redis.call('HGET', key, 'priority'))
+        if redis.call('HGET', key, 'state') == 'queued' and priority < old then
+            redis.call('HSET', key, 'priority', priority)
+            redis.call('ZADD', p .. ':queue', score, job_id)
+        end
+        return job_id
+    end
+    redis.call('HSET', p .. ':job:' .. task_id, 'payload', ARGV[4], 'priority', priority, 'dedup_key', dedup_key,
+        'task_ids', cjson.encode({task_id}), 'state', 'queued', 'attempts', 0)
+    redis.call('HSET', p .. ':dedup', dedup_key, task_id)
+    redis.call('HSET', p .. ':tasks', task_id, task_id)
+    redis.call('ZADD', p .. ':queue', score, task_id)
+    return task_id
+    """
+
+    LEASE = """
+    local p, worker, lease_until = ARGV[1], ARGV[2], tonumber(ARGV[3])
+    local popped = redis.call('ZPOPMIN', p .. ':queue')
+    if #popped == 0 then return false end
+    local job_id = popped[1]
+    local key = p .. ':job:' .. job_id
+    local attempts = redis.call('HINCRBY', key, 'attempts', 1)
+    redis.call('HSET', key, 'state', 'leased', 'worker', worker)
+    redis.call('ZADD', p .. ':leases', lease_until, job_id)
+    return {job_id, redis.call('HGET', key, 'payload'), redis.call('HGET', key, 'priority'), attempts}
+    """
+
+    HEARTBEAT = """
+    local p, worker, lease_until = ARGV[1], ARGV[2], tonumber(ARGV[3])
+    local lost = {}
+    for i = 4, #ARGV do
+        local key = p .. ':job:' .. ARGV[i]
+        if redis.call('HGET', key, 'worker') == worker and redis.call('HGET', key, 'state') == 'leased' then
+            redis.call('ZADD', p .. ':leases', 'XX', lease_until, ARGV[i])
+        else
+            table.insert(lost, ARGV[i])
+        end
+    end
+    return lost
+    """
+
+    # 结束任务并推送事件: 删除任务与映射，事件中带上合并的全部 task_id
+    FINISH = """
+    local p, job_id, worker, event, data = ARGV[1], ARGV[2], ARGV[3], ARGV[4], ARGV[5]
+    local key = p .. ':job:' .. job_id
+    if worker ~= '' and (redis.call('HGET', key, 'worker') ~= worker or redis.call('HGET', key, 'state') ~= 'leased') then
+        return 0
+    end
+    local task_ids = redis.call('HGET', key, 'task_ids')
+    if not task_ids then return 0 end
+    local dedup_key = redis.call('HGET', key, 'dedup_key')
+    if redis.call('HGET', p .. ':dedup', dedup_key) == job_id then redis.call('HDEL', p .. ':dedup', dedup_key) end
+    for _, id in ipairs(cjson.decode(task_ids)) do redis.call('HDEL', p .. ':tasks', id) end
+    redis.call('DEL', key)
+    redis.call('ZREM', p .. ':leases', job_id)
+    redis.call('ZREM', p .. ':queue', job_id)
+    redis.call('RPUSH', p .. ':events',
+        '{"job_id":' .. cjson.encode(job_id) .. ',"task_ids":' .. task_ids .. ',"event":' .. cjson.encode(event) ..
+        ',"data":' .. data .. '}')
+    return 1
+    """
+
+    PUBLISH = """
+    local p, job_id, event, data = ARGV[1], ARGV[2], ARGV[3], ARGV[4]
+    local task_ids = redis.call('HGET', p .. ':job:' .. job_id, 'task_ids')
+    if not task_ids then return 0 end
+    redis.call('RPUSH', p .. ':events',
+        '{"job_id":' .. cjson.encode(job_id) .. ',"task_ids":' .. task_ids .. ',"event":' .. cjson.encode(event) ..
+        ',"data":' .. data .. '}')
+    return 1
+    """
+
+    # 把一个过期租约放回队列 (返回 1)；尝试次数已用完返回 0 (由调用方以 FINISH 判定失败)；租约未过期返回 -1
+    REQUEUE = """
+    local p, job_id, now, max_attempts = ARGV[1], ARGV[2], tonumber(ARGV[3]), tonumber(ARGV[4])
+    local lease_until = redis.call('ZSCORE', p .. ':leases', job_id)
+    if not lease_until or tonumber(lease_until) >= now then return -1 end
+    local key = p .. ':job:' .. job_id
+    if tonumber(redis.call('HGET', key, 'attempts') or 0) >= max_attempts then return 0 end
+    redis.call('ZREM', p .. ':leases', job_id)
+    redis.call('HSET', key, 'state', 'queued', 'worker', '')
+    local priority = tonumber(redis.call('HGET', key, 'priority'))
+    redis.call('ZADD', p .. ':queue', priority * tonumber(ARGV[5]) + math.floor(now * 1000), job_id)
+    local task_ids = redis.call('HGET', key, 'task_ids')
+    redis.call('RPUSH', p .. ':events',
+        '{"job_id":' .. cjson.encode(job_id) .. ',"task_ids":' .. task_ids .. ',"event":"status","data":"queued"}')
+    return 1
+    """
+
+    def __init__(self, url: str, prefix: str, max_attempts: int):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("JOB_QUEUE_BACKEND=redis requires the 'redis' package (pip install redis)")
+        self.prefix = prefix
+        self.max_attempts = max(1, max_attempts)
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._scripts = {
+            name: self._redis.register_script(getattr(self, name))
+            for name in ("ENQUEUE", "LEASE", "HEARTBEAT", "FINISH", "PUBLISH", "REQUEUE")
+        }
+
+    def _run(self, name: str, *args):
+        return self._scripts[name](args=[self.prefix, *args])
+
+    def enqueue(self, task_id, dedup_key, payload, priority):
+        score = priority * self.PRIORITY_SCALE + int(time.time() * 1000)
+        job_id = self._run("ENQUEUE", task_id, dedup_key, _dumps(payload), priority, score)
+        if job_id != task_id:
+            logger.info(f"Collapsed task {task_id} into queued job {job_id}")
+        return job_id
+
+    def lease(self, worker_id, lease_seconds):
+        row = self._run("LEASE", worker_id, time.time() + lease_seconds)
+        if not row:
+            return None
+        return {"job_id": row[0], "payload": json.loads(row[1]), "priority": int(row[2]), "attempts": int(row[3])}
+
+    def heartbeat(self, job_ids, worker_id, lease_seconds):
+        if not job_ids:
+            return []
+        return list(self._run("HEARTBEAT", worker_id, time.time() + lease_seconds, *job_ids))
+
+    def finish(self, job_id, worker_id, event, data):
+        return bool(self._run("FINISH", job_id, worker_id, event, _dumps(data)))
+
+    def publish(self, job_id, event, data):
+        self._run("PUBLISH", job_id, event, _dumps(data))
+
+    def pop_events(self, limit=EVENT_BATCH):
+        key = f"{self.prefix}:events"
+        with self._redis.pipeline(transaction=True) as pipe:
+            pipe.lrange(key, 0, limit - 1)
+            pipe.ltrim(key, limit, -1)
+            rows, _ = pipe.execute()
+        events = []
+        for row in rows:
+            item = json.loads(row)
+            events.append((item["job_id"], item["task_ids"], item["event"], item["data"]))
+        return events
+
+    def requeue_expired(self):
+        now = time.time()
+        expired = self._redis.zrangebyscore(f"{self.prefix}:leases", "-inf", now)
+        count = 0
+        for job_id in expired:
+            requeued = self._run("REQUEUE", job_id, now, self.max_attempts, self.PRIORITY_SCALE)
+            if requeued == 1:
+                logger.warning(f"Lease of job {job_id} expired, re-queueing")
+            elif requeued == 0:
+                attempts = self._redis.hget(f"{self.prefix}:job:{job_id}", "attempts")
+                logger.error(f"Job {job_id} lost by its worker, giving up after {attempts} attempts")
+                self._run("FINISH", job_id, "", "failed", _dumps({"error": LOST_ERROR.format(attempts=attempts)}))
+            else:
+                continue
+            count += 1
+        return count
+
+    def describe(self, task_id):
+        job_id = self._redis.hget(f"{self.prefix}:tasks", task_id)
+        if not job_id:
+            return None
+        job = self._redis.hgetall(f"{self.prefix}:job:{job_id}")
+        if not job:
+            return None
+        position = self._redis.zrank(f"{self.prefix}:queue", job_id) if job["state"] == "queued" else None
+        return {
+            "job_id": job_id,
+            "stage": job["state"],
+            "worker": job.get("worker") or None,
+            "attempts": int(job["attempts"]),
+            "queue_position": position,
+        }
+
+    def stats(self):
+        with self._redis.pipeline(transaction=False) as pipe:
+            pipe.zcard(f"{self.prefix}:queue")
+            pipe.zcard(f"{self.prefix}:leases")
+            pipe.llen(f"{self.prefix}:events")
+            queued, leased, events = pipe.execute()
+        return {"backend": "redis", "queued": queued, "leased": leased, "pending_events": events}
+
+
+class QueueRelay:
+    """
+    API 进程中的事件中继: 后台线程不断取出 worker 回传的事件，按 task_id 交给
+    listener(task_id, status, result, error) / event_sink(task_id, event, data) (与 JobScheduler 的回调相同)，
+    并定期重新投递租约过期的任务。同时记录各任务最近的阶段，供 /status 展示。
+    """
+
+    def __init__(self, queue: JobQueue, listener: Callable, event_sink: Callable,
+                 poll_interval: float, requeue_interval: float):
+        self.queue = queue
+        self.listener = listener
+        self.event_sink = event_sink
+        self.poll_interval = poll_interval
+        self.requeue_interval = requeue_interval
+        self._stages: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """先同步处理 API 进程停止期间积压的事件 (避免把已完成的任务当作未完成重新入队)，再启动后台线程"""
+        if self._thread is not None:
+            return
+        try:
+            while self._pump() >= EVENT_BATCH:
+                pass
+        except Exception as e:
+            logger.error(f"Job queue relay error: {e}")
+        self._thread = threading.Thread(target=self._loop, name="queue-relay", daemon=True)
+        self._thread.start()
+
+    def describe(self, task_id: str) -> Optional[dict]:
+        info = self.queue.describe(task_id)
+        if info and info["stage"] == "leased":
+            with self._lock:
+                info["stage"] = self._stages.get(task_id, "starting")
+        return info
+
+    def _pump(self) -> int:
+        events = self.queue.pop_events()
+        for job_id, task_ids, event, data in events:
+            for task_id in task_ids:
+                self._dispatch(task_id, event, data)
+        return len(events)
+
+    def _loop(self):
+        last_requeue = 0.0
+        while True:
+            try:
+                if time.time() - last_requeue >= self.requeue_interval:
+                    last_requeue = time.time()
+                    self.queue.requeue_expired()
+                count = self._pump()
+            except Exception as e:
+                logger.error(f"Job queue relay error: {e}")
+                count = 0
+            if count < EVENT_BATCH:
+                time.sleep(self.poll_interval)
+
+    def _dispatch(self, task_id: str, event: str, data):
+        with self._lock:
+            if event == "stage":
+                self._stages[task_id] = data
+            elif event in ("succeeded", "failed", "status"):
+                self._stages.pop(task_id, None)
+        try:
+            if event == "succeeded":
+                self.listener(task_id, "succeeded", data, None)
+            elif event == "failed":
+                self.listener(task_id, "failed", None, (data or {}).get("error"))
+            elif event == "status":
+                self.listener(task_id, data, None, None)
+            else:
+                self.event_sink(task_id, event, data)
+        except Exception as e:
+            logger.error(f"Relay callback error for {task_id} ({event}): {e}")
+
+
+def create_job_queue(settings) -> Optional[JobQueue]:
+    """JOB_QUEUE_BACKEND=local (默认) 时任务在 API 进程内执行，返回 None"""
+    if settings.JOB_QUEUE_BACKEND == "sqlite":
+        return SQLiteJobQueue(settings.JOB_QUEUE_DB_PATH, settings.JOB_MAX_ATTEMPTS)
+    if settings.JOB_QUEUE_BACKEND == "redis":
+        return RedisJobQueue(settings.JOB_QUEUE_REDIS_URL, settings.JOB_QUEUE_REDIS_PREFIX, settings.JOB_MAX_ATTEMPTS)
+    return None
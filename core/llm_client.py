@@ -1,44 +1,112 @@
 import json
-import os
-import requests
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+from .http_client import get_http
 from utils.logger import get_logger
-from utils.config import settings
+from utils.config import settings, require_settings
+from utils.helpers import estimate_tokens
+from utils.presets import load_presets
 
 logger = get_logger("LLMClient")
 
+# 分块 (map) 阶段的系统提示词: 每块只提取要点，最终结果在 reduce 阶段按原预设生成
+MAP_SYSTEM_PROMPT = (
+    "你正在处理一段长转录文本中的第 {index}/{total} 部分。"
+    "请提取本部分的关键信息、观点、数据与结论，保留原文中的 [HH:MM:SS] 时间点，"
+    "输出简洁的要点列表，供后续与其它部分合并生成最终结果。\n\n"
+    "最终结果的要求如下，仅供参考：\n{system}"
+)
+REDUCE_HEADER = "以下是按时间顺序排列的各部分要点（由长转录文本分段提取）：\n\n"
+# 跨集总结的系统提示词: 输入为各集摘要，输出整个系列的总结
+SERIES_SYSTEM_PROMPT = (
+    "以下内容是同一合集 / 多P视频中各集的摘要，按顺序排列。"
+    "请在此基础上生成整个系列的总结：梳理各集之间的主线与联系，归纳贯穿全系列的核心观点与结论，"
+    "并注明关键内容出自第几集。\n\n"
+    "单集摘要的要求如下，仅供参考：\n{system}"
+)
+SENTENCE_END = re.compile(r"(?<=[。！？!?.;；])")
+_usage_lock = threading.Lock()
+
+def _add_usage(usage: dict, data: dict):
+    """累加接口返回的 token 用量 (prompt_tokens / completion_tokens)"""
+    if usage is None or not data:
+        return
+    with _usage_lock:
+        for key in ("prompt_tokens", "completion_tokens"):
+            usage[key] = usage.get(key, 0) + (data.get(key) or 0)
+        usage["calls"] = usage.get("calls", 0) + 1
+
 class LLMClient:
     def __init__(self):
+        require_settings("DASHSCOPE_API_KEY")
         self.api_key = settings.DASHSCOPE_API_KEY
         self.model = settings.DASHSCOPE_SUMMARY_MODEL
-        # Load presets
-        try:
-            presets_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "prompts", "presets.json")
-            with open(presets_path, "r", encoding="utf-8") as f:
-                self.presets = json.load(f)
-        except Exception as e:
-            logger.warning(f"Could not load presets: {e}")
-            self.presets = {}
-
-    def generate_summary(self, content: str, preset_name: str = "meeting_summary", custom_prompt: str = None) -> str:
-        url = "https://dashscope.aliyuncs.com/compatible-mode/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
 
+    @property
+    def presets(self) -> dict:
+        # 与 /presets 接口共用进程内缓存，修改 presets.json 后无需重启
+        return load_presets()
+
+    def generate_summary(self, content: str, preset_name: str = "meeting_summary", custom_prompt: str = None,
+                         on_delta: Callable[[str], None] = None, usage: dict = None) -> str:
+        """
+        生成摘要。传入 on_delta 时使用 stream=true 模式，每收到一段增量文本就回调一次，
+        返回值仍为完整文本。传入 usage 字典时累加各次调用的 token 用量。
+        转录文本估算 token 数超过 LLM_CHUNK_THRESHOLD_TOKENS 时自动切换为分块 map-reduce 模式。
+        """
+        if estimate_tokens(content) > settings.LLM_CHUNK_THRESHOLD_TOKENS:
+            return self._map_reduce(content, preset_name, custom_prompt, on_delta, usage=usage)
+
+        system_prompt, user_prompt = self._build_prompts(content, preset_name, custom_prompt)
+        logger.info(f"Generating summary with model: {self.model} | Preset: {preset_name} | Custom: {bool(custom_prompt)}")
+        return self._complete(system_prompt, user_prompt, on_delta, usage)
+
+    def generate_series_summary(self, episodes: List[tuple], preset_name: str = "bilibili_summary",
+                                custom_prompt: str = None, on_delta: Callable[[str], None] = None,
+                                usage: dict = None) -> str:
+        """
+        跨集总结: episodes 为按顺序排列的 (标题, 单集摘要)。
+        各集摘要拼接后按普通摘要处理，过长时同样走分块 map-reduce。
+        """
+        if custom_prompt and custom_prompt.strip():
+            episode_system = custom_prompt
+        else:
+            episode_system = (self._get_preset(preset_name) or {}).get("system", "")
+        content = "\n\n".join(
+            f"## 第 {i} 集 {title or ''}".rstrip() + f"\n{summary}" for i, (title, summary) in enumerate(episodes, 1)
+        )
+        logger.info(f"Generating series summary over {len(episodes)} episodes | Preset: {preset_name}")
+        return self.generate_summary(
+            content, custom_prompt=SERIES_SYSTEM_PROMPT.format(system=episode_system), on_delta=on_delta, usage=usage
+        )
+
+    def _build_prompts(self, content: str, preset_name: str, custom_prompt: str = None):
         # Determine prompt strategy
         if custom_prompt and custom_prompt.strip():
             system_prompt = custom_prompt
             user_prompt = f"以下是转录内容：\n\n{content}"  # Default wrapper for custom prompt
         else:
-            preset = self.presets.get(preset_name, self.presets.get("meeting_summary"))
+            preset = self._get_preset(preset_name)
             if not preset: # Fallback if presets file is broken
                 system_prompt = "You are a helpful assistant."
                 user_prompt = content
             else:
                 system_prompt = preset["system"]
                 user_prompt = preset["user_template"].format(content=content)
+        return system_prompt, user_prompt
 
+    def _get_preset(self, preset_name: str):
+        return self.presets.get(preset_name, self.presets.get("meeting_summary"))
+
+    def _complete(self, system_prompt: str, user_prompt: str, on_delta: Callable[[str], None] = None,
+                  usage: dict = None) -> str:
+        url = f"{settings.DASHSCOPE_BASE_URL}/compatible-mode/v1/chat/completions"
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
         payload = {
             "model": self.model,
             "messages": [
@@ -46,13 +114,115 @@ class LLMClient:
                 {"role": "user", "content": user_prompt}
             ]
         }
-        
-        logger.info(f"Generating summary with model: {self.model} | Preset: {preset_name} | Custom: {bool(custom_prompt)}")
-        resp = requests.post(url, headers=headers, json=payload)
-        
+
+        if on_delta:
+            return self._stream_completion(url, headers, payload, on_delta, usage)
+
+        resp = get_http().post(url, endpoint="chat", headers=headers, json=payload)
+
         if resp.status_code == 200:
             result = resp.json()
             if "choices" in result:
+                _add_usage(usage, result.get("usage"))
                 return result["choices"][0]["message"]["content"]
-        
+
         raise Exception(f"LLM Error: {resp.text}")
+
+    def _stream_completion(self, url: str, headers: dict, payload: dict, on_delta: Callable[[str], None],
+                           usage: dict = None) -> str:
+        """解析 OpenAI 兼容的 SSE 流 (data: {...} / data: [DONE])"""
+        payload = dict(payload, stream=True, stream_options={"include_usage": True})
+        parts = []
+        with get_http().stream("POST", url, endpoint="chat", headers=headers, json=payload) as resp:
+            if resp.status_code != 200:
+                resp.read()
+                raise Exception(f"LLM Error: {resp.text}")
+            for line in resp.iter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                if chunk.get("usage"):
+                    _add_usage(usage, chunk["usage"])
+                for choice in chunk.get("choices", []):
+                    delta = choice.get("delta", {}).get("content")
+                    if delta:
+                        parts.append(delta)
+                        on_delta(delta)
+        return "".join(parts)
+
+    # ---- 长文本分块 map-reduce ----
+
+    @staticmethod
+    def split_transcript(content: str, max_tokens: int) -> List[str]:
+        """
+        按行 (每行一条带时间戳的句子) 切分为不超过 max_tokens 的块；
+        单行过长时再按句末标点切分。
+        """
+        units = []
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            if estimate_tokens(line) <= max_tokens:
+                units.append(line)
+            else:
+                units.extend(s for s in SENTENCE_END.split(line) if s.strip())
+
+        chunks, current, current_tokens = [], [], 0
+        for unit in units:
+            tokens = estimate_tokens(unit) + 1
+            if current and current_tokens + tokens > max_tokens:
+                chunks.append("\n".join(current))
+                current, current_tokens = [], 0
+            current.append(unit)
+            current_tokens += tokens
+        if current:
+            chunks.append("\n".join(current))
+        return chunks
+
+    def _map_reduce(self, content: str, preset_name: str, custom_prompt: str = None,
+                    on_delta: Callable[[str], None] = None, depth: int = 1, usage: dict = None) -> str:
+        if custom_prompt and custom_prompt.strip():
+            final_system = custom_prompt
+            chunk_mode = "reduce"
+        else:
+            preset = self._get_preset(preset_name) or {}
+            final_system = preset.get("system", "You are a helpful assistant.")
+            chunk_mode = preset.get("chunk_mode", "reduce")
+
+        chunks = self.split_transcript(content, settings.LLM_CHUNK_TOKENS)
+        logger.info(
+            f"Chunked summary: {len(chunks)} chunks | Mode: {chunk_mode} | "
+            f"Fan-out: {settings.LLM_CHUNK_CONCURRENCY} | Preset: {preset_name}"
+        )
+
+        if chunk_mode == "concat":
+            # 逐段可独立完成的预设 (如全文翻译): 每段直接按原预设处理后按顺序拼接
+            def run_chunk(index, chunk):
+                system_prompt, user_prompt = self._build_prompts(chunk, preset_name, custom_prompt)
+                return self._complete(system_prompt, user_prompt, usage=usage)
+        else:
+            def run_chunk(index, chunk):
+                system_prompt = MAP_SYSTEM_PROMPT.format(index=index, total=len(chunks), system=final_system)
+                return self._complete(system_prompt, chunk, usage=usage)
+
+        with ThreadPoolExecutor(max_workers=settings.LLM_CHUNK_CONCURRENCY) as executor:
+            partials = list(executor.map(run_chunk, range(1, len(chunks) + 1), chunks))
+
+        if chunk_mode == "concat":
+            result = "\n\n".join(partials)
+            if on_delta:
+                on_delta(result)
+            return result
+
+        combined = REDUCE_HEADER + "\n\n".join(
+            f"## 第 {i} 部分\n{partial}" for i, partial in enumerate(partials, 1)
+        )
+        if depth < 3 and len(chunks) > 1 and estimate_tokens(combined) > settings.LLM_CHUNK_THRESHOLD_TOKENS:
+            # 要点合并后仍然过长，继续分层归约
+            return self._map_reduce(combined, preset_name, custom_prompt, on_delta, depth + 1, usage)
+
+        system_prompt, user_prompt = self._build_prompts(combined, preset_name, custom_prompt)
+        return self._complete(system_prompt, user_prompt, on_delta, usage)
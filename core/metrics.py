@@ -0,0 +1,215 @@
+import time
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Dict, Tuple
+
+DEFAULT_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def render(self) -> list:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    @abstractmethod
+    def _samples(self) -> list:
+        ...
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labels, k)} {v}" for k, v in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """取值由回调函数在抓取时计算"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, fn: Callable[[], Dict[Tuple[str, ...], float]],
+                 labels: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labels)
+        self.fn = fn
+
+    def _samples(self):
+        try:
+            values = self.fn()
+        except Exception:
+            return []
+        return [f"{self.name}{_format_labels(self.labels, k)} {v}" for k, v in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        # key -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            data = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def _samples(self):
+        lines = []
+        with self._lock:
+            for key, data in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, data):
+                    labels = _format_labels(self.labels, key, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labels, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {data[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {round(data[-2], 6)}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {data[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """最小化的 Prometheus 指标注册表，以 text exposition 格式输出"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_DURATION = registry.register(Histogram(
+    "bili_stage_duration_seconds", "Pipeline stage duration in seconds", ("stage",)
+))
+STAGE_TOTAL = registry.register(Counter(
+    "bili_stage_total", "Pipeline stage executions by outcome", ("stage", "outcome")
+))
+STAGE_ERRORS = registry.register(Counter(
+    "bili_stage_errors_total", "Pipeline stage errors by error type", ("stage", "error_type")
+))
+STAGE_SIZE = registry.register(Counter(
+    "bili_stage_size_total", "Sizes processed by pipeline stages (bytes, chars, tokens)", ("stage", "measure")
+))
+TASK_DURATION = registry.register(Histogram(
+    "bili_task_duration_seconds", "End-to-end Pipeline.run duration in seconds", ("outcome",)
+))
+
+
+def classify_error(error: Exception) -> str:
+    """把异常归类为粗粒度的错误类型标签"""
+    name = type(error).__name__
+    if isinstance(error, TimeoutError) or "Timeout" in name:
+        return "timeout"
+    module = type(error).__module__ or ""
+    if module.startswith(("httpx", "httpcore", "requests")):
+        return "network"
+    if module.startswith("oss2"):
+        return "oss"
+    if module.startswith("yt_dlp"):
+        return "download"
+    return name
+
+
+class StageTrace:
+    """
+    单个任务的阶段计时记录。每个 span 记录耗时、大小 (字节 / 字符 / token) 与错误类型，
+    同时写入全局 Prometheus 指标。线程安全 (分段转写时多个线程共用)。
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage: str, **attrs):
+        """
+        attrs 为仅记录在 span 中的标注 (如 segment=3)；
+        yield 一个 dict，调用方在其中补充大小字段 (如 span["audio_bytes"] = n)，同时累加到指标。
+        """
+        sizes = {}
+        start = time.time()
+        error = None
+        try:
+            yield sizes
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            seconds = time.time() - start
+            record = {"stage": stage, "seconds": round(seconds, 3)}
+            record.update(attrs)
+            record.update(sizes)
+            STAGE_DURATION.observe(seconds, stage=stage)
+            if error is None:
+                STAGE_TOTAL.inc(stage=stage, outcome="ok")
+            else:
+                error_type = classify_error(error)
+                record["error"] = error_type
+                STAGE_TOTAL.inc(stage=stage, outcome="error")
+                STAGE_ERRORS.inc(stage=stage, error_type=error_type)
+            for measure, value in sizes.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    STAGE_SIZE.inc(value, stage=stage, measure=measure)
+            with self._lock:
+                self.spans.append(record)
+
+    def finish(self, outcome: str):
+        TASK_DURATION.observe(time.time() - self.started, outcome=outcome)
+
+    def breakdown(self) -> dict:
+        """按阶段汇总的耗时与大小，附带原始 span 列表"""
+        with self._lock:
+            spans = list(self.spans)
+        totals = {}
+        for span in spans:
+            total = totals.setdefault(span["stage"], {"seconds": 0.0, "count": 0})
+            total["seconds"] = round(total["seconds"] + span["seconds"], 3)
+            total["count"] += 1
+        return {"total_seconds": round(time.time() - self.started, 3), "stages": totals, "spans": spans}
@@ -1,50 +1,138 @@
 import os
 import sys
+import time
+import threading
+import uuid
 import datetime
-import oss2
 from utils.logger import get_logger
-from utils.config import settings
+from utils.config import settings, require_settings
 
 logger = get_logger("OSSManager")
 
 class OSSManager:
     def __init__(self):
-        try:
-            self.auth = oss2.Auth(settings.OSS_ACCESS_KEY_ID, settings.OSS_ACCESS_KEY_SECRET)
-            self.bucket = oss2.Bucket(self.auth, settings.OSS_ENDPOINT, settings.OSS_BUCKET_NAME)
-        except Exception as e:
-            logger.error(f"OSS Init Failed: {e}")
-            self.bucket = None
+        self._bucket = None
+        self._init_failed = False
+        self._bucket_lock = threading.Lock()
+        self._store = None
+
+    @property
+    def bucket(self):
+        """首次使用时才导入 oss2 并创建 Bucket，失败时返回 None"""
+        if self._bucket is None and not self._init_failed:
+            # 多个上传线程可能同时首次访问，加锁并二次检查，只创建一次
+            with self._bucket_lock:
+                if self._bucket is None and not self._init_failed:
+                    try:
+                        import oss2
+                        require_settings("OSS_ACCESS_KEY_ID", "OSS_ACCESS_KEY_SECRET", "OSS_ENDPOINT", "OSS_BUCKET_NAME")
+                        auth = oss2.Auth(settings.OSS_ACCESS_KEY_ID, settings.OSS_ACCESS_KEY_SECRET)
+                        self._bucket = oss2.Bucket(auth, settings.OSS_ENDPOINT, settings.OSS_BUCKET_NAME)
+                    except Exception as e:
+                        logger.error(f"OSS Init Failed: {e}")
+                        self._init_failed = True
+        return self._bucket
 
-    def upload_file(self, file_path: str) -> tuple[str, str]:
-        """Uploads file to OSS, returns (signed_url, object_key)"""
+    def upload_file(self, file_path: str, progress=None) -> tuple[str, str]:
+        """
+        Uploads file to OSS, returns (signed_url, object_key)
+        超过 OSS_MULTIPART_THRESHOLD 的文件使用并行分片上传；瞬时失败后重试时
+        通过本地断点记录从已上传的分片继续。progress(consumed_bytes, total_bytes) 接收字节级进度。
+        """
         if not self.bucket:
             raise Exception("OSS Bucket not initialized")
+        import oss2
 
-        try:
-            file_name = os.path.basename(file_path)
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            object_key = f"bili_assistant_temp/{timestamp}_{file_name}"
-            
-            logger.info(f"Uploading to OSS: {object_key}")
-            
-            def percentage(consumed_bytes, total_bytes):
-                if total_bytes:
-                    rate = int(100 * (float(consumed_bytes) / float(total_bytes)))
-                    # Simple progress log, maybe improve later
-                    # sys.stdout.write(f'\rProgress: {rate}%')
-                    # sys.stdout.flush()
-
-            self.bucket.put_object_from_file(object_key, file_path, progress_callback=percentage)
-            logger.info("Upload complete.")
-            
-            url = self.bucket.sign_url('GET', object_key, 3600)
-            return url, object_key
+        file_name = os.path.basename(file_path)
+        object_key = self._object_key(file_name)
+        total_size = os.path.getsize(file_path)
+
+        logger.info(f"Uploading to OSS: {object_key} ({total_size} bytes)")
 
+        last_reported = [-1]
+        def percentage(consumed_bytes, total_bytes):
+            if not progress or not total_bytes:
+                return
+            # 每 1% 上报一次，避免刷屏
+            rate = int(100 * (float(consumed_bytes) / float(total_bytes)))
+            if rate != last_reported[0]:
+                last_reported[0] = rate
+                progress(consumed_bytes, total_bytes)
+
+        attempt = 0
+        while True:
+            try:
+                if total_size >= settings.OSS_MULTIPART_THRESHOLD:
+                    oss2.resumable_upload(
+                        self.bucket, object_key, file_path,
+                        store=self._checkpoint_store(),
+                        multipart_threshold=settings.OSS_MULTIPART_THRESHOLD,
+                        part_size=settings.OSS_PART_SIZE,
+                        num_threads=settings.OSS_UPLOAD_THREADS,
+                        progress_callback=percentage,
+                    )
+                else:
+                    self.bucket.put_object_from_file(object_key, file_path, progress_callback=percentage)
+                break
+            except (oss2.exceptions.RequestError, oss2.exceptions.ServerError) as e:
+                # 连接错误 / 5xx 视为瞬时失败，分片上传会从断点继续
+                attempt += 1
+                if attempt > settings.OSS_UPLOAD_RETRIES or (
+                    isinstance(e, oss2.exceptions.ServerError) and e.status < 500
+                ):
+                    logger.error(f"OSS Upload Failed: {e}")
+                    raise e
+                logger.warning(f"OSS Upload interrupted ({e}), resuming ({attempt}/{settings.OSS_UPLOAD_RETRIES})...")
+                time.sleep(min(2 ** attempt, 10))
+            except Exception as e:
+                logger.error(f"OSS Upload Failed: {e}")
+                raise e
+
+        logger.info("Upload complete.")
+        url = self.bucket.sign_url('GET', object_key, 3600)
+        return url, object_key
+
+    def upload_stream(self, chunks, file_name: str, progress=None) -> tuple[str, str, int]:
+        """
+        以分块传输方式上传一个字节流 (如 ffmpeg stdout)，边读边传，不经过本地文件。
+        returns (signed_url, object_key, uploaded_bytes)。progress(consumed_bytes) 接收进度。
+        """
+        if not self.bucket:
+            raise Exception("OSS Bucket not initialized")
+
+        object_key = self._object_key(file_name)
+        logger.info(f"Streaming upload to OSS: {object_key}")
+
+        consumed = [0]
+        def counted():
+            for chunk in chunks:
+                consumed[0] += len(chunk)
+                if progress:
+                    progress(consumed[0])
+                yield chunk
+
+        try:
+            self.bucket.put_object(object_key, counted())
         except Exception as e:
-            logger.error(f"OSS Upload Failed: {e}")
+            logger.error(f"OSS Streaming Upload Failed: {e}")
             raise e
 
+        logger.info("Upload complete.")
+        url = self.bucket.sign_url('GET', object_key, 3600)
+        return url, object_key, consumed[0]
+
+    @staticmethod
+    def _object_key(file_name: str) -> str:
+        # 随机后缀避免同一秒内上传的同名文件互相覆盖 / 被先结束的任务删除
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        return f"bili_assistant_temp/{timestamp}_{uuid.uuid4().hex[:8]}_{file_name}"
+
+    def _checkpoint_store(self):
+        if self._store is None:
+            import oss2
+            self._store = oss2.ResumableStore(root=os.path.abspath(settings.DOWNLOAD_DIR), dir=".oss_checkpoints")
+        return self._store
+
     def delete_file(self, object_key: str):
         if not self.bucket or not object_key:
             return
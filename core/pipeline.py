@@ -1,41 +1,332 @@
 import os
+import time
+import hashlib
+import threading
+import tempfile
 import subprocess
-import imageio_ffmpeg
+from contextlib import contextmanager
+from functools import cached_property
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
 from .downloader import BilibiliDownloader
 from .oss_manager import OSSManager
 from .asr_client import ASRClient
 from .llm_client import LLMClient
+from .cache import ResultCache
+from .transcript import Transcript
+from .metrics import StageTrace
+from .compactor import compact_transcript
+from .segmenter import probe_duration, detect_silences, plan_segments
+from .workspace import Workspace
 from utils.config import settings
+from utils.helpers import normalize_source, get_ffmpeg_exe
+from utils.presets import load_presets
 from utils.logger import get_logger
 
 logger = get_logger("Pipeline")
 
+VIDEO_EXTS = (".mp4", ".mkv", ".mov", ".flv", ".avi", ".webm")
+AUDIO_EXTS = (".mp3", ".m4a", ".aac", ".wav", ".flac", ".ogg", ".opus", ".wma")
+# ASR 可直接识别的音频容器: 原生音频下载得到这些格式时不再转码，直接上传
+ASR_NATIVE_EXTS = (".mp3", ".m4a", ".aac", ".wav", ".flac", ".ogg", ".opus")
+
+# ASR 编码档位: (ffmpeg 编码参数, 容器格式, 文件扩展名)。16 kHz 单声道对语音识别已足够
+ASR_PROFILES = {
+    "opus": (["-c:a", "libopus", "-application", "voip"], "ogg", ".opus"),
+    "aac": (["-c:a", "aac"], "adts", ".aac"),
+    "mp3": (["-c:a", "libmp3lame"], "mp3", ".mp3"),
+}
+
+def target_keys(targets: list) -> list:
+    """
+    多预设模式下各摘要目标 (preset_name, custom_prompt) 的标识: 预设为预设名，
+    自定义提示词依次为 custom1 / custom2 ...
+    """
+    keys, custom = [], 0
+    for preset_name, custom_prompt in targets:
+        if custom_prompt and custom_prompt.strip():
+            custom += 1
+            keys.append(f"custom{custom}")
+        else:
+            keys.append(preset_name)
+    return keys
+
+def summary_suffix(preset_name: str, custom_prompt: str = None) -> str:
+    """
+    摘要输出文件名后缀: 预设为预设名，自定义提示词为 custom_<提示词哈希前 8 位>，
+    同一输入源以不同预设 / 提示词生成的摘要保存为不同文件，不会互相覆盖。
+    """
+    if custom_prompt and custom_prompt.strip():
+        return "custom_" + hashlib.sha256(custom_prompt.encode("utf-8")).hexdigest()[:8]
+    return preset_name
+
+class PipelineHooks:
+    """
+    Pipeline 阶段钩子，默认不做任何处理。
+    调度器等组件通过子类在各阶段 (download / transcode / upload / transcode_upload / asr / summarize) 前后注入并发控制，
+    并通过 emit 接收摘要增量等事件。
+    """
+    # 为 True 时摘要以流式生成，并将增量以 "delta" 事件 emit
+    wants_deltas = False
+
+    @contextmanager
+    def stage(self, name: str):
+        yield
+
+    def emit(self, event: str, data=None):
+        pass
+
 class Pipeline:
-    def __init__(self):
-        self.downloader = BilibiliDownloader(settings.DOWNLOAD_DIR)
-        self.oss = OSSManager()
-        self.asr = ASRClient()
-        self.llm = LLMClient()
+    """各客户端在首次使用时才创建 (也可直接赋值替换，如基准测试中的桩下载器)"""
+
+    @cached_property
+    def downloader(self):
+        return BilibiliDownloader(settings.DOWNLOAD_DIR, settings.DOWNLOAD_AUDIO_MIN_KBPS)
+
+    @cached_property
+    def oss(self):
+        return OSSManager()
+
+    @cached_property
+    def asr(self):
+        return ASRClient()
+
+    @cached_property
+    def llm(self):
+        return LLMClient()
+
+    @cached_property
+    def workspace(self):
+        return Workspace(
+            settings.DOWNLOAD_DIR, settings.OUTPUT_DIR, settings.WORKSPACE_MAX_BYTES, settings.WORKSPACE_OUTPUT_MAX_BYTES,
+            adopt_legacy=settings.WORKSPACE_ADOPT_LEGACY_DOWNLOADS,
+        )
+
+    @cached_property
+    def cache(self):
+        if not settings.CACHE_ENABLED:
+            return None
+        return ResultCache(settings.CACHE_DIR, settings.CACHE_MAX_BYTES, settings.CACHE_TTL_SECONDS)
+
+    def _save_outputs(self, owner_key: str, base_name: str, transcript: str, summary: str,
+                      preset_name: str, custom_prompt=None) -> dict:
+        return {
+            "transcript": self._write_output(owner_key, f"{base_name}.txt", transcript),
+            "summary": self._write_output(
+                owner_key, f"{base_name}_{summary_suffix(preset_name, custom_prompt)}.txt", summary
+            ),
+        }
+
+    def _write_output(self, owner_key: str, filename: str, text: str) -> str:
+        """输出文件按输入源分目录 (OUTPUT_DIR/<源标识>/filename)，原子写入"""
+        path = self.workspace.write_output(owner_key, filename, text)
+        logger.info(f"Saved {path}")
+        return path
+
+    def _summary_cache_key(self, transcript: str, preset_name: str, custom_prompt) -> str:
+        return ResultCache.summary_key(transcript, preset_name, custom_prompt, settings.DASHSCOPE_SUMMARY_MODEL)
+
+    def _summary_input(self, structured: Transcript, preset_name: str, custom_prompt=None, memo: dict = None):
+        """
+        送入摘要的文本与压缩统计。开启压缩时合并段落、去除口头禅与重复，
+        并裁剪到摘要模型的 token 预算 (预设中 "trim": false 时只压缩不裁剪)；
+        关闭压缩或预设中 "compact": false 时 (如逐句翻译) 为逐句的转录文本。
+        memo 供同一转录的多个预设共用预算相同的压缩结果。
+        """
+        preset = {} if custom_prompt else load_presets().get(preset_name, {})
+        if not settings.LLM_COMPACT_ENABLED or not preset.get("compact", True):
+            return structured.to_text(), None
+        budget = settings.LLM_TOKEN_BUDGETS.get(settings.DASHSCOPE_SUMMARY_MODEL, settings.LLM_DEFAULT_TOKEN_BUDGET)
+        if not preset.get("trim", True):
+            budget = None
+        budget = budget or None
+        if memo is not None and budget in memo:
+            return memo[budget]
+        compacted = compact_transcript(structured, settings.LLM_COMPACT_PARAGRAPH_SECONDS, budget)
+        if memo is not None:
+            memo[budget] = compacted
+        return compacted
+
+    def lookup_cached(self, source: str, preset_name="bilibili_summary", custom_prompt=None, targets: list = None):
+        """
+        仅查缓存: 转录与摘要 (多预设模式下为全部预设) 都命中时直接返回完整结果 (并写出输出文件)，否则返回 None。
+        只有全部命中时才计入缓存统计，未命中时由随后的 run 计数。
+        """
+        if not self.cache:
+            return None
+        source_key = normalize_source(source)
+        entry = self.cache.peek("transcript", ResultCache.transcript_key(source_key, settings.DASHSCOPE_MODEL))
+        if not entry:
+            return None
+        cached = entry["value"]
+        structured = self._cached_segments(cached)
+        transcript = structured.to_text()
+        memo = {}
+        entries, compactions = [], []
+        for target_preset, target_prompt in targets or [(preset_name, custom_prompt)]:
+            prompt_text, stats = self._summary_input(structured, target_preset, target_prompt, memo)
+            compactions.append(stats)
+            summary_entry = self.cache.peek(
+                "summary", self._summary_cache_key(prompt_text, target_preset, target_prompt)
+            )
+            if not summary_entry:
+                return None
+            entries.append(summary_entry)
+        self.cache.record("transcript", entry)
+        for summary_entry in entries:
+            self.cache.record("summary", summary_entry)
+        hits = [summary_entry["value"]["summary"] for summary_entry in entries]
+        compaction = compactions[0]
+        logger.info(f"Cache hit for {source_key} (Preset: {preset_name if targets is None else target_keys(targets)})")
+        # 结果中只保存结构化的 segments，转录文本由 /status 按需渲染
+        result = {
+            "segments": structured.to_compact(),
+            "cache": {"transcript": "hit", "summary": "hit"},
+            "compaction": compaction,
+        }
+        if targets is None:
+            result["summary"] = hits[0]
+            result["files"] = self._save_outputs(
+                source_key, cached["base_name"], transcript, hits[0], preset_name, custom_prompt
+            )
+            return result
+        summaries = {}
+        for key, (target_preset, target_prompt), summary in zip(target_keys(targets), targets, hits):
+            summaries[key] = {
+                "key": key,
+                "preset": None if target_prompt else target_preset,
+                "status": "succeeded",
+                "cache": "hit",
+                "summary": summary,
+                "file": self._write_output(
+                    source_key, f"{cached['base_name']}_{summary_suffix(target_preset, target_prompt)}.txt", summary
+                ),
+            }
+        first = summaries[target_keys(targets)[0]]
+        result.update(
+            summary=first["summary"],
+            files={
+                "transcript": self._write_output(source_key, f"{cached['base_name']}.txt", transcript),
+                "summary": first["file"],
+            },
+            summaries=summaries,
+        )
+        return result
+
+    def _summarize_text(self, prompt_text: str, preset_name: str, custom_prompt, hooks: "PipelineHooks",
+                        trace: StageTrace, on_delta=None, **attrs):
+        """对摘要输入文本生成摘要 (先查摘要缓存)，返回 (摘要, 缓存状态 hit / miss / disabled)"""
+        summary_key = self._summary_cache_key(prompt_text, preset_name, custom_prompt)
+        cached_summary = self.cache.get("summary", summary_key) if self.cache else None
+        if cached_summary:
+            logger.info(f"Step 4: Summary cache hit (Preset: {preset_name})")
+            return cached_summary["summary"], "hit"
+        logger.info(f"Step 4: Summarizing (Preset: {preset_name})...")
+        stage_start = time.time()
+        with hooks.stage("summarize"), trace.span("summarize", **attrs) as span:
+            summary = self.llm.generate_summary(
+                prompt_text, preset_name=preset_name, custom_prompt=custom_prompt, on_delta=on_delta, usage=span,
+            )
+            span["summary_chars"] = len(summary)
+        if not self.cache:
+            return summary, "disabled"
+        self.cache.put("summary", summary_key, {"summary": summary}, elapsed=time.time() - stage_start)
+        return summary, "miss"
+
+    def _summarize_fan_out(self, inputs: list, targets: list, owner_key: str, base_name: str,
+                           hooks: "PipelineHooks", trace: StageTrace) -> dict:
+        """
+        多预设模式: 各摘要目标并发生成 (每个目标单独占用调度器的 summarize 槽位)，
+        分别保存为 <base_name>_<summary_suffix>.txt，每完成一个 emit 一次 "summary" 事件；单个目标失败不影响其它目标。
+        返回 {key: {"key", "preset", "status", "cache", "summary", "file", "error"}}
+        """
+        def run_target(key, target, prompt_text):
+            target_preset, target_prompt = target
+            entry = {"key": key, "preset": None if target_prompt else target_preset, "status": "failed"}
+            try:
+                summary, entry["cache"] = self._summarize_text(
+                    prompt_text, target_preset, target_prompt, hooks, trace, target=key
+                )
+                with trace.span("save", target=key):
+                    entry["file"] = self._write_output(
+                        owner_key, f"{base_name}_{summary_suffix(target_preset, target_prompt)}.txt", summary
+                    )
+                entry.update(status="succeeded", summary=summary)
+            except Exception as e:
+                logger.error(f"Summary failed for {key}: {e}")
+                entry["error"] = str(e)
+            hooks.emit("summary", entry)
+            return entry
+
+        keys = target_keys(targets)
+        logger.info(f"Step 4: Fan-out summaries: {keys}")
+        with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+            entries = list(executor.map(run_target, keys, targets, [text for text, _ in inputs]))
+        return {entry["key"]: entry for entry in entries}
+
+    @staticmethod
+    def _cached_segments(cached: dict) -> Transcript:
+        """转录缓存中的结构化结果；旧版缓存只有文本时从文本解析"""
+        if cached.get("segments"):
+            return Transcript.from_compact(cached["segments"])
+        return Transcript.from_text(cached["transcript"])
+
+    def summarize_series(self, episodes: list, base_name: str, preset_name="bilibili_summary", custom_prompt=None,
+                         hooks: PipelineHooks = None, owner_key: str = None) -> dict:
+        """
+        批量任务的跨集总结: episodes 为按顺序排列的 (标题, 单集摘要)，
+        结果写入 OUTPUT_DIR/<owner_key 对应的目录>/<base_name>_summary.txt。
+        """
+        hooks = hooks or PipelineHooks()
+        trace = StageTrace()
+        with hooks.stage("summarize"), trace.span("series_summarize", episodes=len(episodes)) as span:
+            on_delta = (lambda delta: hooks.emit("delta", delta)) if hooks.wants_deltas else None
+            summary = self.llm.generate_series_summary(
+                episodes, preset_name=preset_name, custom_prompt=custom_prompt, on_delta=on_delta, usage=span
+            )
+            span["summary_chars"] = len(summary)
+        with trace.span("save"):
+            summary_path = self._write_output(owner_key or f"series:{base_name}", f"{base_name}_summary.txt", summary)
+        return {"summary": summary, "files": {"summary": summary_path}, "timings": trace.breakdown()}
+
+    def _download(self, source: str, source_key: str, hooks: PipelineHooks, trace: StageTrace):
+        """下载到工作区；同一输入源仍在磁盘上的下载文件 (下载方式相同时) 直接复用。返回 (文件路径, 媒体信息)"""
+        streaming = settings.ASR_STREAM_TRANSCODE
+        native = settings.DOWNLOAD_NATIVE_AUDIO
+        variant = "native" if native else ("audio" if streaming else "mp3")
+        with self.workspace.locked(source_key):
+            found = self.workspace.find_download(source_key, variant) if settings.WORKSPACE_REUSE_DOWNLOADS else None
+            if found:
+                local_file, media = found
+                logger.info(f"Step 1: Reusing downloaded file: {local_file}")
+                with trace.span("download", reused=True) as span:
+                    span["file_bytes"] = os.path.getsize(local_file)
+                return local_file, media
+            logger.info("Step 1: Downloading...")
+            with hooks.stage("download"), trace.span("download") as span:
+                # 原生音频 / 流式转码时直接下载原始音频流，不再额外转为 MP3
+                local_file, media = self.downloader.download_with_info(
+                    source, extract_audio=not (streaming or native), native_audio=native,
+                    target_dir=self.workspace.download_dir_for(source_key),
+                )
+                span["file_bytes"] = os.path.getsize(local_file)
+            self.workspace.add_download(source_key, local_file, variant, media)
+        return local_file, media
 
     def _convert_video_to_audio(self, video_path: str) -> str:
         """如果输入是视频文件，且存在 ffmpeg，则提取音频"""
         try:
             ext = os.path.splitext(video_path)[1].lower()
-            if ext not in [".mp4", ".mkv", ".mov", ".flv", ".avi", ".webm"]:
+            if ext not in VIDEO_EXTS:
                 return video_path
             
             logger.info("Attempting to convert video to audio for faster upload...")
             
-            # 生成临时输出路径
+            # 生成临时输出路径 (工作区内唯一，同名文件并发处理时不会互相覆盖)
             base_name = os.path.splitext(os.path.basename(video_path))[0]
-            # 确保下载目录存在
-            if not os.path.exists(settings.DOWNLOAD_DIR):
-                os.makedirs(settings.DOWNLOAD_DIR)
-                
-            output_path = os.path.join(settings.DOWNLOAD_DIR, f"{base_name}_temp_audio.mp3")
+            output_path = self.workspace.temp_path(f"{base_name}_temp_audio.mp3")
             
             # 获取 ffmpeg 路径
-            ffmpeg_exe = imageio_ffmpeg.get_ffmpeg_exe()
+            ffmpeg_exe = get_ffmpeg_exe()
             
             # 构建命令: -i input -vn (无视频) -acodec mp3 -y (覆盖)
             cmd = [ffmpeg_exe, '-i', video_path, '-vn', '-acodec', 'libmp3lame', '-q:a', '4', output_path, '-y']
@@ -52,79 +343,315 @@ class Pipeline:
         
         return video_path
 
-    def run(self, source: str, skip_download=False, preset_name="bilibili_summary", custom_prompt=None):
+    def _stream_transcode_upload(self, media_path: str, hooks: PipelineHooks,
+                                 start: float = None, duration: float = None, name_suffix: str = ""):
+        """
+        按 ASR 编码档位转码，ffmpeg 的 stdout 边产生边上传到 OSS，不落临时文件。
+        start / duration (秒) 用于只转码其中一段。
+        转码失败或 ffmpeg 不可用时抛出异常，由调用方回退到文件上传。
+        返回 (oss_url, oss_key, 上传字节数)。
+        """
+        codec_args, fmt, ext = ASR_PROFILES[settings.ASR_AUDIO_PROFILE]
+        seek = ["-ss", f"{start:.3f}"] if start else []
+        limit = ["-t", f"{duration:.3f}"] if duration else []
+        cmd = [
+            get_ffmpeg_exe(), "-loglevel", "error", *seek, "-i", media_path, *limit, "-vn",
+            "-ac", "1", "-ar", str(settings.ASR_AUDIO_SAMPLE_RATE), *codec_args,
+            "-b:a", settings.ASR_AUDIO_BITRATE, "-f", fmt, "pipe:1",
+        ]
+        base_name = os.path.splitext(os.path.basename(media_path))[0] + name_suffix
+        logger.info(f"Streaming ASR transcode ({settings.ASR_AUDIO_PROFILE}) -> OSS: {media_path}")
+
+        # stderr 写入临时文件而不是管道: 上传结束前无人读取，管道写满会阻塞 ffmpeg 并拖住上传
+        stderr = tempfile.TemporaryFile()
+        try:
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr)
+        except Exception:
+            stderr.close()
+            raise
+        oss_key = None
+        try:
+            def chunks():
+                while True:
+                    chunk = proc.stdout.read(settings.ASR_STREAM_CHUNK_SIZE)
+                    if not chunk:
+                        return
+                    yield chunk
+
+            oss_url, oss_key, size = self.oss.upload_stream(
+                chunks(), f"{base_name}{ext}",
+                progress=lambda done: hooks.emit("progress", {"stage": "upload", "bytes": done, "total": None}),
+            )
+            returncode = proc.wait()
+            if returncode != 0 or size == 0:
+                stderr.seek(0)
+                message = stderr.read().decode("utf-8", errors="replace").strip()
+                raise Exception(f"ffmpeg exited with {returncode}: {message[-500:]}")
+            logger.info(f"Streamed {size} bytes of ASR audio")
+            return oss_url, oss_key, size
+        except Exception:
+            if oss_key:
+                self.oss.delete_file(oss_key)
+            raise
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            proc.stdout.close()
+            stderr.close()
+
+    def _transcribe_segmented(self, media_path: str, duration: float, hooks: PipelineHooks, trace: StageTrace):
+        """
+        在静音处把长音频切成接近 ASR_SEGMENT_TARGET_SECONDS 的若干段，各段并行上传、转写，
+        再按段起点偏移时间戳后合并为一个 Transcript。只有一段时返回 None，由调用方走整文件流程。
+        任一段失败时其余段不再进入下一阶段 (尚未开始的直接取消)，抛出该段的异常，由调用方回退到整文件流程；
+        各段的 OSS 对象在段结束时删除。
+        """
+        with hooks.stage("transcode"), trace.span("silence_detect") as span:
+            span["media_seconds"] = round(duration, 3)
+            silences = detect_silences(media_path, settings.ASR_SILENCE_NOISE_DB, settings.ASR_SILENCE_MIN_SECONDS)
+        segments = plan_segments(
+            duration, silences, settings.ASR_SEGMENT_TARGET_SECONDS, settings.ASR_SEGMENT_MAX_SECONDS
+        )
+        if len(segments) < 2:
+            return None
+        logger.info(
+            f"Step 2-3: Segmented transcription: {len(segments)} segments "
+            f"({len(silences)} silences, {int(duration)}s total)"
+        )
+
+        aborted = threading.Event()
+
+        def check_aborted(index):
+            if aborted.is_set():
+                raise Exception(f"Segment {index} aborted after another segment failed")
+
+        def run_segment(index, segment):
+            start, end = segment
+            oss_key = None
+            try:
+                check_aborted(index)
+                with hooks.stage("transcode_upload"), trace.span("transcode_upload", segment=index) as span:
+                    oss_url, oss_key, span["audio_bytes"] = self._stream_transcode_upload(
+                        media_path, hooks, start=start, duration=end - start, name_suffix=f"_part{index:03d}"
+                    )
+                check_aborted(index)
+                with hooks.stage("asr"):
+                    with trace.span("asr_submit", segment=index):
+                        task_id = self.asr.submit_task(oss_url)
+                    logger.info(f"Segment {index} [{int(start)}s-{int(end)}s] Task ID: {task_id}")
+                    with trace.span("asr_wait", segment=index):
+                        data = self.asr.wait_task(task_id, int((end - start) * 1000))
+                    with trace.span("transcript_fetch", segment=index) as span:
+                        part = self.asr.fetch_transcript(data, offset_ms=int(start * 1000))
+                        span["sentences"] = len(part)
+                    return part
+            finally:
+                if oss_key:
+                    self.oss.delete_file(oss_key)
+
+        executor = ThreadPoolExecutor(max_workers=settings.ASR_SEGMENT_CONCURRENCY)
+        futures = [executor.submit(run_segment, index, segment) for index, segment in enumerate(segments)]
+        wait(futures, return_when=FIRST_EXCEPTION)
+        failed = next((f for f in futures if f.done() and not f.cancelled() and f.exception()), None)
+        if failed:
+            # 不等待仍在转写的段: 它们在下一个阶段前退出，并在结束时删除各自的 OSS 对象
+            aborted.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise failed.exception()
+        executor.shutdown()
+        return Transcript.concat([f.result() for f in futures])
+
+    def run(self, source: str, skip_download=False, preset_name="bilibili_summary", custom_prompt=None,
+            hooks: PipelineHooks = None, targets: list = None):
+        """
+        targets 为多个摘要目标 [(preset_name, custom_prompt), ...] 时进入多预设模式: 只转录一次，
+        各目标的摘要并发生成并分别保存，结果的 summaries 中为各目标的状态与输出 (summary / files 取第一个成功的目标)。
+        """
+        hooks = hooks or PipelineHooks()
+        trace = StageTrace()
+        outcome = "error"
         local_file = source
         oss_key = None
         temp_audio_file = None
+        pinned_key = None
+        media = None
+        cache_status = {"transcript": "disabled", "summary": "disabled"}
         
         try:
-            # 1. Download if needed
-            if not skip_download and (source.startswith("http") or source.startswith("BV")):
-                logger.info("Step 1: Downloading...")
-                local_file = self.downloader.download(source)
-            elif os.path.exists(source):
-                logger.info(f"Step 1: Using local file: {source}")
-                # 尝试转换本地视频
-                converted_file = self._convert_video_to_audio(source)
-                if converted_file != source:
-                    local_file = converted_file
-                    temp_audio_file = converted_file
+            source_key = normalize_source(source)
+            transcript_key = ResultCache.transcript_key(source_key, settings.DASHSCOPE_MODEL)
+            cached = self.cache.get("transcript", transcript_key) if self.cache else None
+
+            if cached:
+                # 转录缓存命中: 跳过下载 / 上传 / ASR
+                logger.info(f"Step 1-3: Transcript cache hit for {source_key}")
+                cache_status["transcript"] = "hit"
+                structured = self._cached_segments(cached)
+                transcript = structured.to_text()
+                base_name = cached["base_name"]
+                media = cached.get("media")
             else:
-                raise Exception("Invalid source")
+                if self.cache:
+                    cache_status["transcript"] = "miss"
+                stage_start = time.time()
 
-            # 2. Upload to OSS
-            logger.info("Step 2: Uploading to OSS...")
-            oss_url, oss_key = self.oss.upload_file(local_file)
+                streaming = settings.ASR_STREAM_TRANSCODE
+                native = settings.DOWNLOAD_NATIVE_AUDIO
+                alias_keys = []
 
+                # 1. Download if needed
+                if not skip_download and (source.startswith("http") or source.startswith("BV")):
+                    # 下载文件按输入源存放在工作区中，任务结束前不会被配额淘汰
+                    self.workspace.pin(source_key)
+                    pinned_key = source_key
+                    local_file, media = self._download(source, source_key, hooks, trace)
+                    hooks.emit("media", media)
+                    canonical_key = normalize_source(media.get("webpage_url") or "")
+                    if canonical_key.startswith("bili:") and canonical_key != source_key:
+                        # 短链等输入解析出的规范 BV 号同样写入缓存，之后按 BV 号提交可直接命中
+                        alias_keys.append(ResultCache.transcript_key(canonical_key, settings.DASHSCOPE_MODEL))
+                elif os.path.exists(source):
+                    logger.info(f"Step 1: Using local file: {source}")
+                else:
+                    raise Exception("Invalid source")
 
-            # 3. Transcribe
-            logger.info("Step 3: Transcribing...")
-            task_id = self.asr.submit_task(oss_url)
-            logger.info(f"Task ID: {task_id}")
-            transcript = self.asr.poll_result(task_id)
-            
-            # Save Transcript
-            base_name = os.path.splitext(os.path.basename(local_file))[0]
-            output_dir = settings.OUTPUT_DIR
-            if not os.path.exists(output_dir):
-                os.makedirs(output_dir)
-            
-            transcript_path = os.path.join(output_dir, f"{base_name}.txt")
-            with open(transcript_path, "w", encoding="utf-8") as f:
-                f.write(transcript)
-            logger.info(f"Transcript saved to {transcript_path}")
-
-            # 4. Summarize
-            logger.info(f"Step 4: Summarizing (Preset: {preset_name})...")
-            summary = self.llm.generate_summary(transcript, preset_name=preset_name, custom_prompt=custom_prompt)
-            
-            summary_path = os.path.join(output_dir, f"{base_name}_summary.txt")
-            with open(summary_path, "w", encoding="utf-8") as f:
-                f.write(summary)
-            logger.info(f"Summary saved to {summary_path}")
+                # 长音频: 按静音切分后并行转写
+                structured = None
+                duration = media.get("duration") if media else None
+                ext = os.path.splitext(local_file)[1].lower()
+                if settings.ASR_SEGMENT_ENABLED and ext in VIDEO_EXTS + AUDIO_EXTS:
+                    if not duration:
+                        with trace.span("probe"):
+                            duration = probe_duration(local_file)
+                    if duration and duration > settings.ASR_SEGMENT_MIN_SECONDS:
+                        try:
+                            structured = self._transcribe_segmented(local_file, duration, hooks, trace)
+                        except Exception as e:
+                            logger.warning(f"Segmented transcription failed, falling back to whole file: {e}")
+
+                if structured is None:
+                    # 2. Transcode + Upload to OSS
+                    oss_url = None
+                    # 原生音频下载的文件 ASR 可直接识别，跳过转码
+                    direct = native and media is not None and ext in ASR_NATIVE_EXTS
+                    if streaming and not direct and ext in VIDEO_EXTS + AUDIO_EXTS:
+                        logger.info("Step 2: Streaming transcode + upload to OSS...")
+                        try:
+                            with hooks.stage("transcode_upload"), trace.span("transcode_upload") as span:
+                                oss_url, oss_key, span["audio_bytes"] = self._stream_transcode_upload(local_file, hooks)
+                        except Exception as e:
+                            logger.warning(f"Streaming transcode failed, falling back to file upload: {e}")
+
+                    if not oss_url:
+                        if local_file == source:
+                            # 尝试转换本地视频
+                            with hooks.stage("transcode"), trace.span("transcode"):
+                                converted_file = self._convert_video_to_audio(source)
+                            if converted_file != source:
+                                local_file = converted_file
+                                temp_audio_file = self.workspace.add_temp(converted_file)
+
+                        logger.info("Step 2: Uploading to OSS...")
+                        with hooks.stage("upload"), trace.span("upload") as span:
+                            span["audio_bytes"] = os.path.getsize(local_file)
+                            oss_url, oss_key = self.oss.upload_file(
+                                local_file,
+                                progress=lambda done, total: hooks.emit(
+                                    "progress", {"stage": "upload", "bytes": done, "total": total}
+                                ),
+                            )
+
+                    # 3. Transcribe
+                    logger.info("Step 3: Transcribing...")
+                    with hooks.stage("asr"):
+                        with trace.span("asr_submit"):
+                            task_id = self.asr.submit_task(oss_url)
+                        logger.info(f"Task ID: {task_id}")
+                        with trace.span("asr_wait"):
+                            data = self.asr.wait_task(task_id, int(duration * 1000) if duration else None)
+                        with trace.span("transcript_fetch") as span:
+                            structured = self.asr.fetch_transcript(data)
+                            span["sentences"] = len(structured)
+                transcript = structured.to_text()
+                base_name = os.path.splitext(os.path.basename(source if temp_audio_file else local_file))[0]
+
+                if self.cache:
+                    for key in [transcript_key] + alias_keys:
+                        self.cache.put(
+                            "transcript", key,
+                            {"segments": structured.to_compact(), "base_name": base_name,
+                             "source_key": source_key, "media": media},
+                            elapsed=time.time() - stage_start,
+                        )
 
-            return {
-                "transcript": transcript,
+            # 4. Summarize (送入摘要的是压缩后的文本，输出文件中仍保存完整转录)
+            with trace.span("compact") as span:
+                memo = {}
+                inputs = [
+                    self._summary_input(structured, target_preset, target_prompt, memo)
+                    for target_preset, target_prompt in targets or [(preset_name, custom_prompt)]
+                ]
+                compaction = inputs[0][1]
+                if compaction:
+                    span["tokens_before"] = compaction["tokens_before"]
+                    span["tokens_after"] = compaction["tokens_after"]
+                    logger.info(
+                        f"Step 4: Compacted transcript {compaction['tokens_before']} -> "
+                        f"{compaction['tokens_after']} tokens ({compaction['paragraphs']} paragraphs)"
+                    )
+
+            summaries = None
+            if targets is None:
+                on_delta = (lambda delta: hooks.emit("delta", delta)) if hooks.wants_deltas else None
+                summary, state = self._summarize_text(inputs[0][0], preset_name, custom_prompt, hooks, trace, on_delta)
+                if state != "disabled":
+                    cache_status["summary"] = state
+                with trace.span("save"):
+                    files = self._save_outputs(source_key, base_name, transcript, summary, preset_name, custom_prompt)
+            else:
+                with trace.span("save"):
+                    transcript_path = self._write_output(source_key, f"{base_name}.txt", transcript)
+                summaries = self._summarize_fan_out(inputs, targets, source_key, base_name, hooks, trace)
+                succeeded = [entry for entry in summaries.values() if entry["status"] == "succeeded"]
+                if not succeeded:
+                    raise Exception("All summaries failed: " + "; ".join(
+                        f"{entry['key']}: {entry['error']}" for entry in summaries.values()
+                    ))
+                summary = succeeded[0]["summary"]
+                files = {"transcript": transcript_path, "summary": succeeded[0]["file"]}
+                states = {entry["cache"] for entry in succeeded} - {"disabled"}
+                if states:
+                    cache_status["summary"] = states.pop() if len(states) == 1 else "partial"
+            outcome = "ok"
+            result = {
+                "segments": structured.to_compact(),
                 "summary": summary,
-                "files": {
-                    "transcript": transcript_path,
-                    "summary": summary_path
-                }
+                "files": files,
+                "cache": cache_status,
+                "compaction": compaction,
+                "media": media,
+                "timings": trace.breakdown(),
             }
+            if summaries is not None:
+                result["summaries"] = summaries
+            return result
 
         except Exception as e:
             logger.error(f"Pipeline Error: {e}")
             raise e
             
         finally:
-            # Cleanup OSS
-            if oss_key:
-                self.oss.delete_file(oss_key)
-            
-            # Cleanup temp file
-            if temp_audio_file and os.path.exists(temp_audio_file):
-                try:
-                    os.remove(temp_audio_file)
+            with trace.span("cleanup"):
+                # Cleanup OSS
+                if oss_key:
+                    self.oss.delete_file(oss_key)
+
+                # Cleanup temp file
+                if temp_audio_file:
+                    self.workspace.remove(temp_audio_file)
                     logger.info(f"Cleaned up temp audio: {temp_audio_file}")
-                except Exception as e:
-                    logger.warning(f"Failed to cleanup temp audio: {e}")
+                # 下载文件保留在工作区中供之后复用，超出配额时按 LRU 淘汰
+                if pinned_key:
+                    self.workspace.unpin(pinned_key)
+            trace.finish(outcome)
@@ -0,0 +1,307 @@
+import time
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+from .pipeline import PipelineHooks
+from utils.logger import get_logger
+
+logger = get_logger("Scheduler")
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+# transcode_upload 为边转码边上传 (ffmpeg 输出直接流式上传)，作为一个阶段只占用一个名额
+STAGES = ("download", "transcode", "upload", "transcode_upload", "asr", "summarize")
+
+
+class JobCancelled(Exception):
+    """任务已被取消 (如 worker 失去租约)，在进入下一个阶段时中止"""
+
+
+class PrioritySemaphore:
+    """按 (优先级, 到达顺序) 排队的计数信号量，数值越小越优先"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._active = 0
+        self._waiters = []
+        self._cond = threading.Condition()
+
+    def acquire(self, priority: int, seq: int, job_id: str):
+        entry = (priority, seq, job_id)
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            while self._active >= self.limit or self._waiters[0] != entry:
+                self._cond.wait()
+            heapq.heappop(self._waiters)
+            self._active += 1
+            self._cond.notify_all()
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def position(self, job_id: str) -> Optional[int]:
+        """返回排队位置 (0 表示下一个获得资源)，不在队列中返回 None"""
+        with self._cond:
+            for i, entry in enumerate(sorted(self._waiters)):
+                if entry[2] == job_id:
+                    return i
+        return None
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {"limit": self.limit, "active": self._active, "waiting": len(self._waiters)}
+
+
+class Job:
+    def __init__(self, job_id: str, dedup_key: str, runner: Callable, priority: int, seq: int):
+        self.job_id = job_id
+        self.dedup_key = dedup_key
+        self.runner = runner
+        self.priority = priority
+        self.seq = seq
+        self.stage = "queued"
+        self.waiting = True
+        self.cancelled = False
+        # 与本任务合并的所有 task_id (包括自身)
+        self.task_ids: List[str] = [job_id]
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class _JobHooks(PipelineHooks):
+    def __init__(self, scheduler: "JobScheduler", job: Job):
+        self.scheduler = scheduler
+        self.job = job
+        # 线程 id -> 嵌套的 [阶段, 是否排队中] (分段转写时多个线程同时处于不同阶段)
+        self._stacks: Dict[int, list] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def wants_deltas(self) -> bool:
+        # 在开始生成摘要时判断，之后才连上的订阅者只收到最终结果
+        check = self.scheduler.wants_deltas
+        if check is None or self.scheduler.event_sink is None:
+            return False
+        with self.scheduler._cond:
+            task_ids = list(self.job.task_ids)
+        return any(check(task_id) for task_id in task_ids)
+
+    def emit(self, event: str, data=None):
+        self.scheduler._emit(self.job, event, data)
+
+    def _check_cancelled(self):
+        if self.job.cancelled:
+            raise JobCancelled(f"Job {self.job.job_id} was cancelled")
+
+    @contextmanager
+    def stage(self, name: str):
+        self._check_cancelled()
+        sem = self.scheduler.stages.get(name)
+        self._enter(name, waiting=sem is not None)
+        try:
+            self.emit("stage", name)
+            wait_start = time.time()
+            if sem is not None:
+                sem.acquire(self.job.priority, self.job.seq, self.job.job_id)
+                if self.job.cancelled:
+                    sem.release()
+                    self._check_cancelled()
+                self._acquired()
+            busy_start = time.time()
+            try:
+                yield
+            finally:
+                if sem is not None:
+                    sem.release()
+                self.emit("stage_done", {
+                    "stage": name,
+                    "waited": round(busy_start - wait_start, 3),
+                    "seconds": round(time.time() - busy_start, 3),
+                })
+        finally:
+            self._leave()
+
+    def _enter(self, name: str, waiting: bool):
+        with self._lock:
+            self._stacks.setdefault(threading.get_ident(), []).append([name, waiting])
+            self._sync()
+
+    def _acquired(self):
+        with self._lock:
+            self._stacks[threading.get_ident()][-1][1] = False
+            self._sync()
+
+    def _leave(self):
+        ident = threading.get_ident()
+        with self._lock:
+            stack = self._stacks[ident]
+            stack.pop()
+            if not stack:
+                del self._stacks[ident]
+            self._sync()
+
+    def _sync(self):
+        """持锁调用: 把各线程当前所处的阶段汇总到 job (有线程在执行时取执行中的阶段，全部排队时才算等待)"""
+        current = [stack[-1] for stack in self._stacks.values()]
+        if not current:
+            self.job.waiting = False
+            return
+        running = [name for name, waiting in current if not waiting]
+        self.job.stage = running[-1] if running else current[-1][0]
+        self.job.waiting = not running
+
+
+class JobScheduler:
+    """
+    有界的分阶段任务调度器:
+    - 最多 max_active_jobs 个任务同时在 Pipeline 中执行，其余按优先级排队
+    - download / transcode / upload / transcode_upload / asr / summarize 各阶段有独立的并发上限
+    - 相同 dedup_key 的在途任务合并为一次执行
+
+    listener(task_id, status, result, error) 在任务开始 / 结束时回调，
+    event_sink(task_id, event, data) 接收阶段变化与摘要增量等事件。
+    wants_deltas(task_id) 为 True (如有订阅者或请求了流式输出) 时摘要以流式生成并 emit "delta" 事件，
+    未提供时不做流式生成。
+    """
+
+    def __init__(self, stage_limits: Dict[str, int], max_active_jobs: int,
+                 listener: Optional[Callable] = None, event_sink: Optional[Callable] = None,
+                 wants_deltas: Optional[Callable] = None):
+        self.stages = {name: PrioritySemaphore(limit) for name, limit in stage_limits.items()}
+        self.listener = listener
+        self.event_sink = event_sink
+        self.wants_deltas = wants_deltas
+        self._seq = itertools.count()
+        self._pending = []
+        self._jobs: Dict[str, Job] = {}         # task_id -> Job
+        self._inflight: Dict[str, Job] = {}     # dedup_key -> Job
+        self._cond = threading.Condition()
+        self._workers = [
+            threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            for i in range(max_active_jobs)
+        ]
+        for t in self._workers:
+            t.start()
+
+    def submit(self, task_id: str, dedup_key: str, runner: Callable, priority: int = PRIORITY_INTERACTIVE) -> str:
+        """
+        提交任务。runner(hooks) 执行实际工作并返回结果。
+        若已有相同 dedup_key 的在途任务，则合并并返回该任务的 job_id。
+        """
+        with self._cond:
+            existing = self._inflight.get(dedup_key)
+            if existing:
+                existing.task_ids.append(task_id)
+                self._jobs[task_id] = existing
+                if priority < existing.priority and existing.stage == "queued":
+                    # 交互式请求提升排队中的批量任务
+                    existing.priority = priority
+                    heapq.heapify(self._pending)
+                logger.info(f"Collapsed task {task_id} into in-flight job {existing.job_id}")
+                return existing.job_id
+
+            job = Job(task_id, dedup_key, runner, priority, next(self._seq))
+            self._jobs[task_id] = job
+            self._inflight[dedup_key] = job
+            heapq.heappush(self._pending, job)
+            self._cond.notify()
+            return job.job_id
+
+    def describe(self, task_id: str) -> Optional[dict]:
+        """返回在途任务的当前阶段与排队位置"""
+        with self._cond:
+            job = self._jobs.get(task_id)
+            if not job:
+                return None
+            if job.stage == "queued":
+                position = sorted(self._pending).index(job) if job in self._pending else 0
+            else:
+                position = None
+        if position is None and job.waiting and job.stage in self.stages:
+            position = self.stages[job.stage].position(job.job_id)
+        return {
+            "job_id": job.job_id,
+            "stage": job.stage,
+            "waiting": job.waiting,
+            "queue_position": position,
+        }
+
+    def cancel(self, task_id: str) -> bool:
+        """取消在途任务: 排队中的不再执行，执行中的在进入下一个阶段时以 JobCancelled 结束"""
+        with self._cond:
+            job = self._jobs.get(task_id)
+            if not job:
+                return False
+            job.cancelled = True
+        logger.info(f"Cancelling job {job.job_id}")
+        return True
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            pending = len(self._pending)
+            inflight = len(self._inflight)
+        return {
+            "pending": pending,
+            "inflight": inflight,
+            "stages": {name: sem.snapshot() for name, sem in self.stages.items()},
+        }
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                job = heapq.heappop(self._pending)
+                job.stage = "starting"
+                job.waiting = False
+            self._run_job(job)
+
+    def _run_job(self, job: Job):
+        self._notify(job, "processing")
+        result, error = None, None
+        try:
+            if job.cancelled:
+                raise JobCancelled(f"Job {job.job_id} was cancelled")
+            result = job.runner(_JobHooks(self, job))
+        except Exception as e:
+            error = e
+            logger.error(f"Job {job.job_id} failed: {e}")
+        with self._cond:
+            self._inflight.pop(job.dedup_key, None)
+            task_ids = list(job.task_ids)
+            for task_id in task_ids:
+                self._jobs.pop(task_id, None)
+        for task_id in task_ids:
+            if self.listener:
+                try:
+                    self.listener(task_id, "failed" if error else "succeeded", result, error)
+                except Exception as e:
+                    logger.error(f"Listener error for {task_id}: {e}")
+
+    def _emit(self, job: Job, event: str, data):
+        if not self.event_sink:
+            return
+        with self._cond:
+            task_ids = list(job.task_ids)
+        for task_id in task_ids:
+            try:
+                self.event_sink(task_id, event, data)
+            except Exception as e:
+                logger.error(f"Event sink error for {task_id}: {e}")
+
+    def _notify(self, job: Job, status: str):
+        if not self.listener:
+            return
+        with self._cond:
+            task_ids = list(job.task_ids)
+        for task_id in task_ids:
+            try:
+                self.listener(task_id, status, None, None)
+            except Exception as e:
+                logger.error(f"Listener error for {task_id}: {e}")
@@ -0,0 +1,61 @@
+import re
+import subprocess
+from typing import List, Optional, Tuple
+from utils.helpers import get_ffmpeg_exe
+from utils.logger import get_logger
+
+logger = get_logger("Segmenter")
+
+DURATION_PATTERN = re.compile(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)")
+SILENCE_START = re.compile(r"silence_start:\s*(-?\d+(?:\.\d+)?)")
+SILENCE_END = re.compile(r"silence_end:\s*(-?\d+(?:\.\d+)?)")
+
+
+def probe_duration(media_path: str) -> Optional[float]:
+    """读取媒体时长 (秒)，失败返回 None"""
+    cmd = [get_ffmpeg_exe(), "-hide_banner", "-i", media_path]
+    proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    match = DURATION_PATTERN.search(proc.stderr.decode("utf-8", errors="replace"))
+    if not match:
+        return None
+    h, m, s = match.groups()
+    return int(h) * 3600 + int(m) * 60 + float(s)
+
+
+def detect_silences(media_path: str, noise_db: float, min_silence: float) -> List[Tuple[float, float]]:
+    """用 ffmpeg silencedetect 找出静音区间 [(start, end), ...] (秒)"""
+    cmd = [
+        get_ffmpeg_exe(), "-hide_banner", "-nostats", "-i", media_path, "-vn",
+        "-af", f"silencedetect=noise={noise_db}dB:d={min_silence}", "-f", "null", "-",
+    ]
+    proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    silences, start = [], None
+    for line in proc.stderr.decode("utf-8", errors="replace").splitlines():
+        m = SILENCE_START.search(line)
+        if m:
+            start = max(0.0, float(m.group(1)))
+            continue
+        m = SILENCE_END.search(line)
+        if m and start is not None:
+            silences.append((start, float(m.group(1))))
+            start = None
+    return silences
+
+
+def plan_segments(duration: float, silences: List[Tuple[float, float]],
+                  target_seconds: float, max_seconds: float) -> List[Tuple[float, float]]:
+    """
+    规划切分点: 每段尽量接近 target_seconds，在 [target/2, max] 范围内选择离目标最近的静音中点切开；
+    找不到静音时在 max_seconds 处硬切。返回 [(start, end), ...] (秒)。
+    """
+    cut_points = [(s + e) / 2 for s, e in silences]
+    segments = []
+    start = 0.0
+    while duration - start > max_seconds:
+        target = start + target_seconds
+        candidates = [c for c in cut_points if start + target_seconds / 2 <= c <= start + max_seconds]
+        end = min(candidates, key=lambda c: abs(c - target)) if candidates else start + max_seconds
+        segments.append((start, end))
+        start = end
+    segments.append((start, duration))
+    return segments
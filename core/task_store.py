@@ -0,0 +1,276 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional
+from utils.logger import get_logger
+
+logger = get_logger("TaskStore")
+
+FINISHED_STATUSES = ("succeeded", "failed")
+
+
+class TaskStore(ABC):
+    """
+    任务存储接口。
+    任务元数据 (状态 / 错误 / 进度 / 请求参数) 为小行，结果正文单独存放，仅在需要时读取。
+    """
+
+    @abstractmethod
+    def create(self, task_id: str, source: str, source_key: str, request: dict, status: str = "queued"):
+        ...
+
+    @abstractmethod
+    def update(self, task_id: str, **fields):
+        """更新 status / error / progress 等元数据字段"""
+        ...
+
+    @abstractmethod
+    def set_result(self, task_id: str, result: dict):
+        """保存结果正文并把状态置为 succeeded"""
+        ...
+
+    @abstractmethod
+    def get(self, task_id: str, include_result: bool = True) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def get_request(self, task_id: str) -> Optional[dict]:
+        """任务的请求参数 (重启恢复 / 批量任务使用)"""
+        ...
+
+    @abstractmethod
+    def list(self, offset: int = 0, limit: int = 20, status: str = None, source_key: str = None) -> dict:
+        ...
+
+    @abstractmethod
+    def unfinished(self) -> list:
+        """排队中 / 执行中的任务 (重启后重新入队)"""
+        ...
+
+
+class SQLiteTaskStore(TaskStore):
+    """
+    SQLite 任务存储:
+    - tasks 表保存元数据，按 task_id 主键、source_key / status / updated_at 建索引
+    - results 表保存结果 JSON，按需懒加载
+    - 已结束任务超过 ttl_seconds 或总数超过 max_finished 时按更新时间淘汰
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS tasks (
+        task_id TEXT PRIMARY KEY,
+        source TEXT NOT NULL,
+        source_key TEXT NOT NULL,
+        status TEXT NOT NULL,
+        request TEXT,
+        error TEXT,
+        progress TEXT,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_tasks_source_key ON tasks(source_key);
+    CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status, updated_at);
+    CREATE INDEX IF NOT EXISTS idx_tasks_created ON tasks(created_at);
+    CREATE TABLE IF NOT EXISTS results (
+        task_id TEXT PRIMARY KEY,
+        body TEXT NOT NULL
+    );
+    """
+
+    META_COLUMNS = ("task_id", "source", "source_key", "status", "error", "progress", "created_at", "updated_at")
+    EVICT_EVERY = 100
+
+    def __init__(self, db_path: str, ttl_seconds: int, max_finished: int):
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.max_finished = max_finished
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self.evict()
+
+    def create(self, task_id, source, source_key, request, status="queued"):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO tasks (task_id, source, source_key, status, request, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (task_id, source, source_key, status, json.dumps(request, ensure_ascii=False), now, now),
+            )
+            self._writes += 1
+            evict = self._writes % self.EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def update(self, task_id, **fields):
+        if "progress" in fields:
+            fields["progress"] = json.dumps(fields["progress"], ensure_ascii=False)
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE tasks SET {columns}, updated_at = ? WHERE task_id = ?",
+                (*fields.values(), time.time(), task_id),
+            )
+
+    def set_result(self, task_id, result):
+        body = json.dumps(result, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("INSERT OR REPLACE INTO results (task_id, body) VALUES (?, ?)", (task_id, body))
+                self._conn.execute(
+                    "UPDATE tasks SET status = 'succeeded', progress = NULL, updated_at = ? WHERE task_id = ?",
+                    (time.time(), task_id),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get(self, task_id, include_result=True):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self.META_COLUMNS)} FROM tasks WHERE task_id = ?", (task_id,)
+            ).fetchone()
+            if not row:
+                return None
+            task = self._row_to_task(row)
+            task["result"] = None
+            if include_result and task["status"] == "succeeded":
+                body = self._conn.execute("SELECT body FROM results WHERE task_id = ?", (task_id,)).fetchone()
+                task["result"] = json.loads(body[0]) if body else None
+        return task
+
+    def get_request(self, task_id) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT request FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def list(self, offset=0, limit=20, status=None, source_key=None):
+        where, params = [], []
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        if source_key:
+            where.append("source_key = ?")
+            params.append(source_key)
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM tasks {clause}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT {', '.join(self.META_COLUMNS)} FROM tasks {clause} "
+                f"ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                (*params, limit, offset),
+            ).fetchall()
+        return {"total": total, "offset": offset, "limit": limit, "items": [self._row_to_task(r) for r in rows]}
+
+    def unfinished(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT task_id, request FROM tasks WHERE status IN ('queued', 'processing') ORDER BY created_at"
+            ).fetchall()
+        return [{"task_id": r[0], "request": json.loads(r[1]) if r[1] else None} for r in rows]
+
+    def evict(self):
+        """删除过期的已结束任务，并把已结束任务数控制在 max_finished 以内"""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "DELETE FROM tasks WHERE status IN ('succeeded', 'failed') AND updated_at < ?", (cutoff,)
+                )
+                self._conn.execute(
+                    "DELETE FROM tasks WHERE task_id IN ("
+                    "  SELECT task_id FROM tasks WHERE status IN ('succeeded', 'failed')"
+                    "  ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_finished,),
+                )
+                self._conn.execute("DELETE FROM results WHERE task_id NOT IN (SELECT task_id FROM tasks)")
+                self._conn.execute("COMMIT")
+            except Exception as e:
+                self._conn.execute("ROLLBACK")
+                logger.error(f"Task eviction failed: {e}")
+
+    def _row_to_task(self, row) -> dict:
+        task = dict(zip(self.META_COLUMNS, row))
+        task["progress"] = json.loads(task["progress"]) if task["progress"] else None
+        return task
+
+
+class MemoryTaskStore(TaskStore):
+    """进程内任务存储 (不持久化)，超过 max_tasks 时淘汰最早创建的已结束任务"""
+
+    def __init__(self, max_tasks: int):
+        self.max_tasks = max_tasks
+        self._tasks = OrderedDict()
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def create(self, task_id, source, source_key, request, status="queued"):
+        now = time.time()
+        with self._lock:
+            self._tasks[task_id] = {
+                "task_id": task_id, "source": source, "source_key": source_key, "status": status,
+                "error": None, "progress": None, "created_at": now, "updated_at": now, "request": request,
+            }
+            if len(self._tasks) > self.max_tasks:
+                for old_id in [k for k, t in self._tasks.items() if t["status"] in FINISHED_STATUSES]:
+                    if len(self._tasks) <= self.max_tasks:
+                        break
+                    del self._tasks[old_id]
+                    self._results.pop(old_id, None)
+
+    def update(self, task_id, **fields):
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is not None:
+                task.update(fields, updated_at=time.time())
+
+    def set_result(self, task_id, result):
+        with self._lock:
+            self._results[task_id] = result
+            task = self._tasks.get(task_id)
+            if task is not None:
+                task.update(status="succeeded", progress=None, updated_at=time.time())
+
+    def get(self, task_id, include_result=True):
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None:
+                return None
+            task = {k: v for k, v in task.items() if k != "request"}
+            task["result"] = self._results.get(task_id) if include_result else None
+        return task
+
+    def get_request(self, task_id):
+        with self._lock:
+            task = self._tasks.get(task_id)
+            return task["request"] if task else None
+
+    def list(self, offset=0, limit=20, status=None, source_key=None):
+        with self._lock:
+            items = [
+                {k: v for k, v in t.items() if k != "request"}
+                for t in reversed(self._tasks.values())
+                if (not status or t["status"] == status) and (not source_key or t["source_key"] == source_key)
+            ]
+        return {"total": len(items), "offset": offset, "limit": limit, "items": items[offset:offset + limit]}
+
+    def unfinished(self):
+        return []
+
+
+def create_task_store(settings) -> TaskStore:
+    if settings.TASK_STORE_BACKEND == "memory":
+        return MemoryTaskStore(settings.TASK_MAX_FINISHED)
+    return SQLiteTaskStore(settings.TASK_DB_PATH, settings.TASK_TTL_SECONDS, settings.TASK_MAX_FINISHED)
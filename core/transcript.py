@@ -0,0 +1,224 @@
+import re
+import json
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Iterable, Iterator, List, Optional, Tuple
+from utils.helpers import format_milliseconds
+
+# 无时间戳的片段 (如整段文本结果) 用 -1 表示
+NO_TIME = -1
+TEXT_LINE_PATTERN = re.compile(r"^\[(\d+):(\d{2}):(\d{2})\]\s?(.*)$")
+
+Segment = Tuple[int, int, str, Optional[int]]
+
+
+def _timestamp(ms: int, separator: str) -> str:
+    ms = max(0, ms)
+    hours, rest = divmod(ms, 3600000)
+    minutes, rest = divmod(rest, 60000)
+    seconds, millis = divmod(rest, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{millis:03d}"
+
+
+class Transcript:
+    """
+    紧凑的结构化转录结果。
+    按片段 (句子) 顺序存放并行数组: 起止时间 (毫秒)、说话人，以及全部文本拼接成的单个字符串与各片段的偏移量，
+    一次遍历构建。TXT / SRT / VTT / JSON 在需要时再渲染，TXT 渲染结果会被缓存。
+    多声道结果按开始时间合并排序；起止时间不单调 (如旧缓存中的多声道结果、句子互相重叠) 时按时间查询退化为线性扫描。
+    """
+
+    __slots__ = ("begins", "ends", "speakers", "offsets", "buffer", "_text", "_ordered")
+
+    def __init__(self, begins: array, ends: array, offsets: array, buffer: str, speakers: array = None):
+        self.begins = begins
+        self.ends = ends
+        # 第 i 个片段的文本为 buffer[offsets[i]:offsets[i + 1]]
+        self.offsets = offsets
+        self.buffer = buffer
+        self.speakers = speakers
+        self._text = None
+        self._ordered = None
+
+    # ---- 构建 ----
+
+    @classmethod
+    def build(cls, segments: Iterable[Segment]) -> "Transcript":
+        """从 (begin_ms, end_ms, text, speaker) 序列构建"""
+        begins, ends, offsets, speakers = array("q"), array("q"), array("q", [0]), array("i")
+        parts, position, has_speaker = [], 0, False
+        for begin, end, text, speaker in segments:
+            begins.append(NO_TIME if begin is None else int(begin))
+            ends.append(NO_TIME if end is None else int(end))
+            speakers.append(-1 if speaker is None else int(speaker))
+            has_speaker = has_speaker or speaker is not None
+            parts.append(text)
+            position += len(text)
+            offsets.append(position)
+        return cls(begins, ends, offsets, "".join(parts), speakers if has_speaker else None)
+
+    @classmethod
+    def from_dashscope(cls, data, offset_ms: int = 0) -> "Transcript":
+        """解析 DashScope transcription_url 返回的 JSON，所有时间整体加上 offset_ms"""
+        def segments():
+            if not (isinstance(data, dict) and "transcripts" in data):
+                return
+            for item in data["transcripts"]:
+                if "sentences" in item:
+                    for sent in item["sentences"]:
+                        begin = sent.get("begin_time", 0)
+                        yield (
+                            begin + offset_ms,
+                            sent.get("end_time", begin) + offset_ms,
+                            sent.get("text", ""),
+                            sent.get("speaker_id"),
+                        )
+                elif "text" in item:
+                    yield None, None, item["text"], None
+
+        if isinstance(data, dict) and len(data.get("transcripts") or []) > 1:
+            # 多声道: 各声道的句子按开始时间交错合并 (无时间戳片段保持在最前)
+            return cls.build(sorted(segments(), key=lambda seg: -1 if seg[0] is None else seg[0]))
+        return cls.build(segments())
+
+    @classmethod
+    def from_text(cls, text: str) -> "Transcript":
+        """
+        解析 [HH:MM:SS] text 格式的文本 (旧版缓存与任务结果)。
+        结束时间取下一行的开始时间，无法解析的行作为无时间戳片段。
+        """
+        rows = []
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            m = TEXT_LINE_PATTERN.match(line)
+            if m:
+                h, mi, s, body = m.groups()
+                rows.append([(int(h) * 3600 + int(mi) * 60 + int(s)) * 1000, body])
+            else:
+                rows.append([None, line])
+        segments = []
+        for i, (begin, body) in enumerate(rows):
+            following = rows[i + 1][0] if i + 1 < len(rows) else None
+            end = following if begin is not None and following is not None else begin
+            segments.append((begin, end, body, None))
+        return cls.build(segments)
+
+    @classmethod
+    def concat(cls, parts: List["Transcript"]) -> "Transcript":
+        return cls.build(seg for part in parts for seg in part)
+
+    # ---- 紧凑序列化 (缓存 / 任务结果) ----
+
+    def to_compact(self) -> dict:
+        compact = {
+            "begin": self.begins.tolist(),
+            "end": self.ends.tolist(),
+            "offsets": self.offsets.tolist(),
+            "text": self.buffer,
+        }
+        if self.speakers is not None:
+            compact["speaker"] = self.speakers.tolist()
+        return compact
+
+    @classmethod
+    def from_compact(cls, data: dict) -> "Transcript":
+        speakers = data.get("speaker")
+        return cls(
+            array("q", data["begin"]), array("q", data["end"]), array("q", data["offsets"]), data["text"],
+            array("i", speakers) if speakers is not None else None,
+        )
+
+    # ---- 访问 ----
+
+    def __len__(self) -> int:
+        return len(self.begins)
+
+    def segment(self, index: int) -> Segment:
+        begin, end = self.begins[index], self.ends[index]
+        speaker = self.speakers[index] if self.speakers is not None else -1
+        return (
+            None if begin == NO_TIME else begin,
+            None if end == NO_TIME else end,
+            self.buffer[self.offsets[index]:self.offsets[index + 1]],
+            None if speaker < 0 else speaker,
+        )
+
+    def __iter__(self) -> Iterator[Segment]:
+        return (self.segment(i) for i in range(len(self)))
+
+    @property
+    def timed(self) -> bool:
+        return NO_TIME not in self.begins
+
+    @property
+    def duration_ms(self) -> int:
+        return max(self.ends) if len(self) and self.timed else 0
+
+    def window(self, start_ms: int = None, end_ms: int = None) -> "Transcript":
+        """返回与 [start_ms, end_ms) 有重叠的片段；存在无时间戳片段时返回全部"""
+        if not self.timed or (start_ms is None and end_ms is None):
+            return self
+        if not self.ordered:
+            return Transcript.build(
+                self.segment(i) for i in range(len(self))
+                if (start_ms is None or self.ends[i] > start_ms) and (end_ms is None or self.begins[i] < end_ms)
+            )
+        first = bisect_right(self.ends, start_ms) if start_ms is not None else 0
+        last = bisect_left(self.begins, end_ms) if end_ms is not None else len(self)
+        return Transcript.build(self.segment(i) for i in range(first, max(first, last)))
+
+    @property
+    def ordered(self) -> bool:
+        """起止时间是否都单调不减 (可以二分查找)"""
+        if self._ordered is None:
+            self._ordered = all(
+                self.begins[i] <= self.begins[i + 1] and self.ends[i] <= self.ends[i + 1]
+                for i in range(len(self) - 1)
+            )
+        return self._ordered
+
+    # ---- 渲染 ----
+
+    def to_text(self) -> str:
+        """[HH:MM:SS] text 格式，每个片段一行 (与摘要、缓存使用的文本一致)"""
+        if self._text is None:
+            lines = []
+            for begin, _, text, _ in self:
+                lines.append(f"{text}\n" if begin is None else f"[{format_milliseconds(begin)}] {text}\n")
+            self._text = "".join(lines)
+        return self._text
+
+    def to_srt(self) -> str:
+        blocks = []
+        for index, (begin, end, text, _) in enumerate(self, 1):
+            begin, end = begin or 0, end or begin or 0
+            blocks.append(f"{index}\n{_timestamp(begin, ',')} --> {_timestamp(end, ',')}\n{text}\n")
+        return "\n".join(blocks)
+
+    def to_vtt(self) -> str:
+        blocks = ["WEBVTT\n"]
+        for begin, end, text, _ in self:
+            begin, end = begin or 0, end or begin or 0
+            blocks.append(f"{_timestamp(begin, '.')} --> {_timestamp(end, '.')}\n{text}\n")
+        return "\n".join(blocks)
+
+    def to_dict(self) -> dict:
+        segments = []
+        for begin, end, text, speaker in self:
+            segment = {"begin_ms": begin, "end_ms": end, "text": text}
+            if speaker is not None:
+                segment["speaker"] = speaker
+            segments.append(segment)
+        return {"duration_ms": self.duration_ms, "segments": segments}
+
+    def render(self, fmt: str) -> str:
+        if fmt == "txt":
+            return self.to_text()
+        if fmt == "srt":
+            return self.to_srt()
+        if fmt == "vtt":
+            return self.to_vtt()
+        if fmt == "json":
+            return json.dumps(self.to_dict(), ensure_ascii=False)
+        raise ValueError(f"Unsupported transcript format: {fmt}")
@@ -0,0 +1,147 @@
+import os
+import time
+import uuid
+import socket
+import threading
+from typing import Callable, Dict, Optional
+from .job_queue import JobQueue
+from .scheduler import JobScheduler
+from utils.logger import get_logger
+
+logger = get_logger("Worker")
+
+
+class QueueWorker:
+    """
+    队列 worker: 从 JobQueue 租用任务，交给本进程的 JobScheduler 执行 (各阶段并发上限与 API 进程内执行时相同)。
+    - 同时执行的任务数不超过 concurrency，有空闲名额时才租用新任务，多余的任务留在队列中由其它 worker 领取
+    - 心跳线程每 lease_seconds / 3 秒为执行中的任务续租；进程崩溃时租约过期，任务被重新投递给其它 worker；
+      续租失败 (任务已被重新投递) 时取消本地执行，不再进入后续阶段，避免与其它 worker 重复调用 DashScope
+    - 阶段 / 进度 / 摘要增量等事件与最终结果通过队列回传给 API 进程
+
+    execute(payload, hooks) 执行任务并返回结果。stop() 后不再租用新任务，run() 等执行中的任务结束后返回。
+    wants_deltas(payload) 为 True 的任务才以流式生成摘要并经队列回传 "delta" 事件
+    (worker 无法得知 API 进程中的订阅者，只按请求显式开启)。
+    """
+
+    def __init__(self, queue: JobQueue, execute: Callable, stage_limits: Dict[str, int], concurrency: int,
+                 lease_seconds: float, poll_interval: float, worker_id: str = None,
+                 wants_deltas: Optional[Callable] = None):
+        self.queue = queue
+        self.execute = execute
+        self.concurrency = max(1, concurrency)
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.scheduler = JobScheduler(
+            stage_limits=stage_limits,
+            max_active_jobs=self.concurrency,
+            listener=self._on_update,
+            event_sink=self._on_event,
+            wants_deltas=lambda job_id: job_id in self._streaming,
+        )
+        self._wants_deltas = wants_deltas
+        self._running: Dict[str, int] = {}   # job_id -> 租用次数 (attempts)
+        self._streaming = set()               # 需要回传摘要增量的 job_id
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._stats = {"leased": 0, "succeeded": 0, "failed": 0, "lost": 0}
+
+    def run(self):
+        logger.info(f"Worker {self.worker_id} started (concurrency {self.concurrency})")
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name="worker-heartbeat", daemon=True)
+        heartbeat.start()
+        while not self._stop.is_set():
+            with self._cond:
+                if len(self._running) >= self.concurrency:
+                    self._cond.wait(self.poll_interval)
+                    continue
+            try:
+                job = self.queue.lease(self.worker_id, self.lease_seconds)
+            except Exception as e:
+                logger.error(f"Failed to lease job: {e}")
+                job = None
+            if job is None:
+                self._stop.wait(self.poll_interval)
+                continue
+            self._start(job)
+
+        with self._cond:
+            if self._running:
+                logger.info(f"Worker {self.worker_id} stopping, waiting for {len(self._running)} running jobs")
+            while self._running:
+                self._cond.wait()
+        logger.info(f"Worker {self.worker_id} stopped: {self._stats}")
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return dict(self._stats, worker_id=self.worker_id, running=len(self._running))
+
+    def _start(self, job: dict):
+        job_id = job["job_id"]
+        with self._cond:
+            self._running[job_id] = job["attempts"]
+            self._stats["leased"] += 1
+            if self._wants_deltas and self._wants_deltas(job["payload"]):
+                self._streaming.add(job_id)
+        if job["attempts"] > 1:
+            logger.info(f"Re-running job {job_id} (attempt {job['attempts']})")
+        else:
+            logger.info(f"Leased job {job_id}")
+        self.scheduler.submit(
+            job_id, job_id,
+            lambda hooks, payload=job["payload"]: self.execute(payload, hooks),
+            priority=job["priority"],
+        )
+
+    def _on_update(self, job_id: str, status: str, result, error):
+        if status == "processing":
+            self._publish(job_id, "status", status)
+            return
+        try:
+            if status == "succeeded":
+                delivered = self.queue.finish(job_id, self.worker_id, "succeeded", result)
+            else:
+                delivered = self.queue.finish(job_id, self.worker_id, "failed", {"error": str(error)})
+            if not delivered:
+                logger.warning(f"Lease of job {job_id} was lost, discarding its result")
+        except Exception as e:
+            delivered = False
+            logger.error(f"Failed to report job {job_id}: {e}")
+        with self._cond:
+            self._running.pop(job_id, None)
+            self._streaming.discard(job_id)
+            self._stats[status if delivered else "lost"] += 1
+            self._cond.notify_all()
+
+    def _on_event(self, job_id: str, event: str, data):
+        self._publish(job_id, event, data)
+
+    def _publish(self, job_id: str, event: str, data):
+        try:
+            self.queue.publish(job_id, event, data)
+        except Exception as e:
+            logger.warning(f"Failed to publish {event} for job {job_id}: {e}")
+
+    def _heartbeat_loop(self):
+        interval = max(0.5, self.lease_seconds / 3)
+        while True:
+            time.sleep(interval)
+            with self._cond:
+                job_ids = list(self._running)
+            if not job_ids:
+                if self._stop.is_set():
+                    return
+                continue
+            try:
+                lost = self.queue.heartbeat(job_ids, self.worker_id, self.lease_seconds)
+            except Exception as e:
+                logger.error(f"Heartbeat failed: {e}")
+                continue
+            for job_id in lost:
+                # 续租失败 (如长时间失联后任务已被重新投递)，结束时结果会被丢弃
+                logger.warning(f"Lost lease of job {job_id}, cancelling it")
+                self.scheduler.cancel(job_id)
@@ -0,0 +1,465 @@
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+from utils.logger import get_logger
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+logger = get_logger("Workspace")
+
+INDEX_NAME = ".workspace.json"
+INDEX_LOCK_NAME = ".workspace.lock"
+TEMP_DIR = ".tmp"
+# 各进程持有自己的 owner 锁文件直到退出，其它进程据此判断 pin 的持有者是否仍在运行
+OWNERS_DIR = ".owners"
+# 按输入源的下载锁文件
+LOCKS_DIR = ".locks"
+# 下载目录中不属于工作区管理的条目 (OSS 断点记录等)
+RESERVED_NAMES = (INDEX_NAME, INDEX_LOCK_NAME, TEMP_DIR, OWNERS_DIR, LOCKS_DIR, ".oss_checkpoints")
+# Windows 上阻塞加锁时的重试间隔 (秒)
+LOCK_RETRY_SECONDS = 0.05
+# 启动时清理超过该时长的残留临时文件 (秒)，较新的可能属于仍在运行的其它进程
+STALE_TEMP_SECONDS = 3600
+# 旧版直接保存在下载目录根部的文件: yt-dlp 按标题命名后转为 <标题>.mp3，以及 <名称>_temp_audio.mp3 中间音频
+LEGACY_DOWNLOAD_PATTERN = re.compile(r".+\.mp3", re.IGNORECASE)
+UNTRACKED_PREFIX = "untracked:"
+SLUG_UNSAFE = re.compile(r"[^0-9A-Za-z_-]+")
+SLUG_MAX_LENGTH = 48
+
+
+def atomic_write(path: str, text: str):
+    """先写同目录下的临时文件再 os.replace，读者不会看到写了一半的文件"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def source_slug(key: str) -> str:
+    """把 normalize_source 的标识 (bili:BVxxx / file:<sha256> / url:...) 转为可用作目录名的短标识"""
+    slug = SLUG_UNSAFE.sub("_", key).strip("_")
+    if len(slug) > SLUG_MAX_LENGTH:
+        prefix = SLUG_UNSAFE.sub("_", key.split(":", 1)[0])[:8]
+        slug = f"{prefix}_{hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]}"
+    return slug or "unknown"
+
+
+def _try_lock(f) -> bool:
+    """对已打开的文件加排它锁 (跨进程)，已被其它进程 / 文件句柄锁住时返回 False"""
+    try:
+        if os.name == "nt":
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def _lock(f):
+    if os.name == "nt":
+        while not _try_lock(f):
+            time.sleep(LOCK_RETRY_SECONDS)
+    else:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def _unlock(f):
+    if os.name == "nt":
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def _file_lock(path: str):
+    with open(path, "a+") as f:
+        _lock(f)
+        try:
+            yield
+        finally:
+            _unlock(f)
+
+
+def _disk_bytes(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _delete(path: str):
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+    except OSError as e:
+        logger.warning(f"Failed to delete {path}: {e}")
+
+
+class Workspace:
+    """
+    下载 / 输出工作区:
+    - 下载文件按输入源存放在 download_dir/<源标识>/ 下，输出文件存放在 output_dir/<源标识>/ 下，
+      标题相同的视频不再互相覆盖
+    - 磁盘上的条目记录在 download_dir/.workspace.json 索引中 (重启后保留)，
+      同一输入源再次处理时直接复用仍在磁盘上的下载文件
+    - 下载文件与中间音频总大小超过 max_bytes 时按最近使用时间 (LRU) 淘汰，
+      正在被任务使用 (pin) 的条目不会被淘汰；output_max_bytes 对输出目录做同样的限制
+    max_bytes / output_max_bytes 为 0 表示不限。
+    adopt_legacy 为 True 时，启动时把下载目录根部旧版按标题命名的 .mp3 文件登记为可淘汰条目；
+    其它未登记的文件与目录 (如用户自己放入的文件) 一律不纳入管理、不会被删除。
+
+    同一台机器上的多个进程 (如多个 --worker) 可以共享同一个工作区: 索引的读改写在文件锁内进行，
+    每次操作前检查索引文件，被其它进程改写过时重新读取；pin 按进程记录在索引中，持有者进程退出后自动失效；
+    同一输入源的下载跨进程互斥。与磁盘的对账 (列目录) 只在启动时进行一次。
+    """
+
+    def __init__(
+        self, download_dir: str, output_dir: str, max_bytes: int, output_max_bytes: int = 0,
+        adopt_legacy: bool = False,
+    ):
+        self.download_dir = download_dir
+        self.output_dir = output_dir
+        self.max_bytes = max_bytes
+        self.output_max_bytes = output_max_bytes
+        self.adopt_legacy = adopt_legacy
+        self._lock = threading.Lock()
+        # key -> {"kind": download / temp / output, "path", "bytes", "last_used", ...}
+        self._entries: Dict[str, dict] = {}
+        # 最近一次读 / 写的索引文件状态，未变化时不重新解析
+        self._index_stamp = None
+        self._raw_pins: Dict[str, Dict[str, int]] = {}
+        # 本进程的 pin，以及其它仍在运行的进程的 pin (owner -> {key: count})
+        self._pins: Dict[str, int] = {}
+        self._foreign_pins: Dict[str, Dict[str, int]] = {}
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._stats = {"reused": 0, "downloaded": 0, "evicted": 0, "evicted_bytes": 0}
+        for name in (OWNERS_DIR, LOCKS_DIR):
+            os.makedirs(os.path.join(self.download_dir, name), exist_ok=True)
+        self._owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        # 进程退出时操作系统释放该锁
+        self._owner_file = open(os.path.join(self.download_dir, OWNERS_DIR, f"{self._owner}.lock"), "a+")
+        _lock(self._owner_file)
+        with self._shared():
+            self._reconcile()
+
+    # ---- 下载 ----
+
+    def download_dir_for(self, source_key: str) -> str:
+        path = os.path.join(self.download_dir, source_slug(source_key))
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def find_download(self, source_key: str, variant: str) -> Optional[Tuple[str, Optional[dict]]]:
+        """返回仍在磁盘上、且下载方式 (variant) 相同的下载文件 (路径, 媒体信息)，没有时返回 None"""
+        with self._shared():
+            entry = self._entries.get(source_key)
+            if not entry or entry["kind"] != "download" or entry.get("variant") != variant:
+                return None
+            path = os.path.join(self._root(entry), entry["path"], entry["file"])
+            if not os.path.isfile(path):
+                self._drop(source_key)
+                self._save_index()
+                return None
+            entry["last_used"] = time.time()
+            self._stats["reused"] += 1
+            self._save_index()
+            return path, entry.get("media")
+
+    def add_download(self, source_key: str, file_path: str, variant: str, media: dict = None) -> bool:
+        """登记下载完成的文件 (须位于 download_dir_for(source_key) 中)，返回是否纳入管理"""
+        directory = os.path.join(self.download_dir, source_slug(source_key))
+        if os.path.dirname(os.path.abspath(file_path)) != os.path.abspath(directory):
+            return False
+        with self._shared():
+            self._put(source_key, {
+                "kind": "download",
+                "path": os.path.basename(directory),
+                "file": os.path.basename(file_path),
+                "bytes": _disk_bytes(directory),
+                "variant": variant,
+                "media": media,
+            })
+            self._stats["downloaded"] += 1
+            self._evict()
+            self._save_index()
+        return True
+
+    @contextmanager
+    def locked(self, source_key: str):
+        """同一输入源的下载互斥 (跨线程与进程)，避免并发任务同时写同一目录"""
+        with self._lock:
+            key_lock = self._key_locks.setdefault(source_key, threading.Lock())
+        with key_lock, _file_lock(self._key_lock_path(source_slug(source_key))):
+            yield
+
+    def _key_lock_path(self, slug: str) -> str:
+        return os.path.join(self.download_dir, LOCKS_DIR, f"{slug}.lock")
+
+    # ---- 中间文件 ----
+
+    def temp_path(self, file_name: str) -> str:
+        """中间音频等临时文件的路径 (唯一)，生成后用 add_temp 登记"""
+        directory = os.path.join(self.download_dir, TEMP_DIR)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f"{uuid.uuid4().hex[:8]}_{file_name}")
+
+    def add_temp(self, file_path: str) -> str:
+        """登记临时文件 (计入配额，使用期间自动 pin)，返回条目键，用完后调用 remove"""
+        key = "tmp:" + os.path.basename(file_path)
+        with self._shared():
+            self._put(key, {
+                "kind": "temp",
+                "path": os.path.join(TEMP_DIR, os.path.basename(file_path)),
+                "bytes": _disk_bytes(file_path),
+            })
+            self._pins[key] = self._pins.get(key, 0) + 1
+            self._evict()
+            self._save_index()
+        return key
+
+    # ---- 输出 ----
+
+    def output_path(self, owner_key: str, file_name: str) -> str:
+        return os.path.join(self.output_dir, source_slug(owner_key), file_name)
+
+    def write_output(self, owner_key: str, file_name: str, text: str) -> str:
+        """原子写入 output_dir/<源标识>/<file_name>，返回路径"""
+        path = self.output_path(owner_key, file_name)
+        atomic_write(path, text)
+        key = "out:" + source_slug(owner_key)
+        with self._shared():
+            self._put(key, {
+                "kind": "output",
+                "path": source_slug(owner_key),
+                "bytes": _disk_bytes(os.path.dirname(path)),
+            })
+            self._pins[key] = self._pins.get(key, 0) + 1
+            try:
+                self._evict()
+            finally:
+                self._unpin(key)
+            self._save_index()
+        return path
+
+    # ---- pin / 删除 ----
+
+    def pin(self, key: str):
+        """标记条目正在使用，不会被淘汰 (条目可以尚未登记)"""
+        with self._shared():
+            self._pins[key] = self._pins.get(key, 0) + 1
+            self._save_index()
+
+    def unpin(self, key: str):
+        with self._shared():
+            self._unpin(key)
+            self._evict()
+            self._save_index()
+
+    def remove(self, key: str):
+        """删除条目及其文件 (如用完的临时文件)"""
+        with self._shared():
+            self._pins.pop(key, None)
+            self._drop(key)
+            self._save_index()
+
+    def stats(self) -> dict:
+        with self._shared():
+            usage = {"download": [0, 0], "temp": [0, 0], "output": [0, 0]}
+            for entry in self._entries.values():
+                usage[entry["kind"]][0] += 1
+                usage[entry["kind"]][1] += entry["bytes"]
+            return dict(
+                self._stats,
+                entries={kind: count for kind, (count, _) in usage.items()},
+                bytes={kind: size for kind, (_, size) in usage.items()},
+                max_bytes=self.max_bytes,
+                output_max_bytes=self.output_max_bytes,
+                pinned=sum(1 for count in self._pins.values() if count > 0),
+                pinned_by_others=sum(len(keys) for keys in self._foreign_pins.values()),
+            )
+
+    # ---- internals (持锁调用) ----
+
+    @contextmanager
+    def _shared(self):
+        """线程锁 + 索引文件锁，并在操作前读取其它进程写入的索引"""
+        with self._lock, _file_lock(os.path.join(self.download_dir, INDEX_LOCK_NAME)):
+            self._read_index()
+            try:
+                yield
+            except BaseException:
+                # 内存中可能留有未保存的修改，下次操作重新读取索引
+                self._index_stamp = None
+                raise
+
+    def _pinned(self, key: str) -> bool:
+        return bool(self._pins.get(key)) or any(keys.get(key) for keys in self._foreign_pins.values())
+
+    def _owner_alive(self, owner: str) -> bool:
+        """owner 锁文件仍被锁住表示该进程仍在运行；进程已退出时清理其锁文件"""
+        path = os.path.join(self.download_dir, OWNERS_DIR, f"{owner}.lock")
+        if not os.path.exists(path):
+            return False
+        with open(path, "a+") as f:
+            if not _try_lock(f):
+                return True
+            _unlock(f)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return False
+
+    def _root(self, entry: dict) -> str:
+        return self.output_dir if entry["kind"] == "output" else self.download_dir
+
+    def _put(self, key: str, entry: dict):
+        entry["last_used"] = time.time()
+        self._entries[key] = entry
+
+    def _unpin(self, key: str):
+        count = self._pins.get(key, 0) - 1
+        if count > 0:
+            self._pins[key] = count
+        else:
+            self._pins.pop(key, None)
+
+    def _drop(self, key: str) -> int:
+        entry = self._entries.pop(key, None)
+        if not entry:
+            return 0
+        _delete(os.path.join(self._root(entry), entry["path"]))
+        return entry["bytes"]
+
+    def _evict(self):
+        for kinds, limit in ((("download", "temp"), self.max_bytes), (("output",), self.output_max_bytes)):
+            if not limit:
+                continue
+            keys = [k for k, e in self._entries.items() if e["kind"] in kinds]
+            total = sum(self._entries[k]["bytes"] for k in keys)
+            for key in sorted(keys, key=lambda k: self._entries[k]["last_used"]):
+                if total <= limit:
+                    break
+                if self._pinned(key):
+                    continue
+                freed = self._drop(key)
+                total -= freed
+                self._stats["evicted"] += 1
+                self._stats["evicted_bytes"] += freed
+                logger.info(f"Evicted {key} ({freed} bytes) from workspace")
+            if total > limit:
+                logger.warning(f"Workspace {'/'.join(kinds)} over quota ({total} > {limit} bytes), all entries in use")
+
+    def _save_index(self):
+        pins = dict(self._foreign_pins)
+        pins[self._owner] = {key: count for key, count in self._pins.items() if count > 0}
+        index = {"entries": self._entries, "pins": {owner: keys for owner, keys in pins.items() if keys}}
+        path = os.path.join(self.download_dir, INDEX_NAME)
+        try:
+            atomic_write(path, json.dumps(index, ensure_ascii=False))
+            self._raw_pins = index["pins"]
+            self._index_stamp = self._stamp(path)
+        except OSError as e:
+            logger.warning(f"Failed to save workspace index: {e}")
+            self._index_stamp = None
+
+    @staticmethod
+    def _stamp(path: str):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def _read_index(self):
+        """读取索引 (条目与其它进程的 pin)，自上次读 / 写后未被改写时沿用内存中的内容；已退出进程的 pin 被丢弃"""
+        path = os.path.join(self.download_dir, INDEX_NAME)
+        stamp = self._stamp(path)
+        if stamp is None or stamp != self._index_stamp:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    index = json.load(f)
+            except FileNotFoundError:
+                index = {}
+            except Exception as e:
+                logger.warning(f"Broken workspace index, rebuilding: {e}")
+                index = {}
+            if "entries" not in index:
+                # 旧版索引只有条目
+                index = {"entries": index, "pins": {}}
+            self._entries = index["entries"]
+            self._raw_pins = index.get("pins", {})
+            self._index_stamp = stamp
+        self._foreign_pins = {
+            owner: keys for owner, keys in self._raw_pins.items()
+            if owner != self._owner and self._owner_alive(owner)
+        }
+
+    def _is_legacy(self, name: str) -> bool:
+        return (
+            self.adopt_legacy and LEGACY_DOWNLOAD_PATTERN.fullmatch(name) is not None
+            and os.path.isfile(os.path.join(self.download_dir, name))
+        )
+
+    def _reconcile(self):
+        """
+        启动时与磁盘对账: 丢弃已不存在的条目；adopt_legacy 时把旧版按标题命名的下载登记为可淘汰条目，
+        未开启时丢弃之前登记的此类条目 (只从索引中移除，不删除文件)
+        """
+        self._entries = {
+            key: entry for key, entry in self._entries.items()
+            if os.path.exists(os.path.join(self._root(entry), entry["path"]))
+            and (not key.startswith(UNTRACKED_PREFIX) or self._is_legacy(entry["path"]))
+        }
+
+        known = {e["path"] for e in self._entries.values() if e["kind"] != "output"}
+        for name in os.listdir(self.download_dir):
+            if name in RESERVED_NAMES or name in known or not self._is_legacy(name):
+                continue
+            path = os.path.join(self.download_dir, name)
+            self._entries[UNTRACKED_PREFIX + name] = {
+                "kind": "download", "path": name, "bytes": _disk_bytes(path), "last_used": os.path.getmtime(path),
+            }
+
+        temp_dir = os.path.join(self.download_dir, TEMP_DIR)
+        if os.path.isdir(temp_dir):
+            now = time.time()
+            for name in os.listdir(temp_dir):
+                path = os.path.join(temp_dir, name)
+                if "tmp:" + name not in self._entries and now - os.path.getmtime(path) > STALE_TEMP_SECONDS:
+                    _delete(path)
+        # 上次运行中途退出留下的临时文件条目 (仍被运行中的进程使用的除外)
+        for key in [k for k, e in self._entries.items() if e["kind"] == "temp"]:
+            if time.time() - self._entries[key]["last_used"] > STALE_TEMP_SECONDS and not self._pinned(key):
+                self._drop(key)
+        self._evict()
+        self._save_index()
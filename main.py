@@ -1,14 +1,33 @@
 import uuid
 import json
+import asyncio
 import os
+import time
+import signal
 import argparse
-import uvicorn
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from pydantic import BaseModel
-from typing import Optional, Dict
+import functools
+import threading
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse, PlainTextResponse, Response
+from pydantic import BaseModel, Field
+from typing import Optional, Literal, List
 from fastapi.middleware.cors import CORSMiddleware
 
-from core.pipeline import Pipeline
+from core.pipeline import Pipeline, VIDEO_EXTS, AUDIO_EXTS
+from core.batch import BatchCoordinator
+from core.events import TaskEventBus
+from core.http_client import get_http
+from core.job_queue import create_job_queue, QueueRelay
+from core.governor import get_governor
+from core.metrics import registry, Gauge
+from core.scheduler import JobScheduler, PRIORITY_INTERACTIVE, PRIORITY_BULK
+from core.task_store import create_task_store
+from core.transcript import Transcript
+from core.worker import QueueWorker
+from utils.config import settings
+from utils.presets import load_presets
+from utils.helpers import normalize_source
 from utils.logger import get_logger
 
 """
@@ -16,13 +35,28 @@ from utils.logger import get_logger
 功能：
 1. 提供 Web API 服务 (FastAPI)，供外部调用 (如油猴脚本、前端页面)。
 2. 提供 命令行工具 (CLI)，直接在终端处理文件或 URL。
+3. worker 模式 (--worker): 配置任务队列后，API 进程只负责入队，由一个或多个 worker 进程执行任务。
 """
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 服务启动时创建任务存储 / 调度器等 (避免并发的首个请求各自创建)
+    get_task_store()
+    get_event_bus()
+    get_scheduler()
+    get_batches()
+    if get_relay():
+        get_relay().start()
+    # 重启后恢复排队中 / 执行中的任务
+    resume_unfinished_tasks()
+    yield
+
 # 初始化 APP
 app = FastAPI(
     title="BiliAssistant Service",
     description="一个将视频/音频转换为文本并生成摘要的 API 服务",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # 允许跨域
@@ -38,21 +72,21 @@ app.add_middleware(
 pipeline = Pipeline()
 logger = get_logger("Main")
 
-# 简单的内存任务存储
-# 结构: { task_id: { "status": "processing" | "succeeded" | "failed", "result": {...}, "error": "..." } }
-tasks_db: Dict[str, dict] = {}
+# 任务存储、事件总线、调度器、任务队列与批量协调器都在首次使用时才创建 (API 服务在 lifespan 中创建)，
+# 导入本模块、--help 与 CLI 处理不会建库、开队列或启动调度线程
 
-# 加载 presets
-PRESETS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts", "presets.json")
+@functools.lru_cache(maxsize=None)
+def get_task_store():
+    """
+    任务存储 (默认 SQLite): 元数据为小行，结果正文按需加载
+    任务结构: { "task_id", "status": "queued" | "processing" | "succeeded" | "failed", "result": {...}, "error": "...", ... }
+    """
+    return create_task_store(settings)
 
-def load_presets():
-    try:
-        if os.path.exists(PRESETS_FILE):
-            with open(PRESETS_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-    except Exception as e:
-        logger.error(f"Error loading presets: {e}")
-    return {}
+@functools.lru_cache(maxsize=None)
+def get_event_bus() -> TaskEventBus:
+    """任务事件 (状态 / 阶段 / 摘要增量)，供 SSE / WebSocket / 长轮询推送"""
+    return TaskEventBus()
 
 class ProcessRequest(BaseModel):
     """
@@ -62,98 +96,886 @@ class ProcessRequest(BaseModel):
     skip_download: bool = False # 是否跳过下载步骤 (仅当确信文件已在本地时使用)
     preset_name: str = "bilibili_summary" # 预设提示词名称
     custom_prompt: Optional[str] = None # 自定义 System Prompt
+    presets: List[str] = [] # 多个预设: 只转录一次，各预设的摘要并发生成、分别保存 (提供时忽略 preset_name)
+    custom_prompts: List[str] = [] # 多个自定义 System Prompt，与 presets 一起并发生成
+    priority: Literal["interactive", "bulk"] = "interactive" # 交互式请求优先于批量请求
+    stream: bool = False # 摘要以流式生成并推送 delta 事件 (默认仅在有 SSE / WebSocket / 长轮询订阅者时流式生成)
 
-def background_process_task(task_id: str, request: ProcessRequest):
-    logger.info(f"后台任务开始: {task_id}")
-    try:
-        tasks_db[task_id]["status"] = "processing"
-        
-        # 调用 Pipeline
-        result = pipeline.run(
-            request.source, 
-            request.skip_download, 
-            preset_name=request.preset_name,
-            custom_prompt=request.custom_prompt
-        )
-        
-        tasks_db[task_id]["status"] = "succeeded"
-        tasks_db[task_id]["result"] = result
+class BatchRequest(BaseModel):
+    """
+    批量请求体: sources 与 playlist 至少提供一个，两者的条目按顺序合并
+    """
+    sources: List[str] = [] # 输入源列表: B站 BV号, URL, 或 本地文件路径
+    playlist: Optional[str] = None # 合集 / 多P视频 / 收藏夹 URL，只解析不下载，展开为各集
+    preset_name: str = "bilibili_summary"
+    custom_prompt: Optional[str] = None
+    presets: List[str] = []
+    custom_prompts: List[str] = []
+    priority: Literal["interactive", "bulk"] = "bulk"
+    concurrency: Optional[int] = Field(None, ge=1) # 本批同时执行的子任务数，默认 BATCH_CONCURRENCY
+    combine_summary: bool = False # 全部结束后基于各集摘要生成跨集总结
+
+# 多预设任务执行中已完成的各预设结果 (task_id -> {key: entry})，任务结束后以 result.summaries 为准
+partial_summaries = {}
+# 请求了流式摘要 (stream=true) 的在途任务
+streaming_tasks = set()
+
+def on_job_update(task_id: str, status: str, result, error):
+    """调度器回调: 同步任务状态到任务存储"""
+    if status in ("succeeded", "failed"):
+        partial_summaries.pop(task_id, None)
+        streaming_tasks.discard(task_id)
+    if status == "succeeded":
+        get_task_store().set_result(task_id, result)
         logger.info(f"后台任务完成: {task_id}")
-    except Exception as e:
-        logger.error(f"后台任务失败 {task_id}: {e}")
-        tasks_db[task_id]["status"] = "failed"
-        tasks_db[task_id]["error"] = str(e)
+        get_event_bus().publish(task_id, "succeeded", {"summary": result["summary"], "files": result["files"]})
+        get_batches().child_done(task_id, status)
+    elif status == "failed":
+        get_task_store().update(task_id, status="failed", error=str(error), progress=None)
+        logger.error(f"后台任务失败 {task_id}: {error}")
+        get_event_bus().publish(task_id, "failed", {"error": str(error)})
+        get_batches().child_done(task_id, status)
+    else:
+        get_task_store().update(task_id, status=status)
+        if status == "queued":
+            logger.warning(f"后台任务重新排队 (worker 失联): {task_id}")
+        else:
+            logger.info(f"后台任务开始: {task_id}")
+        get_event_bus().publish(task_id, "status", status)
+
+def on_job_event(task_id: str, event: str, data):
+    """调度器事件: 记录进度到任务状态，并转发给 SSE 订阅者"""
+    if event == "progress":
+        get_task_store().update(task_id, progress=data)
+    elif event == "summary":
+        partial_summaries.setdefault(task_id, {})[data["key"]] = data
+    get_event_bus().publish(task_id, event, data)
+
+def wants_deltas(task_id: str) -> bool:
+    """只在请求了流式输出或有订阅者时流式生成摘要，避免无人接收的 delta 事件"""
+    return task_id in streaming_tasks or get_event_bus().has_subscribers(task_id)
+
+def stage_limits() -> dict:
+    return {
+        "download": settings.SCHED_LIMIT_DOWNLOAD,
+        "transcode": settings.SCHED_LIMIT_TRANSCODE,
+        "upload": settings.SCHED_LIMIT_UPLOAD,
+        "transcode_upload": settings.SCHED_LIMIT_TRANSCODE_UPLOAD,
+        "asr": settings.SCHED_LIMIT_ASR,
+        "summarize": settings.SCHED_LIMIT_SUMMARIZE,
+    }
+
+@functools.lru_cache(maxsize=None)
+def get_scheduler() -> JobScheduler:
+    return JobScheduler(
+        stage_limits=stage_limits(),
+        max_active_jobs=settings.SCHED_MAX_ACTIVE_JOBS,
+        listener=on_job_update,
+        event_sink=on_job_event,
+        wants_deltas=wants_deltas,
+    )
+
+@functools.lru_cache(maxsize=None)
+def get_job_queue():
+    """
+    任务队列 (JOB_QUEUE_BACKEND=sqlite / redis，local 时为 None): 任务由 worker 进程执行，
+    事件与结果经 relay 回到上面的回调；本进程的调度器只用于批量任务的汇总
+    """
+    return create_job_queue(settings)
+
+@functools.lru_cache(maxsize=None)
+def get_relay() -> Optional[QueueRelay]:
+    job_queue = get_job_queue()
+    return QueueRelay(
+        job_queue, on_job_update, on_job_event,
+        poll_interval=settings.JOB_QUEUE_POLL_INTERVAL,
+        requeue_interval=settings.JOB_LEASE_SECONDS / 2,
+    ) if job_queue else None
+
+def submit_batch_item(task_id: str):
+    """批量任务协调器回调: 把子任务交给调度器"""
+    submit_job(task_id, ProcessRequest(**get_task_store().get_request(task_id)))
+
+def on_batch_progress(batch, task_id: str, status: str):
+    """子任务结束: 更新父任务进度并推送 batch_progress 事件"""
+    counts = batch.counts()
+    get_task_store().update(batch.batch_id, progress=counts)
+    get_event_bus().publish(batch.batch_id, "batch_progress", dict(counts, task_id=task_id, status=status))
+
+def on_batch_complete(batch):
+    """全部子任务结束: 父任务作为一个普通任务进入调度器，汇总结果 (及生成跨集总结)"""
+    request = BatchRequest(**get_task_store().get_request(batch.batch_id))
+    get_scheduler().submit(
+        batch.batch_id,
+        f"batch:{batch.batch_id}",
+        lambda hooks: finalize_batch(batch.batch_id, hooks),
+        priority=PRIORITY_BULK if request.priority == "bulk" else PRIORITY_INTERACTIVE,
+    )
+
+@functools.lru_cache(maxsize=None)
+def get_batches() -> BatchCoordinator:
+    return BatchCoordinator(submit_batch_item, on_progress=on_batch_progress, on_complete=on_batch_complete)
+
+registry.register(Gauge(
+    "bili_scheduler_jobs", "Jobs queued / in flight in the scheduler",
+    lambda: {(state,): value for state, value in get_scheduler().snapshot().items() if state != "stages"}, ("state",),
+))
+registry.register(Gauge(
+    "bili_scheduler_stage_slots", "Per-stage active / waiting slots",
+    lambda: {
+        (stage, field): snap[field]
+        for stage, snap in get_scheduler().snapshot()["stages"].items() for field in ("active", "waiting", "limit")
+    },
+    ("stage", "state"),
+))
+registry.register(Gauge(
+    "bili_job_queue", "Jobs queued / leased in the shared job queue",
+    lambda: {
+        (state,): get_job_queue().stats()[state] for state in ("queued", "leased", "pending_events")
+    } if get_job_queue() else {},
+    ("state",),
+))
+registry.register(Gauge(
+    "bili_http_client", "DashScope HTTP client counters",
+    lambda: {(k,): v for k, v in get_http().stats().items() if isinstance(v, (int, float)) and not isinstance(v, bool)},
+    ("counter",),
+))
+registry.register(Gauge(
+    "bili_dashscope_governor", "DashScope client-side rate limiter: concurrency limit, in-flight and throttle counts",
+    lambda: {
+        (endpoint, field): stats[field]
+        for endpoint, stats in get_governor().stats()["endpoints"].items()
+        for field in ("limit", "max_concurrency", "in_flight", "requests", "throttled", "errors", "paused_seconds")
+    },
+    ("endpoint", "field"),
+))
+registry.register(Gauge(
+    "bili_workspace_bytes", "Bytes on disk in the download / output workspace",
+    lambda: {(kind,): size for kind, size in pipeline.workspace.stats()["bytes"].items()}, ("kind",),
+))
 
 @app.get("/presets", summary="获取可用的提示词预设")
 def get_presets():
     presets = load_presets()
     return [{"key": k, "label": v.get("label", k)} for k, v in presets.items()]
 
+def request_targets(request) -> Optional[list]:
+    """presets / custom_prompts -> Pipeline.run 的多预设 targets (去重、保持顺序)；都为空时返回 None"""
+    if not request.presets and not request.custom_prompts:
+        return None
+    targets = [(name, None) for name in dict.fromkeys(request.presets)]
+    targets += [(request.preset_name, prompt) for prompt in dict.fromkeys(request.custom_prompts)]
+    return targets
+
+def check_presets(names: list):
+    unknown = [name for name in names if name not in load_presets()]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown presets: {', '.join(unknown)}")
+
+def run_request(request: ProcessRequest, hooks=None) -> dict:
+    """执行一个处理请求 (本进程的调度器与 worker 进程共用)"""
+    return pipeline.run(
+        request.source,
+        request.skip_download,
+        preset_name=request.preset_name,
+        custom_prompt=request.custom_prompt,
+        hooks=hooks,
+        targets=request_targets(request),
+    )
+
+def submit_job(task_id: str, request: ProcessRequest):
+    """把任务交给调度器 (或任务队列)，返回实际执行的 job_id (被合并时为在途任务的 id)"""
+    # 相同输入源 + 相同提示词的在途任务会被合并
+    targets = request_targets(request)
+    prompt_id = json.dumps(targets, ensure_ascii=False) if targets else (request.custom_prompt or request.preset_name)
+    dedup_key = f"{normalize_source(request.source)}|{request.skip_download}|{prompt_id}"
+    priority = PRIORITY_BULK if request.priority == "bulk" else PRIORITY_INTERACTIVE
+    if request.stream:
+        streaming_tasks.add(task_id)
+    if get_job_queue():
+        return get_job_queue().enqueue(task_id, dedup_key, request.model_dump(), priority)
+    return get_scheduler().submit(task_id, dedup_key, lambda hooks: run_request(request, hooks), priority=priority)
+
+def describe_task(task_id: str) -> Optional[dict]:
+    """在途任务的当前阶段与排队位置 (队列模式下还包括执行的 worker 与尝试次数)"""
+    scheduling = get_scheduler().describe(task_id)
+    if scheduling is None and get_relay():
+        scheduling = get_relay().describe(task_id)
+    return scheduling
+
+def finalize_batch(batch_id: str, hooks) -> dict:
+    """汇总各子任务的状态与输出文件；combine_summary 时基于各集摘要生成跨集总结"""
+    stored = get_task_store().get_request(batch_id)
+    request = BatchRequest(**stored)
+    items, episodes = [], []
+    for item in stored["items"]:
+        task = get_task_store().get(item["task_id"]) or {"status": "failed", "error": "Task not found"}
+        result = task.get("result") or {}
+        title = (result.get("media") or {}).get("title") or item.get("title") or item["source"]
+        items.append({
+            "task_id": item["task_id"],
+            "source": item["source"],
+            "title": title,
+            "status": task["status"],
+            "error": task.get("error"),
+            "files": result.get("files"),
+        })
+        if task["status"] == "succeeded":
+            episodes.append((title, result["summary"]))
+    if not episodes:
+        raise Exception(f"All {len(items)} batch items failed")
+
+    summary, files = None, {}
+    if request.combine_summary and len(episodes) > 1:
+        combined = pipeline.summarize_series(
+            episodes, f"batch_{batch_id[:8]}", request.preset_name, request.custom_prompt, hooks=hooks,
+            owner_key=f"batch:{batch_id}",
+        )
+        summary, files = combined["summary"], combined["files"]
+    return {
+        "title": stored.get("title"),
+        "summary": summary,
+        "files": files,
+        "counts": {"total": len(items), "succeeded": len(episodes), "failed": len(items) - len(episodes)},
+        "items": items,
+    }
+
+def expand_batch_items(sources: list, playlists: list, max_items: int):
+    """合并输入源列表与展开后的合集条目，返回 (合集标题, [{"source", "title"}])"""
+    items = [{"source": source, "title": None} for source in sources]
+    title = None
+    for url in playlists:
+        expanded = pipeline.downloader.expand_playlist(url, max_items)
+        title = title or expanded["title"]
+        items.extend({"source": e["source"], "title": e["title"]} for e in expanded["entries"])
+    if len(items) > max_items:
+        raise ValueError(f"Too many batch items: {len(items)} > {max_items} (BATCH_MAX_ITEMS)")
+    return title, items
+
+def start_batch(batch_id: str, request: dict, finished: dict = None):
+    """登记批量任务，子任务按 concurrency 分批提交"""
+    children = [item["task_id"] for item in request["items"]]
+    concurrency = request.get("concurrency") or settings.BATCH_CONCURRENCY
+    get_batches().start(batch_id, children, concurrency, finished=finished)
+
+def resume_unfinished_tasks():
+    for task in get_task_store().unfinished():
+        request = task["request"]
+        if not request or request.get("batch_id"):
+            # 批量任务的子任务由父任务统一恢复
+            continue
+        logger.info(f"恢复未完成任务: {task['task_id']}")
+        if "items" in request:
+            finished = {}
+            for item in request["items"]:
+                child = get_task_store().get(item["task_id"], include_result=False)
+                if child is None or child["status"] in ("succeeded", "failed"):
+                    finished[item["task_id"]] = child["status"] if child else "failed"
+                else:
+                    get_task_store().update(item["task_id"], status="queued", progress=None)
+            start_batch(task["task_id"], request, finished)
+            continue
+        if get_job_queue() and get_job_queue().describe(task["task_id"]):
+            # 仍在任务队列中 (只有 API 进程重启，worker 继续执行)
+            continue
+        get_task_store().update(task["task_id"], status="queued", progress=None)
+        submit_job(task["task_id"], ProcessRequest(**request))
+
 @app.post("/process", summary="提交音频处理任务 (异步)")
-def process_audio(request: ProcessRequest, background_tasks: BackgroundTasks):
+def process_audio(request: ProcessRequest):
     """
     提交任务并立即返回 task_id
     """
+    check_presets(request.presets)
     task_id = str(uuid.uuid4())
-    tasks_db[task_id] = {
-        "status": "queued",
-        "result": None,
-        "error": None
-    }
-    background_tasks.add_task(background_process_task, task_id, request)
-    return {"task_id": task_id, "message": "Task queued"}
+    source_key = normalize_source(request.source)
+
+    # 缓存命中: 直接返回结果，不再进入后台队列
+    try:
+        cached = pipeline.lookup_cached(
+            request.source, request.preset_name, request.custom_prompt, targets=request_targets(request)
+        )
+    except Exception as e:
+        logger.warning(f"缓存查询失败: {e}")
+        cached = None
+    if cached:
+        get_task_store().create(task_id, request.source, source_key, request.model_dump(), status="succeeded")
+        get_task_store().set_result(task_id, cached)
+        return {"task_id": task_id, "message": "Cache hit", "status": "succeeded", "result": present_result(cached)}
+
+    get_task_store().create(task_id, request.source, source_key, request.model_dump())
+    job_id = submit_job(task_id, request)
+    response = {"task_id": task_id, "message": "Task queued"}
+    if job_id != task_id:
+        response["merged_into"] = job_id
+    return response
+
+@app.post("/batch", summary="批量提交 (输入源列表 / 合集 / 多P / 收藏夹)")
+def process_batch(request: BatchRequest):
+    """
+    创建父任务并返回其 task_id，每个条目作为子任务在调度器中执行，
+    同时执行的子任务数受 concurrency 限制。父任务的 /status 中 progress 为子任务计数，
+    结束后 result 汇总各子任务的状态与输出文件 (combine_summary 时包括跨集总结)。
+    """
+    if not request.sources and not request.playlist:
+        raise HTTPException(status_code=400, detail="Either sources or playlist is required")
+    check_presets(request.presets)
+    try:
+        title, items = expand_batch_items(
+            request.sources, [request.playlist] if request.playlist else [], settings.BATCH_MAX_ITEMS
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"合集展开失败: {e}")
+        raise HTTPException(status_code=400, detail=f"Playlist expansion failed: {e}")
+    if not items:
+        raise HTTPException(status_code=400, detail="No items to process")
+
+    batch_id = str(uuid.uuid4())
+    for item in items:
+        item["task_id"] = str(uuid.uuid4())
+        child = ProcessRequest(
+            source=item["source"],
+            preset_name=request.preset_name,
+            custom_prompt=request.custom_prompt,
+            presets=request.presets,
+            custom_prompts=request.custom_prompts,
+            priority=request.priority,
+        )
+        get_task_store().create(
+            item["task_id"], item["source"], normalize_source(item["source"]),
+            dict(child.model_dump(), batch_id=batch_id),
+        )
+    stored = dict(request.model_dump(), title=title, items=items)
+    get_task_store().create(
+        batch_id, request.playlist or f"batch of {len(items)}", f"batch:{batch_id}", stored, status="processing"
+    )
+    get_task_store().update(batch_id, progress={"total": len(items), "queued": len(items), "running": 0,
+                                          "succeeded": 0, "failed": 0})
+    start_batch(batch_id, stored)
+    return {"task_id": batch_id, "message": "Batch queued", "title": title, "total": len(items), "items": items}
+
+@app.get("/batch/{batch_id}", summary="查询批量任务及其子任务状态")
+def get_batch_status(batch_id: str):
+    """父任务状态 (不含结果正文) + 各子任务的状态、当前阶段与排队位置"""
+    task = get_task_store().get(batch_id, include_result=False)
+    stored = get_task_store().get_request(batch_id) if task else None
+    if not stored or "items" not in stored:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    counts = {"total": len(stored["items"])}
+    items = []
+    for item in stored["items"]:
+        child = get_task_store().get(item["task_id"], include_result=False) or {"status": "failed", "error": "Task not found"}
+        counts[child["status"]] = counts.get(child["status"], 0) + 1
+        entry = {
+            "task_id": item["task_id"],
+            "source": item["source"],
+            "title": item.get("title"),
+            "status": child["status"],
+            "error": child.get("error"),
+            "progress": child.get("progress"),
+        }
+        scheduling = describe_task(item["task_id"])
+        if scheduling:
+            entry.update(stage=scheduling["stage"], queue_position=scheduling["queue_position"])
+        items.append(entry)
+    return dict(task, title=stored.get("title"), counts=counts, items=items)
+
+@app.get("/tasks", summary="分页列出任务")
+def list_tasks(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=200),
+    status: Optional[str] = None,
+    source: Optional[str] = None,
+):
+    """任务列表只返回元数据，结果正文请通过 /status/{task_id} 获取"""
+    source_key = normalize_source(source) if source else None
+    return get_task_store().list(offset=offset, limit=limit, status=status, source_key=source_key)
 
 @app.get("/status/{task_id}", summary="查询任务状态")
-def get_task_status(task_id: str):
-    task = tasks_db.get(task_id)
+def get_task_status(task_id: str, include_result: bool = True):
+    """
+    include_result=false 时不返回结果正文 (转录与摘要)，仅用于查询进度。
+    多预设任务执行中时 summaries 为已完成的各预设结果。
+    """
+    task = get_task_store().get(task_id, include_result=include_result)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
+    if task.get("result") and task["result"].get("segments"):
+        task = dict(task, result=present_result(task["result"]))
+    partial = partial_summaries.get(task_id)
+    if partial and task["status"] not in ("succeeded", "failed"):
+        task = dict(task, summaries=dict(partial))
+    scheduling = describe_task(task_id)
+    if scheduling:
+        return dict(task, **scheduling)
     return task
 
-def run_cli(source, preset_name="bilibili_summary"):
+def present_result(result: dict) -> dict:
+    """
+    任务结果只保存结构化的 segments (避免转录文本重复存储)，/status 返回时渲染为 transcript 文本，
+    结构化的逐句结果通过 /transcript/{task_id} 获取
+    """
+    result = dict(result)
+    result["transcript"] = Transcript.from_compact(result.pop("segments")).to_text()
+    return result
+
+TRANSCRIPT_MEDIA_TYPES = {
+    "txt": "text/plain; charset=utf-8",
+    "srt": "application/x-subrip; charset=utf-8",
+    "vtt": "text/vtt; charset=utf-8",
+    "json": "application/json",
+}
+
+@app.get("/transcript/{task_id}", summary="按时间范围获取转录片段 (txt / srt / vtt / json)")
+def get_transcript(
+    task_id: str,
+    start: Optional[float] = Query(None, ge=0, description="起始时间 (秒)"),
+    end: Optional[float] = Query(None, ge=0, description="结束时间 (秒)"),
+    format: Literal["txt", "srt", "vtt", "json"] = "json",
+):
+    """只返回与 [start, end) 有重叠的片段，便于油猴脚本按当前播放位置展示字幕"""
+    task = get_task_store().get(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    result = task.get("result")
+    if task["status"] != "succeeded" or not result:
+        raise HTTPException(status_code=409, detail=f"Transcript not available (status: {task['status']})")
+    if result.get("segments"):
+        transcript = Transcript.from_compact(result["segments"])
+    else:
+        transcript = Transcript.from_text(result.get("transcript") or "")
+    window = transcript.window(
+        int(start * 1000) if start is not None else None,
+        int(end * 1000) if end is not None else None,
+    )
+    return Response(window.render(format), media_type=TRANSCRIPT_MEDIA_TYPES[format])
+
+# 状态变化类事件 (长轮询 / WebSocket 默认只推送这些，不含 progress / delta 等高频事件)
+STATE_EVENTS = ("status", "stage", "stage_done", "media", "summary", "batch_progress", "succeeded", "failed")
+
+def _parse_event_filter(events: Optional[str]):
+    """events 参数: 逗号分隔的事件类型，"all" 表示全部，缺省为状态变化类事件"""
+    if not events:
+        return set(STATE_EVENTS)
+    if events == "all":
+        return None
+    return {e.strip() for e in events.split(",") if e.strip()} | {"succeeded", "failed"}
+
+def _final_events(task_id: str) -> list:
+    """没有事件记录的已结束任务 (如缓存命中、服务重启前完成)，给出最终结果事件；未结束返回空列表"""
+    task = get_task_store().get(task_id, include_result=False) or {}
+    if task.get("status") == "succeeded":
+        result = get_task_store().get(task_id)["result"]
+        return [("succeeded", {"summary": result["summary"], "files": result["files"]})]
+    if task.get("status") == "failed":
+        return [("failed", {"error": task.get("error")})]
+    return []
+
+async def _wait_events(task_id: str, cursor: int, timeout: float, wanted):
+    """
+    等待 cursor 之后的事件，跳过不在 wanted 中的事件，直到有匹配事件、任务结束或超时。
+    返回 (events, new_cursor, done)
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        events, cursor, closed = await get_event_bus().aread(task_id, cursor, timeout=0)
+        if not events and not closed:
+            # 任务存储的查询是同步的 (SQLite)，放到线程中执行，不阻塞事件循环
+            final = await asyncio.to_thread(_final_events, task_id)
+            if final:
+                return final, cursor, True
+            events, cursor, closed = await get_event_bus().aread(task_id, cursor, max(0.0, deadline - loop.time()))
+        matched = [(e, d) for e, d in events if wanted is None or e in wanted]
+        if matched or closed or loop.time() >= deadline:
+            return matched, cursor, closed
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.get("/stream/{task_id}", summary="以 SSE 推送任务阶段变化与摘要增量")
+def stream_task(task_id: str):
+    """
+    事件类型:
+    - status: 任务开始处理
+    - stage: 进入新阶段 (download / transcode / upload / transcode_upload / asr / summarize)
+    - stage_done: 阶段结束 ({"stage", "waited", "seconds"})
+    - progress: 字节级进度 (如上传 {"stage", "bytes", "total"})
+    - delta: 摘要增量文本
+    - succeeded / failed: 任务结束 (携带完整摘要或错误信息)，随后关闭连接
+    """
+    if not get_task_store().get(task_id, include_result=False):
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    async def event_stream():
+        cursor = 0
+        while True:
+            events, cursor, done = await _wait_events(task_id, cursor, 15, None)
+            for event, data in events:
+                yield _sse(event, data)
+            if done:
+                return
+            if not events:
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/status/{task_id}/wait", summary="长轮询: 阻塞到任务有新的状态变化")
+async def wait_task_status(
+    task_id: str,
+    cursor: int = Query(0, ge=0, description="上次返回的 cursor，首次为 0"),
+    timeout: float = Query(25, ge=0, le=60, description="最长等待秒数"),
+    events: Optional[str] = Query(None, description="逗号分隔的事件类型，all 为全部，默认仅状态变化"),
+):
+    """
+    没有新事件时最多挂起 timeout 秒，有阶段变化或任务结束立即返回，只包含新增事件 (不含结果正文)。
+    客户端用返回的 cursor 继续请求，done 为 true 时停止。
+    """
+    if not await asyncio.to_thread(get_task_store().get, task_id, include_result=False):
+        raise HTTPException(status_code=404, detail="Task not found")
+    found, cursor, done = await _wait_events(task_id, cursor, timeout, _parse_event_filter(events))
+    return {
+        "task_id": task_id,
+        "cursor": cursor,
+        "done": done,
+        "events": [{"event": event, "data": data} for event, data in found],
+    }
+
+@app.websocket("/ws/{task_id}")
+async def task_websocket(websocket: WebSocket, task_id: str, cursor: int = 0, events: Optional[str] = None):
+    """
+    WebSocket 订阅: 每个事件一条 JSON 消息 {"event", "data", "cursor"}，任务结束后服务端关闭连接。
+    断线重连时传入最后收到的 cursor 即可从断点继续。
+    """
+    await websocket.accept()
+    if not await asyncio.to_thread(get_task_store().get, task_id, include_result=False):
+        await websocket.send_json({"event": "error", "data": "Task not found", "cursor": cursor})
+        await websocket.close(code=4404)
+        return
+    wanted = _parse_event_filter(events)
+    try:
+        while True:
+            found, cursor, done = await _wait_events(task_id, cursor, 30, wanted)
+            for event, data in found:
+                await websocket.send_json({"event": event, "data": data, "cursor": cursor})
+            if not found and not done:
+                # 心跳，同时及时发现已断开的连接
+                await websocket.send_json({"event": "keep-alive", "data": None, "cursor": cursor})
+            if done:
+                await websocket.close()
+                return
+    except WebSocketDisconnect:
+        pass
+
+@app.get("/scheduler", summary="查询调度器各阶段负载 (队列模式下包括任务队列统计)")
+def get_scheduler_stats():
+    snapshot = get_scheduler().snapshot()
+    if get_job_queue():
+        snapshot["queue"] = get_job_queue().stats()
+    return snapshot
+
+@app.get("/http/stats", summary="查询 DashScope 连接池复用统计")
+def get_http_stats():
+    return get_http().stats()
+
+@app.get("/http/governor", summary="查询 DashScope 各接口的限速 / 并发上限与限流次数")
+def get_governor_stats():
+    return get_governor().stats()
+
+@app.get("/metrics", summary="Prometheus 指标 (各阶段耗时 / 大小 / 错误)")
+def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/workspace/stats", summary="查询下载 / 输出工作区的磁盘占用与复用统计")
+def get_workspace_stats():
+    return pipeline.workspace.stats()
+
+@app.get("/cache/stats", summary="查询结果缓存命中统计")
+def get_cache_stats():
+    if not pipeline.cache:
+        return {"enabled": False}
+    return dict(pipeline.cache.stats(), enabled=True)
+
+MANIFEST_NAME = ".bili_assistant_manifest.json"
+
+def scan_media_files(directory: str) -> list:
+    """递归查找目录下所有可处理的音视频文件"""
+    files = []
+    for root, dirs, names in os.walk(directory):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for name in names:
+            if os.path.splitext(name)[1].lower() in VIDEO_EXTS + AUDIO_EXTS:
+                files.append(os.path.join(root, name))
+    return sorted(files)
+
+def run_batch(directory: str, presets: list, jobs: int = 2):
+    """
+    目录批量模式:
+    - 递归处理所有音视频文件，同时执行 jobs 个文件，各文件的不同阶段相互重叠
+    - 目录下的清单文件记录已完成的文件，重复运行时跳过 (文件大小 / 修改时间变化则重新处理)
+    - 结束时输出吞吐量与各阶段耗时汇总
+    """
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    files = scan_media_files(directory)
+    if not files:
+        logger.warning(f"在该目录下未找到音视频文件: {directory}")
+        return
+
+    todo = {}
+    skipped = 0
+    for path in files:
+        rel = os.path.relpath(path, directory)
+        st = os.stat(path)
+        entry = manifest.get(rel)
+        if entry and entry.get("status") == "succeeded" and entry.get("size") == st.st_size \
+                and entry.get("mtime") == st.st_mtime:
+            skipped += 1
+            continue
+        todo[rel] = path
+    logger.info(f"找到 {len(files)} 个音视频文件，已完成 {skipped} 个，本次处理 {len(todo)} 个 (并发 {jobs})")
+    if not todo:
+        return
+
+    lock = threading.Lock()
+    stats = {"succeeded": 0, "failed": 0}
+
+    def save_manifest():
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, manifest_path)
+
+    def on_update(rel, status, result, error):
+        if status not in ("succeeded", "failed"):
+            return
+        st = os.stat(todo[rel])
+        with lock:
+            stats[status] += 1
+            manifest[rel] = {
+                "status": status,
+                "size": st.st_size,
+                "mtime": st.st_mtime,
+                "finished_at": time.time(),
+                "files": result["files"] if result else None,
+                "error": str(error) if error else None,
+            }
+            save_manifest()
+            finished = stats["succeeded"] + stats["failed"]
+            if status == "succeeded":
+                logger.info(f"[{finished}/{len(todo)}] 完成: {rel}")
+            else:
+                logger.error(f"[{finished}/{len(todo)}] 处理文件失败 {rel}: {error}")
+
+    stage_totals, elapsed = run_local_jobs(todo, presets, jobs, on_update)
+
+    print("\n===== 批量处理报告 =====")
+    print(f"文件: 成功 {stats['succeeded']} / 失败 {stats['failed']} / 跳过 {skipped}")
+    print(f"总耗时: {elapsed:.1f}s | 吞吐量: {stats['succeeded'] / elapsed * 3600:.1f} files/hour")
+    print_stage_totals(stage_totals)
+
+def preset_targets(presets: list) -> Optional[list]:
+    """CLI 的多个预设 -> Pipeline.run 的 targets；只有一个预设时为普通的单摘要模式"""
+    return [(name, None) for name in dict.fromkeys(presets)] if len(presets) > 1 else None
+
+def run_local_jobs(sources: dict, presets: list, jobs: int, on_finished):
+    """
+    用独立的调度器在本进程内并发处理 {key: source}，同时执行 jobs 个，各任务的不同阶段相互重叠。
+    每个任务结束时回调 on_finished(key, status, result, error)，全部结束后返回 (各阶段耗时汇总, 总耗时)。
+    """
+    lock = threading.Lock()
+    done = threading.Event()
+    remaining = [len(sources)]
+    stage_totals = {}
+
+    def on_update(key, status, result, error):
+        if status not in ("succeeded", "failed"):
+            return
+        try:
+            on_finished(key, status, result, error)
+        finally:
+            with lock:
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    done.set()
+
+    def on_event(key, event, data):
+        if event != "stage_done":
+            return
+        with lock:
+            total = stage_totals.setdefault(data["stage"], {"count": 0, "seconds": 0.0, "waited": 0.0})
+            total["count"] += 1
+            total["seconds"] += data["seconds"]
+            total["waited"] += data["waited"]
+
+    local_scheduler = JobScheduler(
+        stage_limits=stage_limits(),
+        max_active_jobs=jobs,
+        listener=on_update,
+        event_sink=on_event,
+    )
+    started = time.time()
+    for key, source in sources.items():
+        local_scheduler.submit(
+            key, f"local:{key}",
+            lambda hooks, source=source: pipeline.run(
+                source, preset_name=presets[0], hooks=hooks, targets=preset_targets(presets)
+            ),
+            priority=PRIORITY_BULK,
+        )
+    if sources:
+        done.wait()
+    return stage_totals, time.time() - started
+
+def print_stage_totals(stage_totals: dict):
+    print("各阶段 (次数 / 执行耗时 / 排队耗时):")
+    for stage, total in sorted(stage_totals.items()):
+        print(f"  {stage:<10} {total['count']:>5}  {total['seconds']:>9.1f}s  {total['waited']:>9.1f}s")
+
+def run_sources(sources: list, presets: list, jobs: int = 2,
+                playlist: bool = False, combine: bool = False):
     """
-    命令行模式运行入口
+    多输入源批量模式 (对应 /batch 接口):
+    - playlist=True 时把每个输入 URL 作为合集 / 多P / 收藏夹展开 (只解析不下载)
+    - 同时处理 jobs 个条目，结束时按输入顺序输出各条目结果
+    - combine=True 时基于各集摘要生成跨集总结
     """
+    try:
+        title, items = expand_batch_items(
+            [] if playlist else sources, sources if playlist else [], settings.BATCH_MAX_ITEMS
+        )
+    except Exception as e:
+        logger.error(f"合集展开失败: {e}")
+        return
+    if not items:
+        logger.warning("没有需要处理的条目")
+        return
+    logger.info(f"批量处理 {len(items)} 个条目{f' ({title})' if title else ''} (并发 {jobs})")
+
+    lock = threading.Lock()
+    outcomes = {}
+
+    def on_finished(key, status, result, error):
+        with lock:
+            outcomes[key] = (status, result, error)
+            finished = len(outcomes)
+        item = items[int(key)]
+        if status == "succeeded":
+            logger.info(f"[{finished}/{len(items)}] 完成: {item['title'] or item['source']}")
+        else:
+            logger.error(f"[{finished}/{len(items)}] 处理失败 {item['source']}: {error}")
+
+    stage_totals, elapsed = run_local_jobs(
+        {str(i): item["source"] for i, item in enumerate(items)}, presets, jobs, on_finished
+    )
+
+    episodes = []
+    print("\n===== 批量处理报告 =====")
+    for i, item in enumerate(items):
+        status, result, error = outcomes[str(i)]
+        name = ((result or {}).get("media") or {}).get("title") or item["title"] or item["source"]
+        if status == "succeeded":
+            episodes.append((name, result["summary"]))
+            print(f"  [{i + 1}] 成功 {name} -> {result['files']['summary']}")
+        else:
+            print(f"  [{i + 1}] 失败 {name}: {error}")
+    print(f"成功 {len(episodes)} / 失败 {len(items) - len(episodes)} | 总耗时: {elapsed:.1f}s")
+    print_stage_totals(stage_totals)
+
+    if combine and len(episodes) > 1:
+        try:
+            base_name = f"batch_{time.strftime('%Y%m%d_%H%M%S')}"
+            combined = pipeline.summarize_series(episodes, base_name, presets[0])
+            print(f"跨集总结: {combined['files']['summary']}")
+        except Exception as e:
+            logger.error(f"跨集总结失败: {e}")
+
+def run_cli(sources, presets=("bilibili_summary",), jobs=2, playlist=False, combine=False):
+    """
+    命令行模式运行入口。presets 有多个时只转录一次，各预设的摘要并发生成、分别保存
+    """
+    presets = list(presets)
+    if len(sources) > 1 or playlist:
+        # 多个输入源 / 合集: 并发批量处理
+        run_sources(sources, presets, jobs, playlist, combine)
+        return
+    source = sources[0]
     if os.path.isdir(source):
-        # 目录模式: 批量处理 MP4 文件
+        # 目录模式: 并行批量处理，可断点续跑
         logger.info(f"检测到目录输入: {source}")
-        files = [f for f in os.listdir(source) if f.lower().endswith(".mp4")]
-        
-        if not files:
-            logger.warning(f"在该目录下未找到 .mp4 文件: {source}")
-            return
-            
-        logger.info(f"找到 {len(files)} 个 MP4 文件准备处理")
-        
-        for i, filename in enumerate(files, 1):
-            file_path = os.path.join(source, filename)
-            logger.info(f"[{i}/{len(files)}] 正在处理文件: {filename}")
-            try:
-                pipeline.run(file_path, preset_name=preset_name)
-            except Exception as e:
-                logger.error(f"处理文件失败 {filename}: {e}")
-                # 继续处理下一个文件
+        run_batch(source, presets, jobs)
     else:
         # 单任务模式
         try:
-            logger.info(f"开始 CLI 模式处理: {source} | Preset: {preset_name}")
-            pipeline.run(source, preset_name=preset_name)
+            logger.info(f"开始 CLI 模式处理: {source} | Preset: {', '.join(presets)}")
+            pipeline.run(source, preset_name=presets[0], targets=preset_targets(presets))
         except Exception as e:
             logger.error(f"CLI Error: {e}")
 
+def run_worker(concurrency: int):
+    """
+    worker 模式: 从任务队列 (JOB_QUEUE_BACKEND=sqlite / redis) 租用 API 进程提交的任务并执行，
+    可以在一台或多台机器上同时运行多个。收到 SIGTERM / Ctrl+C 后不再租用新任务，执行中的任务结束后退出
+    """
+    if get_job_queue() is None:
+        logger.error("worker 模式需要设置 JOB_QUEUE_BACKEND=sqlite 或 redis (并与 API 进程使用同一个队列)")
+        return
+    worker = QueueWorker(
+        get_job_queue(),
+        lambda payload, hooks: run_request(ProcessRequest(**payload), hooks),
+        stage_limits=stage_limits(),
+        concurrency=concurrency,
+        lease_seconds=settings.JOB_LEASE_SECONDS,
+        poll_interval=settings.JOB_QUEUE_POLL_INTERVAL,
+        wants_deltas=lambda payload: payload.get("stream", False),
+    )
+    stopping = []
+
+    def shutdown(signum, frame):
+        if stopping:
+            # 再次收到信号时立即退出，未完成的任务在租约过期后由其它 worker 重新执行
+            raise SystemExit(1)
+        stopping.append(signum)
+        logger.info("收到退出信号，等待执行中的任务结束 (再次发送立即退出)")
+        worker.stop()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+    worker.run()
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Bilibili/MP3 转文字摘要工具")
-    parser.add_argument("source", nargs="?", help="输入源 (文件路径 / URL / B站BV号)")
-    parser.add_argument("--preset", default="bilibili_summary", help="选择摘要提示词预设 (默认: bilibili_summary)")
+    parser.add_argument("source", nargs="*", help="输入源 (文件路径 / URL / B站BV号)，可以有多个")
+    parser.add_argument("--preset", default="bilibili_summary",
+                        help="选择摘要提示词预设，多个预设用逗号分隔 (如 bilibili_summary,mindmap，默认: bilibili_summary)")
     parser.add_argument("--server", action="store_true", help="启动 Web API 服务器模式")
+    parser.add_argument("--worker", action="store_true", help="启动 worker，执行 API 进程放入任务队列的任务 (需配置 JOB_QUEUE_BACKEND)")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="批量模式 (目录 / 多个输入源 / 合集) 下同时处理的条目数 (默认: 2)；worker 模式下为同时执行的任务数 (默认: WORKER_CONCURRENCY)")
+    parser.add_argument("--playlist", action="store_true", help="把输入的 URL 作为合集 / 多P视频 / 收藏夹展开后批量处理")
+    parser.add_argument("--combine", action="store_true", help="批量处理结束后基于各集摘要生成跨集总结")
     
     args = parser.parse_args()
     
     if args.server:
         print("正在启动 Web 服务... 访问 http://localhost:8000/docs 查看文档")
+        import uvicorn
         uvicorn.run(app, host="0.0.0.0", port=8000)
+    elif args.worker:
+        run_worker(args.jobs or settings.WORKER_CONCURRENCY)
     elif args.source:
-        run_cli(args.source, args.preset)
+        presets = [name.strip() for name in args.preset.split(",") if name.strip()] or ["bilibili_summary"]
+        run_cli(args.source, presets, args.jobs or 2, args.playlist, args.combine)
     else:
         # 如果没有参数，打印帮助信息
         parser.print_help()
@@ -0,0 +1,95 @@
+"""ResultCache: 缓存键、TTL 过期与 LRU 淘汰"""
+import os
+import time
+
+from core.cache import ResultCache
+
+
+def make_cache(tmp_path, max_bytes=1024 * 1024, ttl_seconds=3600):
+    return ResultCache(str(tmp_path / "cache"), max_bytes, ttl_seconds)
+
+
+def test_transcript_key_depends_on_source_and_model():
+    key = ResultCache.transcript_key("bilibili:BV1xx411c7mD:p1", "paraformer-v2")
+    assert key == ResultCache.transcript_key("bilibili:BV1xx411c7mD:p1", "paraformer-v2")
+    assert key != ResultCache.transcript_key("bilibili:BV1xx411c7mD:p2", "paraformer-v2")
+    assert key != ResultCache.transcript_key("bilibili:BV1xx411c7mD:p1", "paraformer-v1")
+
+
+def test_summary_key_distinguishes_preset_prompt_and_model():
+    base = ResultCache.summary_key("你好", "bilibili_summary", None, "qwen-plus")
+    # 空白的自定义提示词等同于使用预设
+    assert base == ResultCache.summary_key("你好", "bilibili_summary", "  ", "qwen-plus")
+    assert base != ResultCache.summary_key("你好", "mindmap", None, "qwen-plus")
+    assert base != ResultCache.summary_key("你好", "bilibili_summary", None, "qwen-max")
+    assert base != ResultCache.summary_key("你好!", "bilibili_summary", None, "qwen-plus")
+    custom = ResultCache.summary_key("你好", "bilibili_summary", "总结一下", "qwen-plus")
+    # 自定义提示词的键与预设名无关
+    assert custom == ResultCache.summary_key("你好", "mindmap", "总结一下", "qwen-plus")
+    assert custom != base
+
+
+def test_put_get_and_stats(tmp_path):
+    cache = make_cache(tmp_path)
+    assert cache.get("transcript", "k1") is None
+    cache.put("transcript", "k1", {"text": "hello"}, elapsed=2.5)
+    assert cache.get("transcript", "k1") == {"text": "hello"}
+    stats = cache.stats()
+    assert stats["entries"] == 1
+    assert stats["levels"]["transcript"] == {"hits": 1, "misses": 1, "saved_seconds": 2.5, "hit_rate": 0.5}
+    # 重启后从磁盘恢复索引
+    assert make_cache(tmp_path).get("transcript", "k1") == {"text": "hello"}
+
+
+def test_peek_does_not_count_until_recorded(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put("summary", "k1", {"summary": "s"})
+    entry = cache.peek("summary", "k1")
+    assert entry["value"] == {"summary": "s"}
+    assert cache.stats()["levels"]["summary"]["hits"] == 0
+    cache.record("summary", entry)
+    assert cache.stats()["levels"]["summary"]["hits"] == 1
+
+
+def test_expired_entries_are_removed(tmp_path):
+    cache = make_cache(tmp_path, ttl_seconds=1)
+    cache.put("transcript", "k1", {"text": "old"})
+    path = cache._path("transcript", "k1")
+    level, size, last_access, created = cache._index["k1"]
+    cache._index["k1"] = (level, size, last_access, created - 5)
+    assert cache.get("transcript", "k1") is None
+    assert not os.path.exists(path)
+    assert cache.stats()["entries"] == 0
+
+
+def test_lru_eviction_keeps_recently_used(tmp_path):
+    value = {"text": "x" * 100}
+    cache = make_cache(tmp_path)
+    cache.put("transcript", "a", value)
+    entry_size = cache.stats()["bytes"]
+    cache.max_bytes = entry_size * 2
+    cache.put("transcript", "b", value)
+    time.sleep(0.01)
+    assert cache.get("transcript", "a") == value
+    cache.put("transcript", "c", value)
+    # b 最久未访问，被淘汰
+    assert cache.get("transcript", "b") is None
+    assert cache.get("transcript", "a") == value
+    assert cache.get("transcript", "c") == value
+    assert cache.stats()["bytes"] <= cache.max_bytes
+
+
+def test_oversized_entries_are_not_stored(tmp_path):
+    cache = make_cache(tmp_path, max_bytes=10)
+    cache.put("transcript", "k1", {"text": "x" * 100})
+    assert cache.get("transcript", "k1") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_broken_entry_is_dropped(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put("transcript", "k1", {"text": "hello"})
+    with open(cache._path("transcript", "k1"), "w", encoding="utf-8") as f:
+        f.write("{not json")
+    assert cache.get("transcript", "k1") is None
+    assert cache.stats()["entries"] == 0
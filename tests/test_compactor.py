@@ -0,0 +1,93 @@
+"""转录压缩: 口头禅 / 口吃式重复清理与 token 预算裁剪"""
+import pytest
+
+from core.compactor import clean_sentence, compact_transcript
+from core.transcript import Transcript
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("我们我们我们今天讲", "我们今天讲"),
+    ("就是说，就是说，就是说这个", "就是说这个"),
+    ("对，对，对，没错", "对，没错"),
+    ("so so so good", "so good"),
+])
+def test_stutter_is_collapsed(text, expected):
+    assert clean_sentence(text) == (expected, 0)
+
+
+@pytest.mark.parametrize("text", [
+    "谢谢谢谢",
+    "一一一",
+    "哈哈哈哈哈哈",
+    "看看看",
+    "研究研究",
+    "对对对",
+    "天天向上",
+    "一一一一一一",
+])
+def test_reduplication_is_kept(text):
+    assert clean_sentence(text) == (text, 0)
+
+
+def test_fillers_are_removed_only_at_phrase_boundaries():
+    assert clean_sentence("嗯，我们开始吧") == ("我们开始吧", 1)
+    assert clean_sentence("呃 um, 好的") == ("好的", 2)
+    # 词语内部的 "啊" 不是口头禅
+    assert clean_sentence("阿啊啊的问题") == ("阿啊啊的问题", 0)
+    assert clean_sentence("嗯。") == ("", 1)
+
+
+def test_paragraphs_and_repeated_sentences():
+    transcript = Transcript.build([
+        (0, 1000, "嗯，大家好。", 0),
+        (1000, 2000, "大家好！", 0),
+        (2000, 3000, "今天讲缓存。", 0),
+        (3000, 4000, "好的。", 1),
+        (70000, 71000, "下一部分。", 1),
+    ])
+    text, stats = compact_transcript(transcript, paragraph_seconds=60)
+    assert text.splitlines() == [
+        "[00:00:00] 大家好。今天讲缓存。",
+        "[00:00:03] 好的。",
+        "[00:01:10] 下一部分。",
+    ]
+    assert stats["fillers"] == 1
+    assert stats["repeats"] == 1
+    assert stats["paragraphs"] == 3
+    assert stats["trimmed_sentences"] == 0
+
+
+def make_long_transcript(sentences=60, step_ms=10000):
+    return Transcript.build([
+        (i * step_ms, i * step_ms + step_ms - 1000, f"第{i}句话讲的是一些比较长的内容，用来测试预算裁剪。", None)
+        for i in range(sentences)
+    ])
+
+
+def test_budget_trims_evenly_across_timeline():
+    transcript = make_long_transcript()
+    full, full_stats = compact_transcript(transcript, paragraph_seconds=60)
+    assert full_stats["paragraphs"] == 10
+    assert full_stats["tokens_after"] > 300
+
+    text, stats = compact_transcript(transcript, paragraph_seconds=60, budget_tokens=300)
+    assert stats["budget_tokens"] == 300
+    assert stats["tokens_after"] <= 300
+    assert stats["trimmed_sentences"] > 0
+    assert stats["trimmed_sentences"] + text.count("句话") == 60
+    # 保留的句子分布在整个时间轴上，而不是只保留开头
+    assert stats["paragraphs"] >= 8
+    assert "第54句" in text
+
+
+def test_budget_below_one_sentence_keeps_first_sentence():
+    text, stats = compact_transcript(make_long_transcript(), paragraph_seconds=60, budget_tokens=5)
+    assert text.startswith("[00:00:00] 第0句")
+    assert stats["paragraphs"] == 1
+    assert stats["trimmed_sentences"] == 59
+
+
+def test_no_budget_means_no_trimming():
+    _, stats = compact_transcript(make_long_transcript(), paragraph_seconds=60, budget_tokens=0)
+    assert stats["trimmed_sentences"] == 0
+    assert stats["budget_tokens"] is None
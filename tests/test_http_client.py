@@ -0,0 +1,126 @@
+"""PooledHTTP: 重试与幂等规则"""
+import asyncio
+
+import httpx
+import pytest
+
+from core.http_client import PooledHTTP, throttle_info
+from utils.config import settings
+
+URL = "http://dashscope.test/api"
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(settings, "HTTP_RETRY_BACKOFF", 0.0)
+
+
+class Server:
+    """按顺序返回预设的响应 / 异常，并记录收到的请求"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.calls.append(request.method)
+        outcome = self.outcomes.pop(0) if len(self.outcomes) > 1 else self.outcomes[0]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return httpx.Response(outcome)
+
+
+def make_http(server: Server) -> PooledHTTP:
+    http = PooledHTTP()
+    http.client = httpx.Client(transport=httpx.MockTransport(server))
+    return http
+
+
+def test_get_retries_server_errors_until_success():
+    server = Server(503, 502, 200)
+    resp = make_http(server).get(URL, retries=3)
+    assert resp.status_code == 200
+    assert len(server.calls) == 3
+
+
+def test_get_gives_up_after_retries():
+    server = Server(500)
+    http = make_http(server)
+    assert http.get(URL, retries=2).status_code == 500
+    assert len(server.calls) == 3
+    assert http.stats()["retries"] == 2
+
+
+def test_client_errors_are_not_retried():
+    server = Server(404)
+    assert make_http(server).get(URL, retries=3).status_code == 404
+    assert len(server.calls) == 1
+
+
+def test_post_server_error_is_not_retried_by_default():
+    server = Server(503, 200)
+    assert make_http(server).post(URL, retries=3, json={}).status_code == 503
+    assert server.calls == ["POST"]
+
+
+def test_post_can_opt_in_to_retries():
+    server = Server(503, 200)
+    assert make_http(server).post(URL, retries=3, idempotent=True, json={}).status_code == 200
+    assert server.calls == ["POST", "POST"]
+
+
+def test_post_read_timeout_is_not_retried():
+    # 请求可能已被服务端处理 (如已创建 ASR 任务)，不能重发
+    server = Server(httpx.ReadTimeout("timed out"), 200)
+    with pytest.raises(httpx.ReadTimeout):
+        make_http(server).post(URL, retries=3, json={})
+    assert len(server.calls) == 1
+
+
+def test_post_retries_errors_before_the_request_is_sent():
+    server = Server(httpx.ConnectError("refused"), httpx.ConnectTimeout("timed out"), 200)
+    assert make_http(server).post(URL, retries=3, json={}).status_code == 200
+    assert len(server.calls) == 3
+
+
+def test_get_retries_transport_errors():
+    server = Server(httpx.ReadError("reset"), 200)
+    http = make_http(server)
+    assert http.get(URL, retries=1).status_code == 200
+    assert http.stats()["errors"] == 1
+
+
+def test_transport_error_raised_when_retries_exhausted():
+    server = Server(httpx.ReadError("reset"))
+    with pytest.raises(httpx.ReadError):
+        make_http(server).get(URL, retries=2)
+    assert len(server.calls) == 3
+
+
+def test_async_request_follows_the_same_rules():
+    async def run(method, server, **kwargs):
+        http = PooledHTTP()
+        http._async_client = httpx.AsyncClient(transport=httpx.MockTransport(server))
+        try:
+            return await http.arequest(method, URL, retries=3, **kwargs)
+        finally:
+            await http._async_client.aclose()
+
+    server = Server(503, 200)
+    assert asyncio.run(run("GET", server)).status_code == 200
+    assert len(server.calls) == 2
+    server = Server(503, 200)
+    assert asyncio.run(run("POST", server)).status_code == 503
+    assert len(server.calls) == 1
+
+
+def test_throttle_info():
+    resp = httpx.Response(429, headers={"Retry-After": "3"})
+    assert throttle_info(resp) == (True, 3.0)
+    resp = httpx.Response(400, json={"code": "Throttling.RateQuota", "message": "slow down"})
+    assert throttle_info(resp) == (True, None)
+    resp = httpx.Response(503, json={"error": {"code": "Throttling"}})
+    assert throttle_info(resp)[0] is True
+    resp = httpx.Response(400, json={"code": "InvalidParameter"})
+    assert throttle_info(resp) == (False, None)
+    assert throttle_info(httpx.Response(503, text="busy")) == (False, None)
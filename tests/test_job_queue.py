@@ -0,0 +1,81 @@
+"""SQLiteJobQueue: 租约过期、重新投递与任务合并"""
+import pytest
+
+from core.job_queue import LOST_ERROR, SQLiteJobQueue
+from core.scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE
+
+# 负数租约表示租用后立即过期
+EXPIRED = -1
+LEASE = 60
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SQLiteJobQueue(str(tmp_path / "queue.db"), max_attempts=2)
+
+
+def test_lease_order_and_dedup(queue):
+    assert queue.enqueue("bulk", "k-bulk", {"source": "a"}, PRIORITY_BULK) == "bulk"
+    assert queue.enqueue("t1", "k-shared", {"source": "b"}, PRIORITY_BULK) == "t1"
+    # 相同 dedup_key 合并，交互式请求提升排队中的批量任务
+    assert queue.enqueue("t2", "k-shared", {"source": "b"}, PRIORITY_INTERACTIVE) == "t1"
+    assert queue.describe("t2")["queue_position"] == 0
+    assert queue.describe("bulk")["queue_position"] == 1
+
+    job = queue.lease("w1", LEASE)
+    assert job == {"job_id": "t1", "payload": {"source": "b"}, "priority": PRIORITY_INTERACTIVE, "attempts": 1}
+    assert queue.lease("w2", LEASE)["job_id"] == "bulk"
+    assert queue.lease("w3", LEASE) is None
+    assert queue.stats()["leased"] == 2
+
+    queue.publish("t1", "stage", "asr")
+    assert queue.finish("t1", "w1", "succeeded", {"summary": "ok"})
+    assert queue.pop_events() == [
+        ("t1", ["t1", "t2"], "stage", "asr"),
+        ("t1", ["t1", "t2"], "succeeded", {"summary": "ok"}),
+    ]
+    assert queue.describe("t2") is None
+
+
+def test_heartbeat_keeps_lease_alive(queue):
+    queue.enqueue("t1", "k1", {}, PRIORITY_INTERACTIVE)
+    queue.lease("w1", EXPIRED)
+    assert queue.heartbeat(["t1"], "w1", LEASE) == []
+    assert queue.requeue_expired() == 0
+    assert queue.describe("t1")["stage"] == "leased"
+    assert queue.describe("t1")["worker"] == "w1"
+
+
+def test_expired_lease_is_requeued_and_old_worker_loses_it(queue):
+    queue.enqueue("t1", "k1", {"source": "a"}, PRIORITY_INTERACTIVE)
+    queue.lease("w1", EXPIRED)
+    assert queue.requeue_expired() == 1
+    assert queue.pop_events() == [("t1", ["t1"], "status", "queued")]
+    assert queue.describe("t1")["stage"] == "queued"
+
+    job = queue.lease("w2", LEASE)
+    assert job["job_id"] == "t1"
+    assert job["attempts"] == 2
+    # 失联后恢复的 worker 既不能续租，也不能提交结果
+    assert queue.heartbeat(["t1"], "w1", LEASE) == ["t1"]
+    assert not queue.finish("t1", "w1", "succeeded", {"summary": "stale"})
+    assert queue.finish("t1", "w2", "succeeded", {"summary": "ok"})
+    assert queue.pop_events() == [("t1", ["t1"], "succeeded", {"summary": "ok"})]
+
+
+def test_job_fails_after_max_attempts(queue):
+    queue.enqueue("t1", "k1", {}, PRIORITY_INTERACTIVE)
+    queue.lease("w1", EXPIRED)
+    queue.requeue_expired()
+    queue.lease("w2", EXPIRED)
+    assert queue.requeue_expired() == 1
+    assert queue.pop_events()[-1] == ("t1", ["t1"], "failed", {"error": LOST_ERROR.format(attempts=2)})
+    assert queue.describe("t1") is None
+    assert queue.lease("w3", LEASE) is None
+
+
+def test_requeue_ignores_live_leases(queue):
+    queue.enqueue("t1", "k1", {}, PRIORITY_INTERACTIVE)
+    queue.lease("w1", LEASE)
+    assert queue.requeue_expired() == 0
+    assert queue.pop_events() == []
@@ -0,0 +1,151 @@
+"""JobScheduler: 阶段信号量的优先级顺序与在途任务合并"""
+import threading
+import time
+
+from core.scheduler import (
+    PRIORITY_BULK, PRIORITY_INTERACTIVE, JobCancelled, JobScheduler, PrioritySemaphore,
+)
+
+TIMEOUT = 5
+
+
+def wait_until(condition, timeout=TIMEOUT):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "condition not met in time"
+        time.sleep(0.005)
+
+
+def test_priority_semaphore_orders_by_priority_then_arrival():
+    sem = PrioritySemaphore(1)
+    sem.acquire(PRIORITY_INTERACTIVE, 0, "holder")
+    order = []
+
+    def waiter(priority, seq, job_id):
+        sem.acquire(priority, seq, job_id)
+        order.append(job_id)
+        sem.release()
+
+    threads = []
+    for priority, seq, job_id in [
+        (PRIORITY_BULK, 1, "bulk-1"),
+        (PRIORITY_BULK, 2, "bulk-2"),
+        (PRIORITY_INTERACTIVE, 3, "interactive-3"),
+        (PRIORITY_INTERACTIVE, 4, "interactive-4"),
+    ]:
+        t = threading.Thread(target=waiter, args=(priority, seq, job_id))
+        t.start()
+        threads.append(t)
+        wait_until(lambda: sem.snapshot()["waiting"] == len(threads))
+
+    assert sem.position("interactive-3") == 0
+    assert sem.position("bulk-2") == 3
+    assert sem.position("holder") is None
+    sem.release()
+    for t in threads:
+        t.join(TIMEOUT)
+    assert order == ["interactive-3", "interactive-4", "bulk-1", "bulk-2"]
+    assert sem.snapshot() == {"limit": 1, "active": 0, "waiting": 0}
+
+
+def test_priority_semaphore_admits_up_to_limit():
+    sem = PrioritySemaphore(2)
+    sem.acquire(PRIORITY_BULK, 0, "a")
+    sem.acquire(PRIORITY_BULK, 1, "b")
+    acquired = threading.Event()
+
+    def waiter():
+        sem.acquire(PRIORITY_BULK, 2, "c")
+        acquired.set()
+
+    threading.Thread(target=waiter, daemon=True).start()
+    wait_until(lambda: sem.snapshot()["waiting"] == 1)
+    assert not acquired.is_set()
+    sem.release()
+    assert acquired.wait(TIMEOUT)
+    assert sem.snapshot()["active"] == 2
+
+
+class Recorder:
+    def __init__(self):
+        self.results = {}
+        self.done = threading.Condition()
+
+    def __call__(self, task_id, status, result, error):
+        if status == "processing":
+            return
+        with self.done:
+            self.results[task_id] = (status, result, error)
+            self.done.notify_all()
+
+    def wait(self, count):
+        with self.done:
+            assert self.done.wait_for(lambda: len(self.results) >= count, TIMEOUT)
+        return self.results
+
+
+def blocking_scheduler(recorder):
+    """只有一个执行线程的调度器，先提交一个阻塞任务占住它，返回放行用的 Event"""
+    scheduler = JobScheduler({"summarize": 1}, max_active_jobs=1, listener=recorder)
+    gate = threading.Event()
+    scheduler.submit("blocker", "blocker", lambda hooks: gate.wait(TIMEOUT))
+    wait_until(lambda: scheduler.describe("blocker")["stage"] != "queued")
+    return scheduler, gate
+
+
+def test_same_dedup_key_collapses_into_one_run():
+    recorder = Recorder()
+    scheduler, gate = blocking_scheduler(recorder)
+    calls = []
+
+    def runner(hooks):
+        calls.append(1)
+        return {"summary": "ok"}
+
+    first = scheduler.submit("t1", "bili:BV1|preset:a", runner)
+    second = scheduler.submit("t2", "bili:BV1|preset:a", runner)
+    other = scheduler.submit("t3", "bili:BV1|preset:b", runner)
+    assert first == second == "t1"
+    assert other == "t3"
+    assert scheduler.snapshot()["inflight"] == 3
+    assert scheduler.describe("t2")["job_id"] == "t1"
+
+    gate.set()
+    results = recorder.wait(4)
+    assert len(calls) == 2
+    assert results["t1"] == results["t2"] == ("succeeded", {"summary": "ok"}, None)
+    assert results["t3"][0] == "succeeded"
+    # 完成后同一键的新任务重新执行
+    scheduler.submit("t4", "bili:BV1|preset:a", runner)
+    recorder.wait(5)
+    assert len(calls) == 3
+
+
+def test_interactive_request_promotes_queued_bulk_job():
+    recorder = Recorder()
+    scheduler, gate = blocking_scheduler(recorder)
+    order = []
+    scheduler.submit("bulk", "k-bulk", lambda hooks: order.append("bulk"), priority=PRIORITY_BULK)
+    scheduler.submit("shared", "k-shared", lambda hooks: order.append("shared"), priority=PRIORITY_BULK)
+    assert scheduler.describe("shared")["queue_position"] == 1
+    scheduler.submit("interactive", "k-shared", lambda hooks: None, priority=PRIORITY_INTERACTIVE)
+    assert scheduler.describe("shared")["queue_position"] == 0
+
+    gate.set()
+    recorder.wait(4)
+    assert order == ["shared", "bulk"]
+
+
+def test_cancelled_queued_job_does_not_run():
+    recorder = Recorder()
+    scheduler, gate = blocking_scheduler(recorder)
+    calls = []
+    scheduler.submit("t1", "k1", lambda hooks: calls.append(1))
+    assert scheduler.cancel("t1")
+    assert not scheduler.cancel("missing")
+
+    gate.set()
+    results = recorder.wait(2)
+    assert calls == []
+    assert results["t1"][0] == "failed"
+    assert isinstance(results["t1"][2], JobCancelled)
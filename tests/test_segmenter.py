@@ -0,0 +1,45 @@
+"""plan_segments: 长音频在静音处切分"""
+import pytest
+
+from core.segmenter import plan_segments
+
+
+def assert_covers(segments, duration, max_seconds):
+    assert segments[0][0] == 0.0
+    assert segments[-1][1] == duration
+    for (_, end), (start, _) in zip(segments, segments[1:]):
+        assert end == start
+    for start, end in segments:
+        assert 0 < end - start <= max_seconds
+
+
+def test_short_audio_is_a_single_segment():
+    assert plan_segments(500.0, [(100.0, 101.0)], target_seconds=600, max_seconds=900) == [(0.0, 500.0)]
+    assert plan_segments(900.0, [], target_seconds=600, max_seconds=900) == [(0.0, 900.0)]
+
+
+def test_cuts_at_silence_midpoint_closest_to_target():
+    silences = [(280.0, 282.0), (590.0, 592.0), (640.0, 650.0), (1195.0, 1197.0)]
+    segments = plan_segments(1500.0, silences, target_seconds=600, max_seconds=900)
+    assert segments == [(0.0, 591.0), (591.0, 1196.0), (1196.0, 1500.0)]
+
+
+def test_ignores_silences_outside_the_allowed_range():
+    # 200s 处的静音短于 target/2，950s 处的超过 max，都不可用，只能在 max 处硬切
+    segments = plan_segments(2000.0, [(199.0, 201.0), (949.0, 951.0)], target_seconds=600, max_seconds=900)
+    assert segments[0] == (0.0, 900.0)
+
+
+def test_hard_cuts_without_silences():
+    segments = plan_segments(2000.0, [], target_seconds=600, max_seconds=900)
+    assert segments == [(0.0, 900.0), (900.0, 1800.0), (1800.0, 2000.0)]
+
+
+@pytest.mark.parametrize("duration", [901.0, 3600.0, 7261.5])
+def test_segments_cover_audio_within_max(duration):
+    silences = [(t, t + 1.5) for t in range(13, int(duration), 97)]
+    segments = plan_segments(duration, silences, target_seconds=600, max_seconds=900)
+    assert len(segments) >= 2
+    assert_covers(segments, duration, 900)
+    cut_points = {(s + e) / 2 for s, e in silences}
+    assert all(end in cut_points for _, end in segments[:-1])
@@ -0,0 +1,74 @@
+"""Transcript: 按时间窗口查询与多声道合并"""
+from core.transcript import Transcript
+
+
+def texts(transcript):
+    return [text for _, _, text, _ in transcript]
+
+
+def brute_force(segments, start_ms, end_ms):
+    return [
+        text for begin, end, text, _ in segments
+        if (start_ms is None or end > start_ms) and (end_ms is None or begin < end_ms)
+    ]
+
+
+SORTED = [(0, 1000, "a", None), (1000, 2500, "b", None), (2500, 4000, "c", None), (4000, 5000, "d", None)]
+# 旧缓存中的多声道结果: 两个声道依次拼接，起止时间不单调
+UNSORTED = [
+    (0, 2000, "left-1", 0), (3000, 6000, "left-2", 0),
+    (500, 1500, "right-1", 1), (2000, 9000, "right-2", 1), (7000, 8000, "right-3", 1),
+]
+# 开始时间单调但句子互相重叠 (结束时间不单调)
+OVERLAPPING = [(0, 5000, "long", None), (1000, 2000, "short", None), (3000, 4000, "later", None)]
+
+
+def test_window_on_sorted_segments():
+    transcript = Transcript.build(SORTED)
+    assert transcript.ordered
+    assert texts(transcript.window(1000, 2500)) == ["b"]
+    assert texts(transcript.window(900, 2600)) == ["a", "b", "c"]
+    assert texts(transcript.window(start_ms=4500)) == ["d"]
+    assert texts(transcript.window(end_ms=1)) == ["a"]
+    assert texts(transcript.window(6000, 7000)) == []
+    assert transcript.window() is transcript
+
+
+def test_window_on_unsorted_segments_matches_linear_scan():
+    for segments in (UNSORTED, OVERLAPPING):
+        transcript = Transcript.build(segments)
+        assert not transcript.ordered
+        for start_ms in (None, 0, 999, 1500, 2500, 4500, 7500, 9000):
+            for end_ms in (None, 1, 1000, 2500, 3500, 7000, 10000):
+                assert texts(transcript.window(start_ms, end_ms)) == brute_force(segments, start_ms, end_ms)
+
+
+def test_window_keeps_overlapping_long_sentence():
+    transcript = Transcript.build(OVERLAPPING)
+    assert texts(transcript.window(3500, 3600)) == ["long", "later"]
+
+
+def test_window_returns_everything_without_timestamps():
+    transcript = Transcript.build([(None, None, "whole text", None)])
+    assert transcript.window(1000, 2000) is transcript
+
+
+def test_window_survives_compact_round_trip():
+    transcript = Transcript.from_compact(Transcript.build(UNSORTED).to_compact())
+    assert texts(transcript.window(2500, 3500)) == ["left-2", "right-2"]
+
+
+def test_from_dashscope_merges_channels_by_start_time():
+    data = {"transcripts": [
+        {"channel_id": 0, "sentences": [
+            {"begin_time": 0, "end_time": 2000, "text": "left-1"},
+            {"begin_time": 3000, "end_time": 6000, "text": "left-2"},
+        ]},
+        {"channel_id": 1, "sentences": [
+            {"begin_time": 500, "end_time": 1500, "text": "right-1", "speaker_id": 1},
+        ]},
+    ]}
+    transcript = Transcript.from_dashscope(data, offset_ms=10000)
+    assert texts(transcript) == ["left-1", "right-1", "left-2"]
+    assert transcript.segment(1) == (10500, 11500, "right-1", 1)
+    assert texts(transcript.window(11600, 12000)) == ["left-1"]
@@ -0,0 +1,37 @@
+"""Workspace: 启动对账只接管旧版下载文件"""
+import os
+
+from core.workspace import Workspace
+
+
+def make_files(download_dir):
+    os.makedirs(os.path.join(download_dir, "my_notes"))
+    for name in ("Some Title.mp3", "Some Title_temp_audio.mp3", "readme.txt", os.path.join("my_notes", "a.txt")):
+        with open(os.path.join(download_dir, name), "wb") as f:
+            f.write(b"x" * 100)
+
+
+def test_untracked_files_are_left_alone_by_default(tmp_path):
+    download_dir = str(tmp_path / "downloads")
+    os.makedirs(download_dir)
+    make_files(download_dir)
+    workspace = Workspace(download_dir, str(tmp_path / "output"), max_bytes=1)
+    assert workspace.stats()["entries"]["download"] == 0
+    assert {"Some Title.mp3", "Some Title_temp_audio.mp3", "readme.txt", "my_notes"} <= set(os.listdir(download_dir))
+
+
+def test_adopt_legacy_only_takes_title_named_mp3(tmp_path):
+    download_dir = str(tmp_path / "downloads")
+    os.makedirs(download_dir)
+    make_files(download_dir)
+    workspace = Workspace(download_dir, str(tmp_path / "output"), max_bytes=150, adopt_legacy=True)
+    names = set(os.listdir(download_dir))
+    # 两个旧版 .mp3 超出配额，较旧的一个被淘汰；用户的其它文件不受影响
+    assert len({"Some Title.mp3", "Some Title_temp_audio.mp3"} & names) == 1
+    assert {"readme.txt", "my_notes"} <= names
+    assert workspace.stats()["entries"]["download"] == 1
+
+    # 关闭后重新启动: 之前接管的条目只从索引中移除，文件保留
+    workspace = Workspace(download_dir, str(tmp_path / "output"), max_bytes=150)
+    assert workspace.stats()["entries"]["download"] == 0
+    assert names == set(os.listdir(download_dir))
@@ -1,27 +1,148 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, Optional
 
 class Settings(BaseSettings):
     # App
     APP_NAME: str = "BiliAssistant_Service"
     
     # DashScope
-    DASHSCOPE_API_KEY: str
+    # 未配置时服务仍可启动，首次调用 DashScope / OSS 时再报错
+    DASHSCOPE_API_KEY: str = ""
     DASHSCOPE_MODEL: str = "qwen3-asr-flash-filetrans"
     DASHSCOPE_SUMMARY_MODEL: str = "qwen-long"
+    DASHSCOPE_BASE_URL: str = "https://dashscope.aliyuncs.com"
+
+    # 长文本分块摘要 (按本地估算的 token 数)
+    LLM_CHUNK_THRESHOLD_TOKENS: int = 24000
+    LLM_CHUNK_TOKENS: int = 8000
+    LLM_CHUNK_CONCURRENCY: int = 4
+
+    # 摘要前的转录压缩: 按时间合并为段落、去除口头禅与重复，再按摘要模型裁剪到 token 预算 (0 表示不限)
+    LLM_COMPACT_ENABLED: bool = True
+    LLM_COMPACT_PARAGRAPH_SECONDS: int = 60
+    LLM_TOKEN_BUDGETS: Dict[str, int] = {
+        "qwen-long": 300000,
+        "qwen-plus": 120000,
+        "qwen-turbo": 120000,
+        "qwen-max": 30000,
+    }
+    LLM_DEFAULT_TOKEN_BUDGET: int = 120000
+
+    # 共享 HTTP 连接池
+    HTTP_CONNECT_TIMEOUT: float = 10.0
+    HTTP_READ_TIMEOUT: float = 120.0
+    HTTP_MAX_CONNECTIONS: int = 32
+    HTTP_MAX_KEEPALIVE: int = 16
+    HTTP_KEEPALIVE_EXPIRY: float = 60.0
+    HTTP_MAX_RETRIES: int = 3
+    HTTP_RETRY_BACKOFF: float = 0.5
+    HTTP_HTTP2: bool = False
+
+    # DashScope 客户端流控: 各接口 (asr_submit / asr_poll / chat) 的令牌桶速率 (次/秒，0 表示不限) 与并发上限，
+    # 被限流 (429 / Throttling.*) 时并发上限减半并按 Retry-After 暂停，成功后逐步恢复
+    DASHSCOPE_GOVERNOR_ENABLED: bool = True
+    DASHSCOPE_RATE_LIMITS: Dict[str, float] = {"asr_submit": 5.0, "asr_poll": 20.0, "chat": 5.0}
+    DASHSCOPE_BURST_SECONDS: float = 2.0
+    DASHSCOPE_MAX_CONCURRENCY: Dict[str, int] = {"asr_submit": 8, "asr_poll": 32, "chat": 8}
+    DASHSCOPE_MIN_CONCURRENCY: int = 1
+    DASHSCOPE_THROTTLE_RETRIES: int = 8
+    DASHSCOPE_THROTTLE_BACKOFF: float = 1.0
     
+    # ASR 轮询 (秒)
+    ASR_POLL_MIN_INTERVAL: float = 2.0
+    ASR_POLL_MAX_INTERVAL: float = 30.0
+    ASR_POLL_DURATION_FACTOR: float = 0.05
+    ASR_POLL_TIMEOUT_SECONDS: int = 3 * 3600
+    # 连续查询失败 (非限流) 达到该次数后判定任务失败
+    ASR_POLL_MAX_ERRORS: int = 20
+
+    # ASR 音频编码档位 (opus / aac / mp3)，流式转码直接上传
+    ASR_STREAM_TRANSCODE: bool = True
+    ASR_AUDIO_PROFILE: str = "opus"
+    ASR_AUDIO_SAMPLE_RATE: int = 16000
+    ASR_AUDIO_BITRATE: str = "24k"
+    ASR_STREAM_CHUNK_SIZE: int = 256 * 1024
+
+    # 长音频静音切分 + 并行转写 (秒)
+    ASR_SEGMENT_ENABLED: bool = False
+    ASR_SEGMENT_MIN_SECONDS: int = 1800
+    ASR_SEGMENT_TARGET_SECONDS: int = 600
+    ASR_SEGMENT_MAX_SECONDS: int = 900
+    ASR_SEGMENT_CONCURRENCY: int = 4
+    ASR_SILENCE_NOISE_DB: float = -35.0
+    ASR_SILENCE_MIN_SECONDS: float = 0.4
+
     # OSS
-    OSS_ACCESS_KEY_ID: str
-    OSS_ACCESS_KEY_SECRET: str
-    OSS_ENDPOINT: str
-    OSS_BUCKET_NAME: str
+    OSS_ACCESS_KEY_ID: str = ""
+    OSS_ACCESS_KEY_SECRET: str = ""
+    OSS_ENDPOINT: str = ""
+    OSS_BUCKET_NAME: str = ""
+    OSS_MULTIPART_THRESHOLD: int = 20 * 1024 * 1024
+    OSS_PART_SIZE: int = 5 * 1024 * 1024
+    OSS_UPLOAD_THREADS: int = 4
+    OSS_UPLOAD_RETRIES: int = 3
     
+    # 下载: 选择码率不低于下限 (kbps) 的最小纯音频流，保留原始容器直接上传，不转码
+    DOWNLOAD_NATIVE_AUDIO: bool = True
+    DOWNLOAD_AUDIO_MIN_KBPS: float = 48
+
     # Paths
     DOWNLOAD_DIR: str = "downloads"
     OUTPUT_DIR: str = "output"
 
+    # 工作区: 下载与中间音频的磁盘配额 (超出时按 LRU 淘汰，0 表示不限)、是否复用已下载的文件、输出目录配额
+    WORKSPACE_MAX_BYTES: int = 10 * 1024 * 1024 * 1024
+    WORKSPACE_REUSE_DOWNLOADS: bool = True
+    WORKSPACE_OUTPUT_MAX_BYTES: int = 0
+    # 启动时把下载目录根部旧版按标题保存的 .mp3 纳入配额与 LRU 淘汰 (默认不动未登记的文件)
+    WORKSPACE_ADOPT_LEGACY_DOWNLOADS: bool = False
+
+    # Result Cache
+    CACHE_ENABLED: bool = True
+    CACHE_DIR: str = "data/cache"
+    CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+    CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+
+    # Task Store (sqlite / memory)
+    TASK_STORE_BACKEND: str = "sqlite"
+    TASK_DB_PATH: str = "data/tasks.db"
+    TASK_TTL_SECONDS: int = 7 * 24 * 3600
+    TASK_MAX_FINISHED: int = 5000
+
+    # Job Scheduler (各阶段并发上限)
+    SCHED_MAX_ACTIVE_JOBS: int = 16
+    SCHED_LIMIT_DOWNLOAD: int = 2
+    SCHED_LIMIT_TRANSCODE: int = 2
+    SCHED_LIMIT_UPLOAD: int = 2
+    SCHED_LIMIT_TRANSCODE_UPLOAD: int = 2  # 流式转码上传 (同时占用 CPU 与上行带宽)
+    # ASR 阶段覆盖提交到拿到结果的全过程: 等待结果的任务仍占着执行线程与 ASR 名额 (轮询本身由共享的 ASRPoller 完成)，
+    # 因此该值同时是同时在 DashScope 转写中的任务数上限
+    SCHED_LIMIT_ASR: int = 8
+    SCHED_LIMIT_SUMMARIZE: int = 4
+
+    # 任务队列: local 为在 API 进程内执行 (默认)；sqlite / redis 时 API 进程只负责入队与查询，
+    # 由 `python main.py --worker` 启动的 worker 进程租用任务执行 (租约按心跳续期，worker 崩溃后任务重新投递)
+    JOB_QUEUE_BACKEND: str = "local"
+    JOB_QUEUE_DB_PATH: str = "data/queue.db"
+    JOB_QUEUE_REDIS_URL: str = "redis://localhost:6379/0"
+    JOB_QUEUE_REDIS_PREFIX: str = "bili"
+    JOB_QUEUE_POLL_INTERVAL: float = 0.5
+    JOB_LEASE_SECONDS: float = 60.0
+    JOB_MAX_ATTEMPTS: int = 3
+    WORKER_CONCURRENCY: int = 4
+
+    # 批量任务 (/batch): 每批同时执行的子任务数与条目上限
+    BATCH_CONCURRENCY: int = 2
+    BATCH_MAX_ITEMS: int = 200
+
     class Config:
         env_file = ".env"
         env_file_encoding = 'utf-8'
 
 settings = Settings()
+
+def require_settings(*names: str):
+    """检查必填配置项，缺失时抛出异常并列出缺失项"""
+    missing = [name for name in names if not getattr(settings, name)]
+    if missing:
+        raise ValueError(f"Missing required settings: {', '.join(missing)} (set them in .env or the environment)")
@@ -1,6 +1,76 @@
+import os
+import re
 import time
+import hashlib
+import threading
+import functools
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+
+CJK_PATTERN = re.compile(r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+BV_PATTERN = re.compile(r"(?:^|[/?=&])(BV[0-9A-Za-z]{10})", re.IGNORECASE)
+
+# (path, size, mtime) -> sha256, 避免重复计算大文件哈希 (LRU，最多 FILE_HASH_MEMO_SIZE 项)
+FILE_HASH_MEMO_SIZE = 1024
+_file_hash_memo = OrderedDict()
+_file_hash_lock = threading.Lock()
 
 def format_milliseconds(ms):
     """Format milliseconds to HH:MM:SS"""
     seconds = ms / 1000.0
     return time.strftime('%H:%M:%S', time.gmtime(seconds))
+
+@functools.lru_cache(maxsize=None)
+def get_ffmpeg_exe() -> str:
+    """解析 ffmpeg 可执行文件路径 (进程内只解析一次)，不可用时抛出异常"""
+    import imageio_ffmpeg
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+def estimate_tokens(text: str) -> int:
+    """
+    本地粗略估算 token 数: 中日韩字符约 1 字 1 token，其余字符约 4 字符 1 token。
+    """
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """流式计算文件内容的 sha256"""
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _file_hash_lock:
+        if memo_key in _file_hash_memo:
+            _file_hash_memo.move_to_end(memo_key)
+            return _file_hash_memo[memo_key]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _file_hash_lock:
+        _file_hash_memo[memo_key] = digest
+        while len(_file_hash_memo) > FILE_HASH_MEMO_SIZE:
+            _file_hash_memo.popitem(last=False)
+    return digest
+
+def normalize_source(source: str) -> str:
+    """
+    将输入源规范化为稳定的标识:
+    - B站视频 -> bili:BVxxxxxxxxxx (多P时附带 :p<N>)
+    - 本地文件 -> file:<内容sha256>
+    - 其它 URL -> url:<去掉 fragment 的 URL>
+    """
+    source = source.strip()
+    if os.path.isfile(source):
+        return f"file:{file_sha256(source)}"
+
+    match = BV_PATTERN.search(source)
+    if match:
+        bv = "BV" + match.group(1)[2:]
+        page = "1"
+        if source.startswith("http"):
+            page = parse_qs(urlparse(source).query).get("p", ["1"])[0]
+        return f"bili:{bv}" if page in ("", "1") else f"bili:{bv}:p{page}"
+
+    if source.startswith("http"):
+        return "url:" + source.split("#", 1)[0]
+    return "raw:" + source
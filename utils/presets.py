@@ -0,0 +1,36 @@
+import os
+import json
+import threading
+from utils.logger import get_logger
+
+logger = get_logger("Presets")
+
+PRESETS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "prompts", "presets.json")
+
+_lock = threading.Lock()
+# (mtime_ns, size) -> 解析结果；文件未变化时直接复用
+_cache = {"stamp": None, "presets": {}}
+
+def load_presets() -> dict:
+    """
+    读取 prompts/presets.json，进程内缓存，文件修改时间或大小变化时重新加载。
+    返回的字典为共享对象，调用方不要修改。
+    """
+    try:
+        st = os.stat(PRESETS_FILE)
+    except OSError as e:
+        logger.error(f"Error loading presets: {e}")
+        return {}
+    stamp = (st.st_mtime_ns, st.st_size)
+    if _cache["stamp"] == stamp:
+        return _cache["presets"]
+    with _lock:
+        if _cache["stamp"] != stamp:
+            try:
+                with open(PRESETS_FILE, "r", encoding="utf-8") as f:
+                    _cache["presets"] = json.load(f)
+                _cache["stamp"] = stamp
+            except Exception as e:
+                # 解析失败 (如正在编辑) 时保留上一次成功加载的结果
+                logger.error(f"Error loading presets: {e}")
+        return _cache["presets"]